@@ -6,8 +6,9 @@ from trademl.modeling.metrics_summary import (
     display_mental_model_metrics, clf_metrics, plot_roc_curve, lstm_metrics,
     clf_metrics_tensorboard)
 from trademl.modeling.features import (
-    add_ind, add_ind_df, add_technical_indicators, add_fourier_transform,
-    add_ohlcv_features, AddFeatures)
+    add_ind, add_ind_df, plan_technical_indicators, random_sarext_params, add_technical_indicators,
+    add_fourier_transform, add_rolling_fourier_transform, add_rolling_moments,
+    add_ohlcv_features, causal_savgol_filter, LagMatrix, AddFeatures)
 from trademl.modeling.outliers import (
     remove_ourlier_diff_median, RemoveOutlierDiffMedian)
 from trademl.modeling.stationarity import (
@@ -15,7 +16,8 @@ from trademl.modeling.stationarity import (
 from trademl.modeling.backtest import (
     cumulative_returns, hold_cash_backtest, enter_positions)
 from trademl.modeling.pipelines import (
-    TripleBarierLabeling, OutlierStdRemove, trend_scanning_labels)
+    TripleBarierLabeling, OutlierStdRemove, RobustOutlierRemove, trend_scanning_labels,
+    daily_vol_cusum)
 from trademl.modeling.feature_importance import (
     feature_importance_values, feature_importnace_vec, plot_feature_importance,
     important_features, fi_shap, fi_xgboost, fi_lightgbm)
@@ -27,9 +29,32 @@ from trademl.modeling.structural_breaks import (
     get_chow_type_stat, my_get_sadf, ChowStructuralBreakSubsample
 )
 from trademl.modeling.preprocessing import (
-    remove_correlated_columns, sequence_from_array, scale_expanding
+    remove_correlated_columns, correlated_columns, sequence_positions, sequence_from_array,
+    scale_expanding, ExpandingScaler, RollingScaler, column_statistics, ColumnScreen
 )
 from trademl.modeling.data_import import (
     import_ohlcv
 )
-from trademl.modeling.labeling import trend_labeling
+from trademl.modeling.labeling import (
+    trend_labeling, fixed_horizon_labels, OnlineTripleBarrierLabeling)
+from trademl.modeling.sample_weights import (
+    get_num_conc_events, get_av_uniqueness_from_triple_barrier,
+    get_weights_by_return, get_weights_by_time_decay)
+from trademl.modeling.sequential_bootstrap import (
+    SequentialBootstrap, seq_bootstrap, SequentialBootstrapBaggingClassifier)
+from trademl.modeling.streaming_indicators import (
+    StreamingIndicator, StreamingIndicatorSet, SlidingDFT, SavgolFilter)
+from trademl.modeling.feature_store import FeatureStore, feature_warmup
+from trademl.modeling.feature_graph import (
+    FeatureNode, FeatureRegistry, default_registry, requested_columns,
+    strip_column_prefixes)
+from trademl.modeling.memory import DtypePolicy, memory_stage, frame_memory
+from trademl.modeling.universe import UniverseRunner
+from trademl.modeling.microstructure import (
+    add_microstructural_features, roll_measure, corwin_schultz_estimator,
+    bekker_parkinson_vol, bar_based_kyle_lambda, bar_based_amihud_lambda,
+    bar_based_hasbrouck_lambda, tick_rule)
+from trademl.modeling.datasets import WindowedDataset
+from trademl.modeling.dim_reduction import OrthogonalFeatures
+from trademl.modeling.prepare_dag import (
+    Stage, PrepareDAG, build_prepare_dag, default_cache_dir, default_cache_bytes, PREPARE_PARAMS)
@@ -0,0 +1,166 @@
+'''
+DATASETS
+
+Windowed datasets for sequence models. Only the 2-D feature matrix and
+event positions are stored, (batch, L, F) windows are taken on demand
+from memory mapped matrix.
+'''
+
+import numpy as np
+from trademl.modeling.preprocessing import sequence_positions
+
+
+class WindowedDataset:
+    """
+    Windows of time_step_length rows ending at event rows of 2-D feature matrix.
+
+    :param features: (np.array) (rows, F) feature matrix, e.g. np.load(path, mmap_mode='r')
+    :param ends: (np.array) row position of last row of every window
+    :param targets: (np.array) (N, k) targets of windows
+    :param time_step_length: (int) number of rows in window
+    :param batch_size: (int) number of windows in batch
+    :param shuffle: (bool) shuffle windows every epoch
+    :param random_state: (int) seed of shuffling
+    :param index: (np.array) timestamps of feature matrix rows, e.g. data.index.values
+    """
+
+    def __init__(self, features, ends, targets, time_step_length, batch_size=128,
+                 shuffle=False, random_state=None, index=None):
+        self.features = features
+        self.ends = np.asarray(ends, dtype=np.int64)
+        self.targets = np.asarray(targets)
+        self.time_step_length = time_step_length
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.random_state = np.random.RandomState(random_state)
+        self.index = index
+        self.order = np.arange(self.ends.shape[0])
+        if self.shuffle:
+            self.random_state.shuffle(self.order)
+
+    @classmethod
+    def from_frame(cls, data, target_vec, cusum_events, time_step_length, **kwargs):
+        """
+        Dataset with the same windows and targets as sequence_from_array.
+
+        :param data: (pd.DataFrame) features
+        :param target_vec: (pd.DataFrame or pd.Series) targets
+        :param cusum_events: (pd.DatetimeIndex) events
+        :param time_step_length: (int) number of rows in window
+        :return: (WindowedDataset) dataset with features in memory
+        """
+        ends, target_positions = sequence_positions(data, target_vec, cusum_events, time_step_length)
+        targets = np.asarray(target_vec.values).reshape(target_vec.shape[0], -1)
+        targets = targets[target_positions].astype(np.int64)
+        return cls(data.to_numpy(), ends, targets, time_step_length, index=data.index.values, **kwargs)
+
+    def save(self, path):
+        """
+        Save feature matrix to path_features.npy and events to path_events.npz.
+
+        :param path: (str) path without extension
+        """
+        np.save(path + '_features.npy', self.features)
+        index = {'index': np.asarray(self.index)} if self.index is not None else {}
+        np.savez(path + '_events.npz', ends=self.ends, targets=self.targets,
+                 time_step_length=self.time_step_length, **index)
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        """
+        Load dataset saved with save, feature matrix is memory mapped.
+
+        :param path: (str) path without extension
+        :return: (WindowedDataset) dataset
+        """
+        features = np.load(path + '_features.npy', mmap_mode='r')
+        events = np.load(path + '_events.npz')
+        index = events['index'] if 'index' in events.files else None
+        return cls(features, events['ends'], events['targets'],
+                   int(events['time_step_length']), index=index, **kwargs)
+
+    @property
+    def n_features(self):
+        return self.features.shape[1]
+
+    @property
+    def event_index(self):
+        """Timestamps of last rows of windows, None if index is unknown."""
+        return self.index[self.ends] if self.index is not None else None
+
+    @property
+    def shape(self):
+        """Shape of all windows, (N, L, F)."""
+        return (self.ends.shape[0], self.time_step_length, self.n_features)
+
+    def __len__(self):
+        """Number of batches."""
+        return int(np.ceil(self.ends.shape[0] / self.batch_size))
+
+    def windows(self, index):
+        """
+        :param index: (np.array) window numbers
+        :return: (np.array) (len(index), L, F) windows, only their rows are read
+        """
+        starts = self.ends[index] - self.time_step_length + 1
+        rows = starts[:, None] + np.arange(self.time_step_length)
+        return np.asarray(self.features[rows.ravel()]).reshape(
+            (len(index), self.time_step_length, self.n_features))
+
+    def batch(self, i):
+        """
+        :param i: (int) batch number
+        :return: (np.array, np.array) windows and targets of batch
+        """
+        index = self.order[i * self.batch_size:(i + 1) * self.batch_size]
+        return self.windows(index), self.targets[index]
+
+    def on_epoch_end(self):
+        if self.shuffle:
+            self.random_state.shuffle(self.order)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.batch(i)
+
+    def generator(self):
+        """
+        Infinite generator of batches, shuffled every epoch if shuffle is True.
+        Use with steps_per_epoch=len(dataset).
+        """
+        while True:
+            for batch in self:
+                yield batch
+            self.on_epoch_end()
+
+    def to_arrays(self):
+        """
+        :return: (np.array, np.array) all windows and targets in memory,
+            as sequence_from_array
+        """
+        return self.windows(np.arange(self.ends.shape[0])), self.targets
+
+    def keras_sequence(self, **kwargs):
+        """
+        :param kwargs: Keras 3 PyDataset arguments, e.g. workers
+        :return: (keras.utils.Sequence) Keras sequence of batches
+        """
+        from tensorflow import keras
+
+        dataset = self
+
+        class WindowedSequence(keras.utils.Sequence):
+
+            def __init__(self, **kwargs):
+                super().__init__(**kwargs)  # required by Keras 3 PyDataset
+
+            def __len__(self):
+                return len(dataset)
+
+            def __getitem__(self, i):
+                return dataset.batch(i)
+
+            def on_epoch_end(self):
+                dataset.on_epoch_end()
+
+        return WindowedSequence(**kwargs)
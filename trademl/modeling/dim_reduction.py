@@ -0,0 +1,115 @@
+'''
+DIMENSIONALITY REDUCTION
+
+Orthogonal (PCA) features fitted once on training data. Test and live data
+are projected on the stored basis, instead of calling
+mlfinlab get_orthogonal_features on every set separately.
+'''
+
+import numpy as np
+import pandas as pd
+from sklearn.base import BaseEstimator, TransformerMixin
+from sklearn.decomposition import IncrementalPCA
+from sklearn.utils.extmath import randomized_svd
+
+
+class OrthogonalFeatures(BaseEstimator, TransformerMixin):
+    """
+    PCA of standardized features, components explaining variance_threshold
+    of total variance are kept, as in get_orthogonal_features.
+
+    method='randomized': randomized SVD of standardized matrix, covariance
+    matrix is never formed.
+    method='incremental': IncrementalPCA fitted on batches of rows, for data
+    longer than memory; partial_fit continues with new data.
+
+    :param variance_threshold: (float) share of explained variance to keep
+    :param n_components: (int) maximal number of components, all for
+        randomized and batch_size for incremental method if None
+    :param method: (str) 'randomized' or 'incremental'
+    :param batch_size: (int) number of rows in one batch
+    :param dtype: (np.dtype) dtype of standardized batches
+    :param random_state: (int) seed of randomized SVD
+    """
+
+    def __init__(self, variance_threshold=0.95, n_components=None, method='randomized',
+                 batch_size=100000, dtype=np.float32, random_state=0):
+        self.variance_threshold = variance_threshold
+        self.n_components = n_components
+        self.method = method
+        self.batch_size = batch_size
+        self.dtype = dtype
+        self.random_state = random_state
+
+    def _standardize(self, X):
+        return ((X[self.columns_].to_numpy(dtype=np.float64) - self.mean_) / self.std_).astype(self.dtype)
+
+    def _batches(self, X):
+        for start in range(0, X.shape[0], self.batch_size):
+            yield self._standardize(X.iloc[start:start + self.batch_size])
+
+    def _keep(self, explained_variance_ratio):
+        cumulative = np.cumsum(explained_variance_ratio)
+        return min(int(np.searchsorted(cumulative, self.variance_threshold)) + 1,
+                   explained_variance_ratio.shape[0])
+
+    def fit(self, X, y=None):
+        if self.method not in ['randomized', 'incremental']:
+            raise ValueError("method must be 'randomized' or 'incremental'")
+        self.columns_ = X.columns
+        self.mean_ = np.array(X.mean(), dtype=np.float64)
+        self.std_ = np.array(X.std(), dtype=np.float64)
+        varying = self.std_ > 0
+        self.std_[~varying] = 1.  # constant columns are all zeros after centering
+        p = X.shape[1]
+
+        if self.method == 'randomized':
+            n_components = min(self.n_components or p, X.shape[0], p)
+            z = np.concatenate(list(self._batches(X)))
+            _, s, vt = randomized_svd(z, n_components, random_state=self.random_state)
+            # standardized columns have unit variance, total variance is
+            # number of non constant columns
+            total_variance = max(float(varying.sum()), 1.)
+            self.explained_variance_ = s ** 2 / (X.shape[0] - 1)
+            self.explained_variance_ratio_ = self.explained_variance_ / total_variance
+            self.basis_ = vt
+            self.center_ = np.zeros(p)
+        else:
+            n_components = min(self.n_components or self.batch_size, p)
+            self.ipca_ = IncrementalPCA(n_components=n_components)
+            for batch in self._batches(X):
+                if batch.shape[0] >= n_components:
+                    self.ipca_.partial_fit(batch)
+            self._update_incremental()
+
+        self.n_components_ = self._keep(self.explained_variance_ratio_)
+        return self
+
+    def _update_incremental(self):
+        self.explained_variance_ = self.ipca_.explained_variance_
+        self.explained_variance_ratio_ = self.ipca_.explained_variance_ratio_
+        self.basis_ = self.ipca_.components_
+        self.center_ = self.ipca_.mean_
+
+    def partial_fit(self, X, y=None):
+        """
+        Update incremental PCA with new data, standardized with fitted mean
+        and std. Number of kept components is recalculated.
+        """
+        if not hasattr(self, 'basis_'):
+            return self.fit(X)
+        if self.method != 'incremental':
+            raise ValueError("partial_fit needs method='incremental'")
+        for batch in self._batches(X):
+            if batch.shape[0] >= self.ipca_.n_components_:
+                self.ipca_.partial_fit(batch)
+        self._update_incremental()
+        self.n_components_ = self._keep(self.explained_variance_ratio_)
+        return self
+
+    def transform(self, X, y=None):
+        basis = self.basis_[:self.n_components_].T.astype(self.dtype)
+        center = self.center_.astype(self.dtype)
+        projected = [(batch - center) @ basis for batch in self._batches(X)]
+        projected = np.concatenate(projected) if projected else np.empty((0, basis.shape[1]))
+        return pd.DataFrame(projected, index=X.index).add_prefix('PCA_')
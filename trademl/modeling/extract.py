@@ -12,15 +12,18 @@ from trademl.modeling.data_import import import_ohlcv
 from trademl.modeling.outliers import RemoveOutlierDiffMedian
 from trademl.modeling.features import AddFeatures
 from trademl.modeling.stationarity import Fracdiff
+from trademl.modeling.feature_store import FeatureStore
+from trademl.modeling.universe import UniverseRunner
 util.startLoop()  # uncomment this line when in a notebook
 
 
 # Parameters
 save_path = 'D:/market_data/usa/ohlcv_features'
-contract = 'SPY_IB'
+contract_suffix = '_IB'  # files are saved as <ticker><suffix>_clean.h5
 keep_unstationary = True
 frequency = '1 hour'  # pandas freq
 tickers = ['SPY', 'AAPL', 'AMZN', 'T', 'UAL']
+n_jobs = None  # number of processes, number of CPUs if None
 
 # Test if frequency is in IB frequency
 ib_freq = ['1 secs', '5 secs', '10 secs' '15 secs',
@@ -32,89 +35,94 @@ if frequency not in ib_freq:
     print('Choose frequency compatible with IB.')
     raise
     
-# IB connection
-ib = IB()
-ib.connect('127.0.0.1', 7496, clientId=2)
-
-# Get data from IB
-if re.search(r'hour|day|week|month', frequency):
-    dfs = []
-    for tick in tickers:
-        con = Stock(tick, 'SMART', 'USD')
-        print(con)
-        bars = ib.reqHistoricalData(
-            contract=con,
-            endDateTime=datetime.datetime.now(),
-            durationStr='20 Y',
-            barSizeSetting=frequency,
-            whatToShow='TRADES',
-            useRTH=True,
-            formatDate=1,
-            timeout=60*10
+# process pool needs guard, spawned workers import this module
+if __name__ == '__main__':
+    # IB connection
+    ib = IB()
+    ib.connect('127.0.0.1', 7496, clientId=2)
+
+    # Get data from IB
+    if re.search(r'hour|day|week|month', frequency):
+        dfs = []
+        for tick in tickers:
+            con = Stock(tick, 'SMART', 'USD')
+            print(con)
+            bars = ib.reqHistoricalData(
+                contract=con,
+                endDateTime=datetime.datetime.now(),
+                durationStr='20 Y',
+                barSizeSetting=frequency,
+                whatToShow='TRADES',
+                useRTH=True,
+                formatDate=1,
+                timeout=60*10
+            )
+            df = util.df(bars)
+            multiindex = [[tick], df.date.tolist()]
+            multiindex = pd.MultiIndex.from_product(
+                multiindex, names=['ticker', 'time'])
+            df.index = multiindex
+            df = df.drop(columns=['date'])
+            dfs.append(df)
+
+        # merge
+        market_data = pd.concat(dfs, axis=0)
+
+        # disconnect interactive brokers
+        ib.disconnect()
+
+
+    ############## Old import function
+    # data = import_ohlcv(save_path, contract=contract)
+
+    # Upsample
+    # if frequency:
+    #     data = data.resample(frequency).agg({'open': 'first',
+    #                                          'high': 'max',
+    #                                          'low': 'min',
+    #                                          'close': 'last',
+    #                                          'volume': 'sum',
+    #                                          'average': 'last',
+    #                                          'barCount': 'sum'})
+    # data = data.dropna()
+    ############## Old import function
+
+    # Preprocessing, every ticker in its own process
+    pipe = make_pipeline(
+        RemoveOutlierDiffMedian(median_outlier_thrteshold=25),
+        # AddFeatures(add_ta = False),
+        Fracdiff(keep_unstationary=keep_unstationary)
         )
-        df = util.df(bars)
-        multiindex = [[tick], df.date.tolist()]
-        multiindex = pd.MultiIndex.from_product(
-            multiindex, names=['ticker', 'time'])
-        df.index = multiindex
-        df = df.drop(columns=['date'])
-        dfs.append(df)
-
-    # merge
-    market_data = pd.concat(dfs, axis=0)
-
-    # disconnect interactive brokers
-    ib.disconnect()
-
-
-############## Old import function
-# data = import_ohlcv(save_path, contract=contract)
-
-# Upsample
-# if frequency:
-#     data = data.resample(frequency).agg({'open': 'first',
-#                                          'high': 'max',
-#                                          'low': 'min',
-#                                          'close': 'last',
-#                                          'volume': 'sum',
-#                                          'average': 'last',
-#                                          'barCount': 'sum'})
-# data = data.dropna()
-############## Old import function
-
-# Preprocessing
-pipe = make_pipeline(
-    RemoveOutlierDiffMedian(median_outlier_thrteshold=25),
-    # AddFeatures(add_ta = False),
-    Fracdiff(keep_unstationary=keep_unstationary)
-    )
-X = pipe.fit_transform(market_data.loc[['SPY']].droplevel(0))
-
-
-min_ffd_all_cols(market_data.loc[['T']].droplevel(0))
-
-for date, new_df in market_data.groupby(level=0):
-    print(new_df)
-
-test = (market_data.groupby(level=0)
-        .apply(lambda x: pipe.fit_transform(x.droplevel(level=0))))
-market_data.groupby(level=0).mean()
-
-# add radf from R
-# if frequency == 'H':
-#     radf = pd.read_csv(
-#         'D:/algo_trading_files/exuber/radf_h_adf_4.csv',
-#         sep=';', index_col=['Index'], parse_dates=['Index'])
-#     radf = radf.resample('H').last()
-#     X = pd.concat([X, radf[['radf']]], axis = 1).dropna()
-
-# Save localy
-save_path_local = os.path.join(
-    Path(save_path),
-    contract + '_clean' + '.h5')
-if os.path.exists(save_path_local):
-    os.remove(save_path_local)
-X.to_hdf(save_path_local, contract + '_clean')
+    results, report = UniverseRunner(pipe, n_jobs=n_jobs).run(market_data)
+    print(report[['status', 'rows', 'seconds']])
+
+    # add radf from R
+    # if frequency == 'H':
+    #     radf = pd.read_csv(
+    #         'D:/algo_trading_files/exuber/radf_h_adf_4.csv',
+    #         sep=';', index_col=['Index'], parse_dates=['Index'])
+    #     radf = radf.resample('H').last()
+    #     X = pd.concat([X, radf[['radf']]], axis = 1).dropna()
+
+    # Save localy, prepare step reads <contract>_clean.h5 of every ticker
+    for tick, X in results.items():
+        contract = tick + contract_suffix
+        save_path_local = os.path.join(
+            Path(save_path),
+            contract + '_clean' + '.h5')
+        if os.path.exists(save_path_local):
+            os.remove(save_path_local)
+        X.to_hdf(save_path_local, contract + '_clean')
+
+    # Feature store of all tickers, only new bars are transformed for tickers
+    # already in the store. Fracdiff is not in store transform, its d is chosen
+    # on full history and can't be recomputed on stored tail.
+    store = FeatureStore(os.path.join(Path(save_path), 'feature_store'),
+                         transform=make_pipeline(
+                             RemoveOutlierDiffMedian(median_outlier_thrteshold=25),
+                             AddFeatures(add_ta=True)))
+    results, report = UniverseRunner(store=store, n_jobs=n_jobs).run(market_data)
+    print(report[['status', 'rows', 'seconds']])
 
 
 
@@ -0,0 +1,257 @@
+'''
+FEATURE GRAPH
+
+Declarative registry of features. Every feature node names its input
+columns, parameters and output columns, so only requested features and
+their dependencies are calculated.
+'''
+
+import numpy as np
+import pandas as pd
+import talib
+from trademl.modeling.features import (
+    plan_technical_indicators, causal_savgol_filter, LagMatrix, _rolling_moments)
+from trademl.modeling.microstructure import (
+    roll_measure, corwin_schultz_estimator, bekker_parkinson_vol, bar_based_kyle_lambda,
+    bar_based_amihud_lambda, bar_based_hasbrouck_lambda, tick_rule)
+
+
+# raw bar columns, available without calculation
+RAW_COLUMNS = ['open', 'high', 'low', 'close', 'volume']
+# prefixes added to feature names after stationarity step
+COLUMN_PREFIXES = ['fracdiff_', 'orig_']
+
+
+class FeatureNode:
+    """
+    Feature calculated by function from input columns.
+
+    :param function: (callable) called with input arrays and params,
+        returns array or tuple of arrays, one for every output
+    :param inputs: (list) input column names, raw columns or other features
+    :param outputs: (list) output column names
+    :param params: (dict) keyword arguments of function
+    """
+
+    def __init__(self, function, inputs, outputs, params=None):
+        self.function = function
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.params = params if params is not None else {}
+
+    def __repr__(self):
+        return 'FeatureNode({} -> {})'.format(self.inputs, self.outputs)
+
+    def compute(self, columns):
+        """
+        :param columns: (dict) arrays by column name, must contain inputs
+        :return: (dict) output arrays by column name
+        """
+        outputs = self.function(*[columns[col] for col in self.inputs], **self.params)
+        if len(self.outputs) == 1:
+            outputs = [outputs]
+        return dict(zip(self.outputs, outputs))
+
+
+def _ta_function(name):
+    function = getattr(talib, name)
+    def ta_function(*inputs, **params):
+        return function(*[np.ascontiguousarray(x, dtype=np.float64) for x in inputs], **params)
+    return ta_function
+
+
+def _high_low(high, low):
+    return high - low
+
+
+def _close_open(close, open):
+    return close - open
+
+
+def _close_ath(close):
+    return np.maximum.accumulate(close)
+
+
+def _columns(function):
+    def columns_function(*inputs, **params):
+        return tuple(function(*inputs, **params).T)
+    return columns_function
+
+
+def _dollar_volume(function):
+    def dollar_volume_function(close, volume, **params):
+        return function(close, close * volume, **params)
+    return dollar_volume_function
+
+
+def _moments(close, windows):
+    returns = np.log(np.asarray(close, dtype=np.float64))
+    returns[1:] = np.diff(returns)
+    returns[0] = np.nan
+    std, skew, kurt = _rolling_moments(returns, np.asarray(windows, dtype=np.int64))
+    return tuple(std.T) + tuple(skew.T) + tuple(kurt.T)
+
+
+def _smooth_lags(smooth_close, lags):
+    # views over one buffer, compute copies only requested lags
+    lag_matrix = LagMatrix(pd.Series(smooth_close), lags)
+    return tuple(lag_matrix.lag(t) for t in lag_matrix.lags)
+
+
+class FeatureRegistry:
+    """
+    Registry of feature nodes by output column name.
+    """
+
+    def __init__(self):
+        self.nodes = {}
+
+    def register(self, node):
+        """
+        :param node: (FeatureNode) feature node
+        :return: (FeatureNode) registered node
+        """
+        for col in node.outputs:
+            self.nodes[col] = node
+        return node
+
+    def resolve(self, requested):
+        """
+        Feature nodes needed for requested columns, in dependency order.
+
+        :param requested: (list) requested column names, fracdiff_ and orig_ prefixes are removed
+        :return: (list, list) feature nodes in calculation order and unknown columns
+        """
+        plan = []
+        unknown = []
+        visited = set()
+
+        def visit(col, path):
+            if col in RAW_COLUMNS:
+                return True
+            if col not in self.nodes:
+                return False
+            node = self.nodes[col]
+            if id(node) in visited:
+                return True
+            if id(node) in path:
+                raise ValueError('Cyclic feature dependency in ' + repr(node))
+            path.add(id(node))
+            for input_col in node.inputs:
+                if not visit(input_col, path):
+                    raise ValueError('Unknown input {} of {}'.format(input_col, repr(node)))
+            path.discard(id(node))
+            visited.add(id(node))
+            plan.append(node)
+            return True
+
+        for col in strip_column_prefixes(requested):
+            if not visit(col, set()):
+                unknown.append(col)
+        return plan, unknown
+
+    def compute(self, data, requested):
+        """
+        Calculate requested features and their dependencies.
+
+        :param data: (pd.DataFrame) OHLCV data
+        :param requested: (list) requested column names
+        :return: (pd.DataFrame) data with requested features added
+        """
+        plan, unknown = self.resolve(requested)
+        unknown = [col for col in unknown if col not in data.columns]
+        if unknown:
+            raise KeyError('Features not in registry: ' + ', '.join(unknown))
+
+        # nodes are in dependency order
+        columns = {col: data[col].values for col in RAW_COLUMNS if col in data.columns}
+        for node in plan:
+            columns.update(node.compute(columns))
+
+        # keep requested features only, in requested order
+        keep = [col for col in dict.fromkeys(strip_column_prefixes(requested))
+                if col in columns and col not in data.columns]
+        features = pd.DataFrame({col: columns[col] for col in keep}, index=data.index)
+        return pd.concat([data, features], axis=1)
+
+
+def strip_column_prefixes(columns):
+    """
+    Remove fracdiff_ and orig_ prefixes from column names.
+
+    :param columns: (list) column names
+    :return: (list) column names without prefixes
+    """
+    stripped = []
+    for col in columns:
+        for prefix in COLUMN_PREFIXES:
+            if col.startswith(prefix):
+                col = col[len(prefix):]
+        stripped.append(col)
+    return stripped
+
+
+def default_registry(ta_periods=[10, 100], moment_windows=[5, 10, 15, 30, 60],
+                     micro_windows=[20, 100], smooth_window=31, smooth_lags=None,
+                     sarext_params=None):
+    """
+    Registry with all features from AddFeatures.
+
+    :param ta_periods: (list) periods used in add_technical_indicators
+    :param moment_windows: (list) windows of volatility, skew and kurtosis
+    :param micro_windows: (list) windows of microstructural features
+    :param smooth_window: (int) window of smooth_close
+    :param smooth_lags: (list) lags of smooth_close, no lag features if None
+    :param sarext_params: (dict) SAREXT_rand parameters, random if None
+    :return: (FeatureRegistry) registry
+    """
+    registry = FeatureRegistry()
+    for name, input_columns, params, outputs in plan_technical_indicators(ta_periods, sarext_params):
+        registry.register(FeatureNode(_ta_function(name), input_columns, outputs, params))
+    registry.register(FeatureNode(_high_low, ['high', 'low'], ['high_low']))
+    registry.register(FeatureNode(_close_open, ['close', 'open'], ['close_open']))
+    registry.register(FeatureNode(_close_ath, ['close'], ['close_ath']))
+    registry.register(FeatureNode(
+        _moments, ['close'],
+        [f'{name}_{w}' for name in ['volatility', 'skew', 'kurtosis'] for w in moment_windows],
+        {'windows': moment_windows}))
+    micro_estimators = [
+        ('roll_measure', roll_measure, ['close']),
+        ('corwin_schultz_est', corwin_schultz_estimator, ['high', 'low']),
+        ('bekker_parkinson_vol', bekker_parkinson_vol, ['high', 'low']),
+        ('kyle_lambda', bar_based_kyle_lambda, ['close', 'volume']),
+        ('amihud_lambda', _dollar_volume(bar_based_amihud_lambda), ['close', 'volume']),
+        ('hasbrouck_lambda', _dollar_volume(bar_based_hasbrouck_lambda), ['close', 'volume'])]
+    for name, function, input_columns in micro_estimators:
+        registry.register(FeatureNode(_columns(function), input_columns,
+                                      [f'{name}_{w}' for w in micro_windows], {'windows': micro_windows}))
+    registry.register(FeatureNode(tick_rule, ['close'], ['tick_rule']))
+    registry.register(FeatureNode(causal_savgol_filter, ['close'], ['smooth_close'],
+                                  {'window': smooth_window, 'polyorder': 3}))
+    if smooth_lags is not None:
+        lags = list(dict.fromkeys(smooth_lags))
+        registry.register(FeatureNode(_smooth_lags, ['smooth_close'],
+                                      [f'smooth_close_lag_{t}' for t in lags], {'lags': lags}))
+    return registry
+
+
+def requested_columns(source, top=None):
+    """
+    Requested column names from list, saved col_names.csv or feature
+    importance table with col_name column.
+
+    :param source: (list, pd.Series, pd.DataFrame or str) columns or path to csv
+    :param top: (int) keep only first top columns, e.g. most important features
+    :return: (list) column names
+    """
+    if isinstance(source, str):
+        source = pd.read_csv(source)
+    if isinstance(source, pd.DataFrame):
+        if 'col_name' in source.columns:
+            source = source['col_name']
+        else:
+            source = source.iloc[:, -1]  # col_names.csv is saved with index
+    columns = [str(col) for col in source]
+    if top is not None:
+        columns = columns[:top]
+    return columns
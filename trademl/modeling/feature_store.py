@@ -0,0 +1,288 @@
+'''
+FEATURE STORE
+
+Feature frames partitioned by ticker and date in parquet files:
+
+    root/ticker=SPY/date=2020-01-02/part-0.parquet
+    root/ticker=SPY/_metadata.json
+
+Metadata records input columns, feature columns and number of warm-up bars
+every feature needs, so new bars are transformed together with the stored
+tail only. Random SAREXT_rand parameters are pinned when ticker is first
+written and reused on every append.
+'''
+
+import os
+import json
+import glob
+import numpy as np
+import pandas as pd
+from talib import abstract
+from trademl.modeling.features import plan_technical_indicators, random_sarext_params
+
+
+# TA-Lib functions with infinite memory (recursive smoothing), their values
+# converge to full history values only after several lookbacks
+RECURSIVE_INDICATORS = [
+    'EMA', 'DEMA', 'TEMA', 'T3', 'TRIX', 'KAMA', 'MACD', 'ADX', 'ADXR', 'DX',
+    'PLUS_DM', 'MINUS_DM', 'RSI', 'CMO', 'STOCHRSI', 'ATR', 'NATR', 'ADOSC',
+    'MAMA', 'HT_TRENDLINE', 'HT_DCPERIOD', 'HT_DCPHASE', 'HT_TRENDMODE',
+    'HT_PHASOR', 'HT_SINE']
+# path dependent TA-Lib functions, state resets on trend reversal
+PATH_DEPENDENT_INDICATORS = ['SAR', 'SAREXT']
+# cumulative features, reconciled with stored value at the overlap bar
+CUMULATIVE_FEATURES = {'OBV': 'sum', 'AD': 'sum', 'close_ath': 'max'}
+
+
+def feature_warmup(columns, ta_periods=None, recursive_factor=10, path_dependent_warmup=1000):
+    """
+    Number of previous bars every feature needs to be recomputed on a tail
+    of data with the same value as on full history.
+
+    :param columns: (list) feature column names
+    :param ta_periods: (list) periods used in add_technical_indicators
+    :param recursive_factor: (int) recursive indicators need this many lookbacks
+    :param path_dependent_warmup: (int) warm-up of path dependent indicators (SAR)
+    :return: (dict) warm-up bars by column name, 0 for unknown columns
+    """
+    lookback = {}
+    for name, _, params, outputs in plan_technical_indicators(ta_periods or []):
+        function = abstract.Function(name)
+        function.parameters = params
+        bars = function.lookback
+        if name in RECURSIVE_INDICATORS:
+            bars = (bars + 1) * recursive_factor
+        elif name in PATH_DEPENDENT_INDICATORS:
+            bars = max(bars, path_dependent_warmup)
+        for col in outputs:
+            lookback[col] = bars
+    return {col: int(lookback.get(col, 0)) for col in columns}
+
+
+class FeatureStore:
+    """
+    Date and ticker partitioned feature store with incremental append.
+
+    :param root: (str) root directory of the store
+    :param transform: (callable or sklearn transformer) calculates features
+        from raw bars, e.g. AddFeatures or pipeline; transformer is fitted on
+        every transformed window
+    :param warmup: (dict) warm-up bars by column, calculated with
+        feature_warmup from transform ta_periods if None
+    :param cumulative: (dict) cumulative features and their aggregation ('sum' or 'max')
+    :param sarext_params: (dict) SAREXT_rand parameters of new tickers; taken
+        from transform or drawn once if None, so all tickers written by the
+        store (and its worker copies) share them
+    """
+
+    def __init__(self, root, transform=None, warmup=None, cumulative=CUMULATIVE_FEATURES,
+                 sarext_params=None):
+        self.root = root
+        self.transform = transform
+        self.warmup = warmup
+        self.cumulative = cumulative
+        self.sarext_params = sarext_params
+        steps = self._sarext_steps()
+        if self.sarext_params is None and steps:
+            self.sarext_params = steps[0].sarext_params or random_sarext_params()
+
+    def _ticker_path(self, ticker):
+        return os.path.join(self.root, 'ticker=' + str(ticker))
+
+    def _metadata_path(self, ticker):
+        return os.path.join(self._ticker_path(ticker), '_metadata.json')
+
+    def _partition_path(self, ticker, date):
+        return os.path.join(self._ticker_path(ticker), 'date=' + date, 'part-0.parquet')
+
+    @staticmethod
+    def _path_date(path):
+        return os.path.basename(os.path.dirname(path))[len('date='):]
+
+    def _sarext_steps(self):
+        steps = getattr(self.transform, 'steps', [(None, self.transform)])
+        return [step for _, step in steps
+                if getattr(step, 'add_ta', False) and hasattr(step, 'sarext_params')]
+
+    def _transform(self, bars, sarext_params=None):
+        for step in self._sarext_steps():
+            step.sarext_params = sarext_params or self.sarext_params
+        if hasattr(self.transform, 'fit_transform'):
+            return self.transform.fit_transform(bars.copy())
+        return self.transform(bars.copy())
+
+    def _ta_periods(self):
+        steps = getattr(self.transform, 'steps', [(None, self.transform)])
+        periods = [p for _, step in steps if getattr(step, 'add_ta', False) for p in step.ta_periods]
+        return periods or None
+
+    def tickers(self):
+        """
+        :return: (list) tickers in the store
+        """
+        paths = glob.glob(os.path.join(self.root, 'ticker=*'))
+        return sorted(os.path.basename(path)[len('ticker='):] for path in paths)
+
+    def read_metadata(self, ticker):
+        """
+        :param ticker: (str) ticker
+        :return: (dict) metadata or None if ticker is not in the store
+        """
+        path = self._metadata_path(ticker)
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def _write_metadata(self, ticker, metadata):
+        path = self._metadata_path(ticker)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(metadata, f, indent=2)
+        os.replace(path + '.tmp', path)
+
+    def _write_partitions(self, ticker, features):
+        dates = features.index.strftime('%Y-%m-%d')
+        for date, partition in features.groupby(dates, sort=False):
+            path = self._partition_path(ticker, date)
+            if os.path.exists(path):
+                stored = pd.read_parquet(path)
+                partition = pd.concat([stored.loc[stored.index < partition.index[0]], partition])
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            partition.to_parquet(path + '.tmp')
+            os.replace(path + '.tmp', path)
+
+    def write(self, ticker, features, input_columns=None, warmup=None, sarext_params=None):
+        """
+        Write full feature frame of ticker, previous partitions are replaced.
+
+        :param ticker: (str) ticker
+        :param features: (pd.DataFrame) features with DatetimeIndex
+        :param input_columns: (list) raw bar columns transform needs,
+            open, high, low, close and volume by default
+        :param warmup: (dict) warm-up bars by column
+        :param sarext_params: (dict) SAREXT_rand parameters features were
+            computed with, store parameters if None
+        """
+        if sarext_params is None:
+            sarext_params = self.sarext_params
+        if input_columns is None:
+            input_columns = [col for col in ['open', 'high', 'low', 'close', 'volume']
+                             if col in features.columns]
+        if warmup is None:
+            warmup = self.warmup
+        if warmup is None:
+            warmup = feature_warmup(features.columns, self._ta_periods())
+        for path in glob.glob(os.path.join(self._ticker_path(ticker), 'date=*', '*.parquet')):
+            os.remove(path)
+        features = features.sort_index()
+        self._write_partitions(ticker, features)
+        self._write_metadata(ticker, {
+            'columns': list(features.columns),
+            'input_columns': list(input_columns),
+            'warmup': {col: int(warmup.get(col, 0)) for col in features.columns},
+            'sarext_params': sarext_params,
+            'first_index': features.index[0].isoformat(),
+            'last_index': features.index[-1].isoformat()
+        })
+
+    def read(self, ticker, start=None, end=None, columns=None):
+        """
+        Read features of ticker, only partitions between start and end dates are opened.
+
+        :param ticker: (str) ticker
+        :param start: (str or pd.Timestamp) first timestamp
+        :param end: (str or pd.Timestamp) last timestamp
+        :param columns: (list) columns to read, all if None
+        :return: (pd.DataFrame) features
+        """
+        paths = sorted(glob.glob(os.path.join(self._ticker_path(ticker), 'date=*', '*.parquet')))
+        if start is not None:
+            start = pd.Timestamp(start)
+            paths = [path for path in paths if self._path_date(path) >= start.strftime('%Y-%m-%d')]
+        if end is not None:
+            end = pd.Timestamp(end)
+            paths = [path for path in paths if self._path_date(path) <= end.strftime('%Y-%m-%d')]
+        if not paths:
+            return pd.DataFrame(columns=columns)
+        features = pd.concat([pd.read_parquet(path, columns=columns) for path in paths])
+        if start is not None:
+            features = features.loc[features.index >= start]
+        if end is not None:
+            features = features.loc[features.index <= end]
+        return features
+
+    def tail(self, ticker, n, columns=None):
+        """
+        Read last n rows of ticker, opening partitions from the end.
+
+        :param ticker: (str) ticker
+        :param n: (int) number of rows
+        :param columns: (list) columns to read, all if None
+        :return: (pd.DataFrame) features
+        """
+        paths = sorted(glob.glob(os.path.join(self._ticker_path(ticker), 'date=*', '*.parquet')))
+        partitions = []
+        rows = 0
+        for path in reversed(paths):
+            partition = pd.read_parquet(path, columns=columns)
+            partitions.append(partition)
+            rows += partition.shape[0]
+            if rows >= n:
+                break
+        return pd.concat(partitions[::-1]).iloc[-n:]
+
+    def append(self, ticker, bars):
+        """
+        Compute features of new bars and append them to the store. Features
+        are computed over the stored tail plus warm-up only; cumulative
+        features are reconciled with stored values at the overlap bar. If
+        ticker is not in the store, features are computed on all bars.
+
+        :param ticker: (str) ticker
+        :param bars: (pd.DataFrame) raw bars, may overlap with stored bars
+        :return: (pd.DataFrame) appended features
+        """
+        metadata = self.read_metadata(ticker)
+        if metadata is None:
+            features = self._transform(bars)
+            # stored tail is the only history on append, so only raw columns
+            # kept in features can be fed back to transform
+            input_columns = [col for col in bars.columns if col in features.columns]
+            self.write(ticker, features, input_columns=input_columns)
+            return features
+
+        last_index = pd.Timestamp(metadata['last_index'])
+        bars = bars.loc[bars.index > last_index]
+        if bars.shape[0] == 0:
+            return pd.DataFrame(columns=metadata['columns'])
+
+        # transform new bars together with stored tail
+        columns = metadata['columns']
+        warmup = max(metadata['warmup'].values()) if metadata['warmup'] else 0
+        stored_tail = self.tail(ticker, warmup + 1)
+        history = stored_tail[metadata['input_columns']]
+        window = pd.concat([history, bars[metadata['input_columns']]])
+        features = self._transform(window, metadata.get('sarext_params'))
+        missing = [col for col in columns if col not in features.columns]
+        if missing:
+            raise ValueError('Transform did not return stored columns: ' + ', '.join(missing))
+        features = features[columns]
+
+        # reconcile cumulative features at overlap bar
+        cumulative = {col: how for col, how in self.cumulative.items() if col in columns}
+        if cumulative and last_index not in features.index:
+            raise ValueError('Overlap bar was removed by transform, increase warm-up.')
+        for col, how in cumulative.items():
+            stored = stored_tail[col].iloc[-1]
+            if how == 'sum':
+                features[col] += stored - features.at[last_index, col]
+            elif how == 'max':
+                features[col] = np.maximum(features[col], stored)
+        features = features.loc[features.index > last_index]
+        if features.shape[0] == 0:
+            return features
+
+        self._write_partitions(ticker, features)
+        metadata['last_index'] = features.index[-1].isoformat()
+        self._write_metadata(ticker, metadata)
+        return features
@@ -1,7 +1,17 @@
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
 import pandas as pd
 import numpy as np
+import joblib
 import mlfinlab.microstructural_features as micro
 import trademl as tml
+from concurrent.futures import ThreadPoolExecutor
+import talib
+from talib import abstract
 from talib.abstract import (
     DEMA, EMA, MIDPRICE, SMA, T3, TEMA, TRIMA, WMA,
     ADX, ADXR, AROONOSC, BOP, CMO, DX, MFI, MINUS_DM, MOM, ROC, RSI,
@@ -12,11 +22,14 @@ from talib.abstract import (
     HT_PHASOR, HT_SINE, STOCHF, STOCH,
     BETA, CORREL, LINEARREG, LINEARREG_ANGLE, LINEARREG_INTERCEPT, LINEARREG_SLOPE, TSF
 )
+from numba import njit
 from sklearn.base import BaseEstimator, TransformerMixin
 from trademl.modeling.utils import time_method
+from trademl.modeling.microstructure import add_microstructural_features, compensated_cumsum
 from gplearn.genetic import SymbolicTransformer
-from gplearn.functions import make_function
-from scipy.signal import savgol_filter
+from gplearn.functions import make_function, _Function
+from gplearn._program import _Program
+from scipy.signal import savgol_filter, savgol_coeffs
 
 
 def add_ind(ohlcv, f, n, periods):
@@ -63,103 +76,156 @@ def add_ind_df(ohlcv, f, n, periods):
     return ind
 
 
+# technical indicators calculated for every period, with one or more outputs
+TA_PERIOD_INDICATORS = [
+    'DEMA', 'EMA', 'MIDPRICE', 'SMA', 'T3',  # MIDPOINT
+    'TEMA', 'TRIMA', 'WMA',  # KAMA memory intensive!
+    'ADX', 'ADXR', 'AROONOSC', 'BOP', 'CMO', 'DX', 'MFI', 'MINUS_DM', 'MOM', 'ROC', 'RSI',
+    'TRIX', 'WILLR',  # CCI DOEANST WORK?
+    'ATR', 'NATR',
+    'BETA', 'CORREL', 'LINEARREG', 'LINEARREG_ANGLE', 'LINEARREG_INTERCEPT',
+    'LINEARREG_SLOPE', 'TSF']
+TA_PERIOD_MULTI_INDICATORS = ['BBANDS', 'AROON', 'STOCHRSI']
+# technical indicators with no function arguments
+TA_NO_ARG_INDICATORS = [
+    'HT_TRENDLINE', 'AD', 'OBV', 'HT_DCPERIOD', 'HT_DCPHASE', 'HT_TRENDMODE',
+    'TRANGE', 'AVGPRICE', 'MEDPRICE', 'TYPPRICE', 'WCLPRICE', 'ULTOSC']
+# SAREXT arguments of SAREXT_rand feature, drawn randomly by default
+SAREXT_RAND_PARAMS = [
+    'startvalue', 'offsetonreverse', 'accelerationinitlong', 'accelerationlong',
+    'accelerationmaxlong', 'accelerationinitshort', 'accelerationshort',
+    'accelerationmaxshort']
+
+
+def _ta_input_columns(name):
+    """Names of OHLCV columns used by TA-Lib function, in argument order."""
+    columns = []
+    for value in abstract.Function(name).input_names.values():
+        columns.extend([value] if isinstance(value, str) else value)
+    return columns
+
+
+def random_sarext_params():
+    """
+    Draw random SAREXT parameters of SAREXT_rand feature.
+
+    Returns:
+        dict -- SAREXT keyword arguments.
+    """
+    values = np.random.uniform(low=0.01, high=0.4, size=len(SAREXT_RAND_PARAMS))
+    return dict(zip(SAREXT_RAND_PARAMS, values.tolist()))
+
+
+def plan_technical_indicators(periods, sarext_params=None):
+    """
+    Plan every output of add_technical_indicators before calculation.
+
+    Arguments:
+        periods {list} -- List that contain periods as arguments.
+        sarext_params {dict} -- SAREXT_rand parameters, drawn with
+            random_sarext_params if None.
+
+    Returns:
+        list -- (function name, input columns, parameters, output column names)
+            for every TA-Lib call.
+    """
+    plan = []
+
+    # indicators with period argument and one output
+    for name in TA_PERIOD_INDICATORS:
+        parameters = list(abstract.Function(name).parameters)
+        for p in periods:
+            params = {parameters[0]: p} if parameters else {}
+            plan.append((name, _ta_input_columns(name), params, [name + str(p)]))
+
+    # indicators with period argument and multiple outputs
+    for name in TA_PERIOD_MULTI_INDICATORS:
+        function = abstract.Function(name)
+        for p in periods:
+            plan.append((name, _ta_input_columns(name), {list(function.parameters)[0]: p},
+                         [name + '_' + str(p) + '_' + out for out in function.output_names]))
+
+    # indicators with no function arguments
+    for name in TA_NO_ARG_INDICATORS:
+        plan.append((name, _ta_input_columns(name), {}, [name]))
+
+    # other indicators
+    if sarext_params is None:
+        sarext_params = random_sarext_params()
+    other = [
+        ('MAMA', {}, ['MAMA', 'FAMA']),  # MAVP ne radi
+        ('MAMA', {'fastlimit': 0.25, 'slowlimit': 0.02}, ['MAMA_25', 'FAMA_25']),
+        ('MAMA', {'fastlimit': 0.5, 'slowlimit': 0.05}, ['MAMA_5', 'FAMA_5']),
+        ('SAR', {}, ['SAR']),
+        ('SAR', {'acceleration': 0.01, 'maximum': 0.01}, ['SAR_1']),
+        ('SAR', {'acceleration': 0.02, 'maximum': 0.02}, ['SAR_2']),
+        ('SAREXT', {}, ['SAREXT']),
+        ('SAREXT', dict(sarext_params), ['SAREXT_rand']),
+        ('APO', {}, ['APO']),
+        ('APO', {'fastperiod': 24, 'slowperiod': 52, 'matype': 0}, ['APO_1']),
+        ('APO', {'fastperiod': 50, 'slowperiod': 100, 'matype': 0}, ['APO_2']),
+        ('APO', {'fastperiod': 100, 'slowperiod': 200, 'matype': 0}, ['APO_3']),
+        ('APO', {'fastperiod': 200, 'slowperiod': 400, 'matype': 0}, ['APO_4']),
+        ('APO', {'fastperiod': 12000, 'slowperiod': 24000, 'matype': 0}, ['APO_5']),
+        ('ADOSC', {}, ['ADOSC']),
+        ('MACD', {}, ['MACD', 'MACDSIGNAL', 'MACDHIST']),
+        ('MACD', {'fastperiod': 24, 'slowperiod': 52, 'signalperiod': 18},
+         ['MACD_24', 'MACDSIGNAL_24', 'MACDHIST_24']),
+        ('MACD', {'fastperiod': 48, 'slowperiod': 104, 'signalperiod': 36},
+         ['MACD_48', 'MACDSIGNAL_48', 'MACDHIST_48']),
+        ('MACD', {'fastperiod': 200, 'slowperiod': 300, 'signalperiod': 50},
+         ['MACD_200', 'MACDSIGNAL_200', 'MACDHIST_200']),
+        ('HT_PHASOR', {}, ['inphase', 'quadrature']),
+        ('HT_SINE', {}, ['sine', 'leadsine']),
+        ('STOCHF', {}, ['fastk', 'fastd']),
+        ('STOCHF', {'fastk_period': 20, 'fastd_period': 9, 'fastd_matype': 0}, ['fastk_20', 'fastd_20']),
+        ('STOCHF', {'fastk_period': 200, 'fastd_period': 80, 'fastd_matype': 0}, ['fastk_200', 'fastd_200']),
+        ('STOCHF', {'fastk_period': 3600, 'fastd_period': 400, 'fastd_matype': 0},
+         ['fastk_3600', 'fastd_3600']),
+        ('STOCH', {}, ['slowk', 'slowd']),
+        ('STOCH', {'fastk_period': 30, 'slowk_period': 15, 'slowk_matype': 0,
+                   'slowd_period': 9, 'slowd_matype': 0}, ['slowk_30', 'slowd_30']),
+    ]
+    for name, params, columns in other:
+        plan.append((name, _ta_input_columns(name), params, columns))
+
+    return plan
+
+
 @time_method
-def add_technical_indicators(data, periods):
+def add_technical_indicators(data, periods, sarext_params=None):
     """Add tecnical indicators as featues.
+
+    Every (indicator, parameters) output is planned up front and written into
+    one preallocated 2-D array. TA-Lib functions are called on raw NumPy
+    arrays and the result is wrapped with column names once. TA-Lib holds
+    the GIL, so tickers are parallelized with processes (UniverseRunner).
     
     Arguments:
         data {pd.DataFrame} -- Pandas data frame with OHLC data
         periods {list} -- List that contain periods as arguments.
+        sarext_params {dict} -- SAREXT_rand parameters, random if None.
     
     Returns:
         pd.dataFrame -- Pandas data frame with additional indicators
     """
-    # add technical indicators for variuos periods when ind has 1 output
-    indsList = [DEMA, EMA, MIDPRICE, SMA, T3, # MIDPOINT
-                TEMA, TRIMA, WMA,  # KAMA memory intensive!
-                ADX, ADXR, AROONOSC, BOP, CMO, DX, MFI, MINUS_DM, MOM, ROC, RSI,
-                TRIX , WILLR,  # CCI DOEANST WORK?
-                ATR, NATR,
-                BETA, CORREL, LINEARREG, LINEARREG_ANGLE, LINEARREG_INTERCEPT,
-                LINEARREG_SLOPE, TSF]  # OVDJE NASTAVITI S NIZOM!!!
-    inds = [add_ind(data, f, f._Function__name.decode('ascii'), periods)
-            for f in indsList]
-    inds = pd.concat(inds, axis=1)
-    data = pd.concat([data, inds], axis=1)
-
-    #  add technical indicators for variuos periods when ind has multiplie
-    # outputs
-    indsList = [BBANDS, AROON, STOCHRSI]
-    inds = [add_ind_df(data, f, f._Function__name.decode('ascii'), periods)
-            for f in indsList]
-    inds = pd.concat(inds, axis=1)
-    data = pd.concat([data, inds], axis=1)
-
-    # add tecnical indicators with no function arguments
-    indsList = [HT_TRENDLINE, AD, OBV, HT_DCPERIOD, HT_DCPHASE, HT_TRENDMODE,
-                TRANGE, AVGPRICE, MEDPRICE, TYPPRICE, WCLPRICE, 
-                ULTOSC]
-    inds = [f(data).rename(f._Function__name.decode('ascii')) for f in indsList]
-    inds = pd.concat(inds, axis=1)
-    data = pd.concat([data, inds], axis=1)
-
-    # add other indicators    
-    data[['MAMA', 'FAMA']] = MAMA(data)  # MAVP ne radi
-    data[['MAMA_25', 'FAMA_25']] = MAMA(data, fastlimit=0.25, slowlimit=0.02)  # MAVP ne radi
-    data[['MAMA_5', 'FAMA_5']] = MAMA(data, fastlimit=0.5, slowlimit=0.05)  # MAVP ne radi
-    data['SAR'] = SAR(data)
-    data['SAR_1'] = SAR(data, acceleration=0.01, maximum=0.01)
-    data['SAR_2'] = SAR(data, acceleration=0.02, maximum=0.02)
-    data['SAREXT'] = SAREXT(data)
-    startvalue, offsetonreverse, accelerationinitlong, accelerationlong,\
-    accelerationmaxlong, accelerationinitshort, accelerationshort,\
-    accelerationmaxshort = np.random.uniform(low=0.01, high=0.4, size=8)
-    data['SAREXT_rand'] = SAREXT(data, startvalue=startvalue, 
-                                 offsetonreverse=offsetonreverse,
-                                 accelerationinitlong=accelerationinitlong,
-                                 accelerationlong=accelerationlong,
-                                 accelerationmaxlong=accelerationmaxlong,
-                                 accelerationinitshort=accelerationinitshort,
-                                 accelerationshort=accelerationshort,
-                                 accelerationmaxshort=accelerationmaxshort)
-    data['APO'] = APO(data)
-    data['APO_1'] = APO(data, fastperiod=24, slowperiod=52, matype=0)
-    data['APO_2'] = APO(data, fastperiod=50, slowperiod=100, matype=0)
-    data['APO_3'] = APO(data, fastperiod=100, slowperiod=200, matype=0)
-    data['APO_4'] = APO(data, fastperiod=200, slowperiod=400, matype=0)
-    data['APO_5'] = APO(data, fastperiod=12000, slowperiod=24000, matype=0)
-    data['ADOSC'] = ADOSC(data)
-    data[['MACD', 'MACDSIGNAL', 'MACDHIST']] = MACD (data)
-    data[['MACD_24', 'MACDSIGNAL_24', 'MACDHIST_24']] = MACD (data,
-                                                              fastperiod=24,
-                                                              slowperiod=52,
-                                                              signalperiod=18)
-    data[['MACD_48', 'MACDSIGNAL_48', 'MACDHIST_48']] = MACD (data,
-                                                            fastperiod=48,
-                                                            slowperiod=104,
-                                                            signalperiod=36)
-    data[['MACD_200', 'MACDSIGNAL_200', 'MACDHIST_200']] = MACD (data,
-                                                        fastperiod=200,
-                                                        slowperiod=300,
-                                                        signalperiod=50)
+    plan = plan_technical_indicators(periods, sarext_params)
+    inputs = {col: np.ascontiguousarray(data[col].values, dtype=np.float64)
+              for col in ['open', 'high', 'low', 'close', 'volume']}
+    offsets = np.cumsum([0] + [len(columns) for _, _, _, columns in plan])
+    values = np.empty((data.shape[0], offsets[-1]), order='F')
+    for i, (name, input_columns, params, columns) in enumerate(plan):
+        outputs = getattr(talib, name)(*[inputs[col] for col in input_columns], **params)
+        if len(columns) == 1:
+            outputs = [outputs]
+        for j, output in enumerate(outputs):
+            values[:, offsets[i] + j] = output
+
+    indicators = pd.DataFrame(
+        values, index=data.index,
+        columns=[col for _, _, _, columns in plan for col in columns])
+    data = pd.concat([data, indicators], axis=1)
     # data[['MACDFIX', 'MACDFIX SIGNAL', 'MACDFIXHIST']] = MACDFIX(data)
-    # data[['MACDFIX_18', 'MACDFIX SIGNAL_18',
-    #       'MACDFIXHIST_18']] = MACDFIX(data, 18)
-    # data[['MACDFIX_50', 'MACDFIX SIGNAL_50',
-    #       'MACDFIXHIST_50']] = MACDFIX(data, 50)
-    # data[['MACDFIX_200', 'MACDFIX SIGNAL_200',
-    #       'MACDFIXHIST_200']] = MACDFIX(data, 200)
-    # data[['MACDFIX_12000', 'MACDFIX SIGNAL_12000',
-    #       'MACDFIXHIST_12000']] = MACDFIX(data, 12000)
-    data[['inphase', 'quadrature']] = HT_PHASOR(data)
-    data[['sine', 'leadsine']] = HT_SINE(data)
-    data[['fastk', 'fastd']]= STOCHF(data)
-    data[['fastk_20', 'fastd_20']]= STOCHF(data, fastk_period=20, fastd_period=9, fastd_matype=0)
-    data[['fastk_200', 'fastd_200']]= STOCHF(data, fastk_period=200, fastd_period=80, fastd_matype=0)
-    data[['fastk_3600', 'fastd_3600']]= STOCHF(data, fastk_period=3600, fastd_period=400, fastd_matype=0)
-    data[['slowk', 'slowd']]= STOCH(data)
-    data[['slowk_30', 'slowd_30']]= STOCH(data, fastk_period=30, slowk_period=15,
-                                          slowk_matype=0, slowd_period=9, slowd_matype=0)
         
     return data
 
@@ -189,6 +255,155 @@ def add_fourier_transform(data, col, periods):
     return data
 
 
+@njit
+def _sliding_dft(x, windows, bins, refresh):
+    """
+    Sliding DFT of selected bins for several windows in one pass over data.
+    Every bar updates bins with recurrence X_k(t) = w^k (X_k(t-1) - x(t-N) + x(t)),
+    exact DFT is recomputed every refresh bars to remove accumulated rounding error.
+    """
+    n = x.shape[0]
+    n_bins = bins.shape[0]
+    amplitude = np.full((n, windows.shape[0] * n_bins), np.nan)
+    phase = np.full((n, windows.shape[0] * n_bins), np.nan)
+    for w in range(windows.shape[0]):
+        window = windows[w]
+        twiddle = np.exp(2j * np.pi * bins / window)
+        state = np.zeros(n_bins, dtype=np.complex128)
+        for t in range(window - 1, n):
+            if (t - window + 1) % refresh == 0:
+                # exact DFT of window ending at t
+                for b in range(n_bins):
+                    total = 0j
+                    for m in range(window):
+                        total += x[t - window + 1 + m] * np.exp(-2j * np.pi * bins[b] * m / window)
+                    state[b] = total
+            else:
+                for b in range(n_bins):
+                    state[b] = twiddle[b] * (state[b] - x[t - window] + x[t])
+            for b in range(n_bins):
+                amplitude[t, w * n_bins + b] = np.abs(state[b]) / window
+                phase[t, w * n_bins + b] = np.angle(state[b])
+    return amplitude, phase
+
+
+def add_rolling_fourier_transform(data, col, windows, bins=[1, 2, 3], refresh=None):
+    """
+    Causal Fourier features: amplitude and phase of selected DFT bins over
+    rolling windows, calculated with sliding DFT.
+
+    Arguments:
+        data {pd.DataFrame} -- Pandas data frame
+        col {str} -- Column you want to transform.
+        windows {list} -- List of window lengths.
+        bins {list} -- DFT bins (cycles per window), smaller than window / 2.
+        refresh {int} -- Bars between exact DFT recalculations, max window if None.
+
+    Returns:
+        [pd.DataFrame] -- Pandas DataFrame with new columns fft_{window}_{bin}_amp
+            and fft_{window}_{bin}_phase.
+    """
+    windows = np.asarray(windows, dtype=np.int64)
+    bins = np.asarray(bins, dtype=np.float64)
+    if refresh is None:
+        refresh = int(windows.max())
+    amplitude, phase = _sliding_dft(
+        data[col].values.astype(np.float64), windows, bins, refresh)
+    names = [f'fft_{window}_{int(b)}' for window in windows for b in bins]
+    fourier = pd.concat([
+        pd.DataFrame(amplitude, index=data.index, columns=[name + '_amp' for name in names]),
+        pd.DataFrame(phase, index=data.index, columns=[name + '_phase' for name in names])
+    ], axis=1)
+    
+    return pd.concat([data, fourier], axis=1)
+
+
+@njit
+def _rolling_moments(x, windows):
+    """
+    Rolling standard deviation, skewness and kurtosis for several windows from
+    compensated prefix sums of x, x^2, x^3 and x^4, with pandas formulas.
+    Windows with NaN give NaN, constant windows give 0, 0 and -3 as in pandas.
+    """
+    n = x.shape[0]
+    finite = x[np.isfinite(x)]
+    shift = finite.mean() if finite.shape[0] > 0 else 0.
+    x = x - shift
+    s1, c1, missing = compensated_cumsum(x)
+    s2, c2, _ = compensated_cumsum(x ** 2)
+    s3, c3, _ = compensated_cumsum(x ** 3)
+    s4, c4, _ = compensated_cumsum(x ** 4)
+    # number of consecutive equal values ending at t
+    same = np.ones(n, dtype=np.int64)
+    for t in range(1, n):
+        if x[t] == x[t - 1]:
+            same[t] = same[t - 1] + 1
+    std = np.full((n, windows.shape[0]), np.nan)
+    skew = np.full((n, windows.shape[0]), np.nan)
+    kurt = np.full((n, windows.shape[0]), np.nan)
+    for j in range(windows.shape[0]):
+        w = windows[j]
+        nobs = float(w)
+        for t in range(w - 1, n):
+            a = t + 1 - w
+            b = t + 1
+            if missing[b] - missing[a] > 0:
+                continue
+            if same[t] >= w:
+                if w >= 2:
+                    std[t, j] = 0.
+                if w >= 3:
+                    skew[t, j] = 0.
+                if w >= 4:
+                    kurt[t, j] = -3.
+                continue
+            A = ((s1[b] - s1[a]) + (c1[b] - c1[a])) / nobs
+            xx = ((s2[b] - s2[a]) + (c2[b] - c2[a])) / nobs
+            xxx = ((s3[b] - s3[a]) + (c3[b] - c3[a])) / nobs
+            xxxx = ((s4[b] - s4[a]) + (c4[b] - c4[a])) / nobs
+            B = xx - A * A
+            if w >= 2:
+                std[t, j] = np.sqrt(max(B, 0.) * nobs / (nobs - 1.))
+            if B <= 1e-14:
+                continue
+            C = xxx - A * A * A - 3 * A * B
+            D = xxxx - A * A * A * A - 6 * B * A * A - 4 * C * A
+            if w >= 3:
+                skew[t, j] = np.sqrt(nobs * (nobs - 1.)) * C / ((nobs - 2.) * B ** 1.5)
+            if w >= 4:
+                K = (nobs * nobs - 1.) * D / (B * B) - 3 * ((nobs - 1.) ** 2)
+                kurt[t, j] = K / ((nobs - 2.) * (nobs - 3.))
+    return std, skew, kurt
+
+
+def add_rolling_moments(data, col='close', windows=[5, 10, 15, 30, 60]):
+    """
+    Rolling volatility, skewness and kurtosis of log returns for several
+    windows. Power sums are calculated once, so time does not depend on
+    number or length of windows.
+
+    Arguments:
+        data {pd.DataFrame} -- Pandas data frame
+        col {str} -- Price column.
+        windows {list} -- List of window lengths.
+
+    Returns:
+        [pd.DataFrame] -- Pandas DataFrame with new columns volatility_{window},
+            skew_{window} and kurtosis_{window}.
+    """
+    returns = np.log(data[col].values.astype(np.float64))
+    returns[1:] = np.diff(returns)
+    returns[0] = np.nan
+    std, skew, kurt = _rolling_moments(returns, np.asarray(windows, dtype=np.int64))
+    moments = pd.concat([
+        pd.DataFrame(std, index=data.index, columns=[f'volatility_{w}' for w in windows]),
+        pd.DataFrame(skew, index=data.index, columns=[f'skew_{w}' for w in windows]),
+        pd.DataFrame(kurt, index=data.index, columns=[f'kurtosis_{w}' for w in windows])
+    ], axis=1)
+    
+    return pd.concat([data, moments], axis=1)
+
+
 def range_grow(start=5, steps=9, pct=.7):
     s = [start]
     for i in range(0, steps):
@@ -196,9 +411,97 @@ def range_grow(start=5, steps=9, pct=.7):
     return [round(x) for x in s]
 
 
-def add_ohlcv_features(data):
+def causal_savgol_filter(x, window=31, polyorder=3):
+    """
+    Causal Savitzky-Golay filter. Value at bar t is the least squares
+    polynomial fitted on the window ending at t, evaluated at t, so only
+    current and past bars are used (savgol_filter uses future bars).
+
+    Arguments:
+        x {np.array} -- Series to smooth.
+        window {int} -- Window length.
+        polyorder {int} -- Order of polynomial, smaller than window.
+
+    Returns:
+        [np.array] -- Smoothed series, NaN for the first window - 1 bars.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    coeffs = savgol_coeffs(window, polyorder, pos=window - 1, use='dot')
+    smoothed = np.full(x.shape[0], np.nan)
+    if x.shape[0] >= window:
+        smoothed[window - 1:] = np.correlate(x, coeffs, mode='valid')
+    return smoothed
+
+
+class LagMatrix:
+    """
+    Lags of one column as read-only strided views over one buffer. Lags are
+    copied only by to_frame, so lag features cost one column of memory
+    until they are materialized.
+
+    :param values: (pd.Series) column to lag
+    :param lags: (list) lags, e.g. range_grow(1, 150, .055)
+    :param name: (str) name used in lag column names, series name if None
+    """
+
+    def __init__(self, values, lags, name=None):
+        self.name = name if name is not None else values.name
+        self.index = values.index
+        self.lags = list(dict.fromkeys(lags))
+        self.max_lag = max(self.lags)
+        self.buffer = np.concatenate([np.full(self.max_lag, np.nan),
+                                      np.asarray(values, dtype=np.float64)])
+        self.columns = [f'{self.name}_lag_{t}' for t in self.lags]
+
+    def __len__(self):
+        return self.buffer.shape[0] - self.max_lag
+
+    def lag(self, t):
+        """
+        :param t: (int) lag, not larger than maximal lag
+        :return: (np.array) read-only view of lagged values
+        """
+        view = self.buffer[self.max_lag - t:self.max_lag - t + len(self)]
+        view.flags.writeable = False
+        return view
+
+    def view(self):
+        """
+        :return: (np.array) read-only (n, max_lag + 1) view, column k is lag k
+        """
+        return np.lib.stride_tricks.sliding_window_view(self.buffer, self.max_lag + 1)[:, ::-1]
+
+    def __getitem__(self, col):
+        t = self.lags[self.columns.index(col)]
+        return pd.Series(self.lag(t), index=self.index, name=col, copy=False)
+
+    def to_frame(self, lags=None):
+        """
+        Materialize lags as data frame.
+
+        :param lags: (list) lags to materialize, all if None
+        :return: (pd.DataFrame) lag columns
+        """
+        lags = self.lags if lags is None else list(lags)
+        return pd.DataFrame(self.view()[:, lags], index=self.index,
+                            columns=[f'{self.name}_lag_{t}' for t in lags])
+
+
+def add_ohlcv_features(data, micro_windows=None, moment_windows=None, smooth_window=None,
+                       smooth_lags=None, lag_matrix=False):
     """
     Calculate features based on OHLCV data and add tham to data feame.
+    
+    :param micro_windows: (list) windows of microstructural features,
+        microstructural features are not added if None
+    :param moment_windows: (list) windows of log return volatility, skewness
+        and kurtosis, not added if None
+    :param smooth_window: (int) window of causal Savitzky-Golay smoothed close,
+        not added if None
+    :param smooth_lags: (list) lags of smoothed close, e.g. range_grow(1, 150, .055)
+    :param lag_matrix: (bool) return smoothed close lags as LagMatrix instead
+        of adding them as columns, so they cost one column until materialized
+    :return: (pd.DataFrame) data with features, (data, LagMatrix or None) if lag_matrix
     """
 
     # add ohlc transformations
@@ -214,58 +517,13 @@ def add_ohlcv_features(data):
     # data['momentum5'] = data['close'].pct_change(periods=5)
     # data['momentum10'] = data['close'].pct_change(periods=10)
     
-    # # Volatility
-    # data['volatility_60'] = np.log(data['close']).diff().rolling(
-    #     window=60, min_periods=60, center=False).std()
-    # data['volatility_30'] = np.log(data['close']).diff().rolling(
-    #     window=30, min_periods=30, center=False).std()
-    # data['volatility_15'] = np.log(data['close']).diff().rolling(
-    #     window=15, min_periods=15, center=False).std()
-    # data['volatility_10'] = np.log(data['close']).diff().rolling(
-    #     window=10, min_periods=10, center=False).std()
-    # data['volatility_5'] =np.log(data['close']).diff().rolling(
-    #     window=5, min_periods=5, center=False).std()
-    
-    # # Skewness
-    # data['skew_60'] = np.log(data['close']).diff().rolling(
-    #     window=60, min_periods=60, center=False).skew()
-    # data['skew_30'] = np.log(data['close']).diff().rolling(
-    #     window=30, min_periods=30, center=False).skew()
-    # data['skew_15'] = np.log(data['close']).diff().rolling(
-    #     window=15, min_periods=15, center=False).skew()
-    # data['skew_10'] = np.log(data['close']).diff().rolling(
-    #     window=10, min_periods=10, center=False).skew()
-    # data['skew_5'] =np.log(data['close']).diff().rolling(
-    #     window=5, min_periods=5, center=False).skew()
-
-    # # kurtosis
-    # data['kurtosis_60'] = np.log(data['close']).diff().rolling(
-    #     window=60, min_periods=60, center=False).kurt()
-    # data['kurtosis_30'] = np.log(data['close']).diff().rolling(
-    #     window=30, min_periods=30, center=False).kurt()
-    # data['kurtosis_15'] = np.log(data['close']).diff().rolling(
-    #     window=15, min_periods=15, center=False).kurt()
-    # data['kurtosis_10'] = np.log(data['close']).diff().rolling(
-    #     window=10, min_periods=10, center=False).kurt()
-    # data['kurtosis_5'] =np.log(data['close']).diff().rolling(
-    #     window=5, min_periods=5, center=False).kurt()
+    # volatility, skewness and kurtosis
+    if moment_windows is not None:
+        data = add_rolling_moments(data, 'close', moment_windows)
     
-    # # microstructural features
-    # data['roll_measure'] = micro.get_roll_measure(data['close'])
-    # data['corwin_schultz_est'] = micro.get_corwin_schultz_estimator(
-    #     data['high'], data['low'], 100)
-    # data['bekker_parkinson_vol'] = micro.get_bekker_parkinson_vol(
-    #     data['high'], data['low'], 100)
-    # data['kyle_lambda'] = micro.get_bekker_parkinson_vol(
-    #     data['close'], data['volume'])
-    # data['amihud_lambda'] = micro.get_bar_based_amihud_lambda(
-    #     data['close'], data['volume'])
-    # data['hasbrouck_lambda'] = micro.get_bar_based_hasbrouck_lambda(
-    #     data['close'], data['volume'])
-    # tick_diff = data['close'].diff()
-    # data['tick_rule'] = np.where(tick_diff != 0,
-    #                             np.sign(tick_diff),
-    #                             np.sign(tick_diff).shift(periods=-1))
+    # microstructural features
+    if micro_windows is not None:
+        data = add_microstructural_features(data, micro_windows)
     
     # # Add time features
     # data['minute'] = data.index.minute
@@ -273,13 +531,14 @@ def add_ohlcv_features(data):
     # data['day_of_week'] = data.index.dayofweek
     # data['week_of_month'] = data.index.to_series().apply(lambda d: (d.day - 1) // 7 + 1)
     
-    # # Add smoothed lags
-    # smooth_name = f"smooth_close"
-    # data[smooth_name] = savgol_filter(data['close'], 31, 3)
-    # data = data.assign(**{
-    #     f"{smooth_name}_lag_{t}": data[[smooth_name]].shift(t)
-    #     for t in list(dict.fromkeys(range_grow(1, 150, .055)))
-    # })
+    # causal smoothing and smoothed lags
+    lags = None
+    if smooth_window is not None:
+        data['smooth_close'] = causal_savgol_filter(data['close'].values, smooth_window, 3)
+        if smooth_lags is not None:
+            lags = LagMatrix(data['smooth_close'], smooth_lags)
+            if not lag_matrix:
+                data = pd.concat([data, lags.to_frame()], axis=1)
     
     # ### ADD VIX TO DATABASE
     # q = 'SELECT date, open AS open_vix, high AS high_vix, low AS low_vix, \
@@ -296,6 +555,8 @@ def add_ohlcv_features(data):
     # data['vix_high_low'] = data['high'] - data['low']
     # data['vix_close_open'] = data['close'] - data['open']
 
+    if lag_matrix:
+        return data, lags
     return data
 
 
@@ -304,21 +565,235 @@ def exponent(x):
         return np.where(np.abs(x) < 100, np.exp(x), 0.)
 
 
+def _to_memmap(array, folder, name):
+    """Dump array to folder and load it as read only memory map."""
+    path = os.path.join(folder, name + '.mmap')
+    joblib.dump(np.asarray(array, dtype=np.float64), path)
+    return joblib.load(path, mmap_mode='r')
+
+
+class _SubexpressionCache:
+    """
+    LRU cache of evaluated gplearn sub-expressions on fixed data. Identical
+    sub-expressions of different programs and generations are evaluated once.
+    Size of cached outputs is bounded by max_bytes.
+    """
+
+    def __init__(self, X, max_bytes=2 ** 30):
+        self.X = X
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _keys(program):
+        """Key of sub-expression starting at every node and index after it."""
+        keys = [None] * len(program)
+        ends = [None] * len(program)
+        stack = []
+        for i in range(len(program) - 1, -1, -1):
+            node = program[i]
+            if isinstance(node, _Function):
+                args = [stack.pop() for _ in range(node.arity)]
+                keys[i] = node.name + '(' + ','.join(keys[j] for j in args) + ')'
+                ends[i] = ends[args[-1]]
+            else:
+                keys[i] = 'X' + str(node) if isinstance(node, (int, np.integer)) else repr(float(node))
+                ends[i] = i + 1
+            stack.append(i)
+        return keys, ends
+
+    def _execute(self, program, keys, ends, i):
+        node = program[i]
+        if not isinstance(node, _Function):
+            if isinstance(node, (int, np.integer)):
+                return self.X[:, node]
+            return np.full(self.X.shape[0], node)
+        key = keys[i]
+        with self.lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                self.hits += 1
+                return self.cache[key]
+        args = []
+        i += 1
+        for _ in range(node.arity):
+            args.append(self._execute(program, keys, ends, i))
+            i = ends[i]
+        with np.errstate(over='ignore', divide='ignore', invalid='ignore'):
+            value = node(*args)
+        with self.lock:
+            self.misses += 1
+            if key not in self.cache and value.nbytes <= self.max_bytes:
+                self.cache[key] = value
+                self.nbytes += value.nbytes
+                while self.nbytes > self.max_bytes:
+                    self.nbytes -= self.cache.popitem(last=False)[1].nbytes
+        return value
+
+    def execute(self, program):
+        """
+        :param program: (list) gplearn program in prefix notation
+        :return: (np.array) program output
+        """
+        keys, ends = self._keys(program)
+        return self._execute(program, keys, ends, 0)
+
+    def matches(self, X):
+        """
+        :param X: (np.array) data passed to gplearn
+        :return: (bool) True if X is a view of the same memory as cached data
+        """
+        return (getattr(X, 'shape', None) == self.X.shape and
+                X.__array_interface__['data'][0] == self.X.__array_interface__['data'][0])
+
+
+_EXECUTE_CACHES = []
+_EXECUTE_LOCK = threading.Lock()
+_INDICES_LOCK = threading.Lock()
+_program_execute = _Program.execute
+_program_get_all_indices = _Program.get_all_indices
+
+
+def _cached_program_execute(program, X):
+    """_Program.execute that reads sub-expressions from active cache of X."""
+    for cache in list(_EXECUTE_CACHES):
+        if cache.matches(X):
+            return cache.execute(program.program)
+    return _program_execute(program, X)
+
+
+def _locked_get_all_indices(program, *args, **kwargs):
+    """_Program.get_all_indices is not thread safe, it draws from global RandomState."""
+    with _INDICES_LOCK:
+        return _program_get_all_indices(program, *args, **kwargs)
+
+
+@contextmanager
+def _cached_execution(cache):
+    """
+    Route gplearn program evaluation on cache data through cache, so gplearn
+    has to run in threads of this process. Programs evaluated on other data
+    use original _Program.execute.
+    """
+    with _EXECUTE_LOCK:
+        _EXECUTE_CACHES.append(cache)
+        _Program.execute = _cached_program_execute
+        _Program.get_all_indices = _locked_get_all_indices
+    try:
+        yield cache
+    finally:
+        with _EXECUTE_LOCK:
+            _EXECUTE_CACHES.remove(cache)
+            if not _EXECUTE_CACHES:
+                _Program.execute = _program_execute
+                _Program.get_all_indices = _program_get_all_indices
+
+
+def _correlation(x, y, metric):
+    if metric == 'spearman':
+        x = pd.Series(x).rank().values
+        y = pd.Series(y).rank().values
+    with np.errstate(invalid='ignore', divide='ignore'):
+        corr = np.corrcoef(x, y)[0, 1]
+    return 0. if not np.isfinite(corr) else abs(corr)
+
+
 class Genetic(BaseEstimator, TransformerMixin):
 
-    def __init__(self, population=50000, generations=10, hall_of_fame=500, components=200, metric='spearman'):
+    def __init__(self, population=50000, generations=10, hall_of_fame=500, components=200, metric='spearman',
+                 n_jobs=7, subsample=None, holdout=None, patience=None, tol=1e-4, cache_bytes=2 ** 30,
+                 memmap_folder=None, random_state=0):
         self.state = {}
         self.population = population
         self.generations = generations
         self.hall_of_fame = hall_of_fame
         self.components = components
         self.metric = metric
+        self.n_jobs = n_jobs
+        self.subsample = subsample
+        self.holdout = holdout
+        self.patience = patience
+        self.tol = tol
+        self.cache_bytes = cache_bytes
+        self.memmap_folder = memmap_folder
+        self.random_state = random_state
 
         # population: Number of formulas per generation
         # generations: Number of generations
         # hall_of_fame: Best final evolution program to evaluate
         # components: X least correlated from the hall of fame
         # metric: pearson for linear model, spearman for tree based estimators
+        # n_jobs: Number of threads, memory mapped X and y and sub-expression cache are shared with them
+        # subsample: Fraction of time ordered (contiguous) training rows used in every generation
+        # holdout: Fraction of last rows used for holdout fitness and early stopping, all rows are used for training if None
+        # patience: Stop after patience generations without holdout improvement larger than tol
+        # cache_bytes: Maximal size of sub-expression outputs cached per data window; gplearn fitness
+        #     and holdout fitness are evaluated through the cache, training window cache is kept across
+        #     generations if subsample is None and rebuilt every generation otherwise
+
+    def _holdout_fitness(self, gp, cache, y_holdout):
+        """Best holdout fitness of hall of fame programs from the last generation."""
+        programs = sorted([p for p in gp._programs[-1] if p is not None],
+                          key=lambda p: p.raw_fitness_, reverse=gp._metric.greater_is_better)
+        programs = programs[:self.hall_of_fame]
+        with ThreadPoolExecutor(max_workers=self.n_jobs) as executor:
+            fitness = list(executor.map(
+                lambda p: _correlation(cache.execute(p.program), y_holdout, self.metric), programs))
+        return max(fitness) if fitness else 0.
+
+    def _evolve(self, gp, X, y, folder):
+        """
+        Run generations on memory mapped data.
+
+        :return: (list, tuple) holdout fitness history and cache hits and misses
+        """
+        X_ = _to_memmap(X, folder, 'X')
+        y_ = _to_memmap(np.ravel(y), folder, 'y')
+
+        # time ordered train and holdout rows
+        n_train = int(X_.shape[0] * (1 - self.holdout)) if self.holdout else X_.shape[0]
+        cache = _SubexpressionCache(X_[n_train:], max_bytes=self.cache_bytes) if self.holdout else None
+        window_cache = None
+        stats = np.zeros(2, dtype=np.int64)
+        n_sample = int(n_train * self.subsample) if self.subsample else n_train
+        random_state = np.random.RandomState(self.random_state)
+
+        best_fitness = -np.inf
+        waiting = 0
+        history = []
+        for generation in range(1, self.generations + 1):
+            start = random_state.randint(0, n_train - n_sample + 1)
+            X_window = X_[start:start + n_sample]
+            if window_cache is None or not window_cache.matches(X_window):
+                if window_cache is not None:
+                    stats += (window_cache.hits, window_cache.misses)
+                window_cache = _SubexpressionCache(X_window, max_bytes=self.cache_bytes)
+            gp.set_params(generations=generation)
+            with _cached_execution(window_cache), joblib.parallel_backend('threading', n_jobs=self.n_jobs):
+                gp.fit(X_window, y_[start:start + n_sample])
+
+            # early stopping on holdout fitness plateau
+            if cache is None:
+                continue
+            fitness = self._holdout_fitness(gp, cache, y_[n_train:])
+            history.append(fitness)
+            print('Generation %d holdout fitness %.4f' % (generation, fitness))
+            if fitness > best_fitness + self.tol:
+                best_fitness = fitness
+                waiting = 0
+            else:
+                waiting += 1
+                if self.patience is not None and waiting >= self.patience:
+                    print('Holdout fitness plateau, stopping after generation %d' % generation)
+                    break
+        for c in [window_cache, cache]:
+            if c is not None:
+                stats += (c.hits, c.misses)
+        return history, (int(stats[0]), int(stats[1]))
 
     def fit(self, X, y=None, state={}):
         exponential = make_function(function=exponent, name='exp', arity=1)
@@ -326,20 +801,31 @@ class Genetic(BaseEstimator, TransformerMixin):
         function_set = ['add', 'sub', 'mul', 'div', 'sqrt', 'log', 'abs', 'neg', 'inv', 'max',
                         'min', 'tan', 'sin', 'cos', exponential]
 
-        gp = SymbolicTransformer(generations=self.generations, population_size=self.population,
+        gp = SymbolicTransformer(generations=1, population_size=self.population,
                                  hall_of_fame=self.hall_of_fame, n_components=self.components,
                                  function_set=function_set,
                                  parsimony_coefficient='auto',
                                  max_samples=0.6, verbose=1, metric=self.metric,
-                                 random_state=0, n_jobs=7)
+                                 random_state=self.random_state, n_jobs=self.n_jobs,
+                                 warm_start=True)
+
+        # share data with workers through memory maps
+        folder = self.memmap_folder or tempfile.mkdtemp(prefix='genetic_')
+        try:
+            history, cache_stats = self._evolve(gp, X, y, folder)
+        finally:
+            if self.memmap_folder is None:
+                shutil.rmtree(folder, ignore_errors=True)
 
         self.state['genetic'] = {}
-        self.state['genetic']['fit'] = gp.fit(X, y)
+        self.state['genetic']['fit'] = gp
+        self.state['genetic']['holdout_fitness'] = history
+        self.state['genetic']['cache_hits'], self.state['genetic']['cache_misses'] = cache_stats
 
         return self
 
     def transform(self, X, y=None, state={}):
-        features = self.state['genetic']['fit'].transform(X)
+        features = self.state['genetic']['fit'].transform(np.asarray(X, dtype=np.float64))
         features = pd.DataFrame(features, columns=["genetic_" + str(a) for a in range(features.shape[1])], index=X.index)
         X = X.join(features)
 
@@ -348,9 +834,18 @@ class Genetic(BaseEstimator, TransformerMixin):
 
 class AddFeatures(BaseEstimator, TransformerMixin):
 
-    def __init__(self, add_ta=True, ta_periods=[10, 100]):
+    def __init__(self, add_ta=True, ta_periods=[10, 100], columns=None,
+                 dtype_policy=None, micro_windows=None, moment_windows=None,
+                 smooth_window=None, smooth_lags=None, sarext_params=None):
         self.add_ta = add_ta
         self.ta_periods = ta_periods
+        self.columns = columns  # calculate only these features if not None, e.g. chosen smooth_close lags
+        self.dtype_policy = dtype_policy  # e.g. trademl.modeling.memory.DtypePolicy()
+        self.micro_windows = micro_windows  # e.g. [20, 100]
+        self.moment_windows = moment_windows  # e.g. [5, 10, 15, 30, 60]
+        self.smooth_window = smooth_window  # e.g. 31
+        self.smooth_lags = smooth_lags  # e.g. range_grow(1, 150, .055)
+        self.sarext_params = sarext_params  # SAREXT_rand parameters, random if None
 
     def fit(self, X, y=None):
         print('Adding features')
@@ -360,21 +855,39 @@ class AddFeatures(BaseEstimator, TransformerMixin):
     @time_method
     def transform(self, X, y=None):
         
+        # add requested features only
+        if self.columns is not None:
+            from trademl.modeling.feature_graph import default_registry
+            windows = {name: value for name, value in [('moment_windows', self.moment_windows),
+                                                        ('micro_windows', self.micro_windows),
+                                                        ('smooth_window', self.smooth_window),
+                                                        ('smooth_lags', self.smooth_lags)]
+                       if value is not None}
+            registry = default_registry(self.ta_periods if self.add_ta else [],
+                                        sarext_params=self.sarext_params, **windows)
+            X = registry.compute(X, self.columns)
+            print('Requested features added')
+        
         # add tecnical indicators
-        if self.add_ta:
-            X = add_technical_indicators(X, periods=self.ta_periods)
-            X.columns = [cl[0] if isinstance(cl, tuple) else cl for cl in X.columns]
+        elif self.add_ta:
+            X = add_technical_indicators(X, periods=self.ta_periods, sarext_params=self.sarext_params)
             print('Technical indicators added')
         
         # add other features
-        X = add_ohlcv_features(X)
-        print('Microstructural and other features added')
+        if self.columns is None:
+            X = add_ohlcv_features(X, micro_windows=self.micro_windows,
+                                   moment_windows=self.moment_windows,
+                                   smooth_window=self.smooth_window,
+                                   smooth_lags=self.smooth_lags)
+            print('Microstructural and other features added')
         
         # remove na
         if self.add_ta:
             X = X.loc[:, X.isna().sum() < (max(self.ta_periods) + 10)]
         cols_remove_na = range((np.where(X.columns == 'volume')[0].item() + 1), X.shape[1])
         X.dropna(subset=X.columns[cols_remove_na], inplace=True)
+        if self.dtype_policy is not None:
+            X = self.dtype_policy.apply(X)
         
         return X
 
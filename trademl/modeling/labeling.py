@@ -1,3 +1,9 @@
+import heapq
+import pickle
+import numpy as np
+import pandas as pd
+
+
 def trend_labeling(close, time, w):
     """Trend labeling based on paper: file:///C:/Users/Mislav/AppData/Local/Temp/entropy-22-01162-v3.pdf
 
@@ -78,6 +84,173 @@ def trend_labeling(close, time, w):
     return y
 
 
+def fixed_horizon_labels(close, horizons, threshold=0, resample_by='B', prefix='day_'):
+    """Fixed time horizon labels for many horizons in one pass.
+
+    Close is resampled once and forward returns for every horizon are
+    calculated with strided differences of the same array. Labels follow
+    mlfinlab fixed_time_horizon: 1 if return is above threshold, -1 if it is
+    below -threshold and 0 otherwise.
+
+    Args:
+        close (pd.Series): close prices.
+        horizons (list): forward horizons, in number of resampled periods.
+        threshold (float or list): threshold for all horizons or one
+            threshold per horizon.
+        resample_by (str): pandas frequency to resample close. If None, bars
+            are used as they are.
+        prefix (str): prefix of column names.
+
+    Returns:
+        pd.DataFrame: wide table with `{prefix}{h}_ret` and `{prefix}{h}_bin`
+            columns for every horizon.
+    """
+    if resample_by is not None:
+        close = close.resample(resample_by).last()
+    prices = close.values.astype(np.float64)
+    thresholds = np.broadcast_to(np.asarray(threshold, dtype=np.float64), (len(horizons),))
+
+    labels = np.full((prices.shape[0], 2 * len(horizons)), np.nan)
+    for i, (h, thresh) in enumerate(zip(horizons, thresholds)):
+        ret = labels[:prices.shape[0] - h, 2 * i]
+        np.divide(prices[h:], prices[:prices.shape[0] - h], out=ret)
+        ret -= 1
+        labels[:prices.shape[0] - h, 2 * i + 1] = np.sign(ret) * (np.abs(ret) > thresh)
+
+    columns = [prefix + str(h) + suffix for h in horizons for suffix in ('_ret', '_bin')]
+    return pd.DataFrame(labels, index=close.index, columns=columns)
+
+
+class OnlineTripleBarrierLabeling:
+    """Incremental triple-barrier labeling for live trading and for appending
+    labels to an existing dataset.
+
+    Pending events are kept in a heap ordered by vertical barrier time. Every
+    new bar checks only the open events and emits labels as soon as they hit
+    the profit taking, stop loss or vertical barrier. The output has the same
+    columns as `TripleBarierLabeling.triple_barrier_info` (t1, ret, trgt, bin).
+    Events that are still open at the end of the data stay pending, so the
+    state can be saved and the next job continues from the last bar without
+    relabeling old rows.
+
+    Args:
+        triplebar_num_days (int): number of days for the vertical barrier.
+        triplebar_pt_sl (list): profit taking and stop loss multipliers. As in
+            mlfinlab `get_events` without side, the first value is used for
+            both barriers.
+        triplebar_min_ret (float): minimal target for event to be used.
+    """
+
+    def __init__(self, triplebar_num_days=5, triplebar_pt_sl=[1, 1],
+                 triplebar_min_ret=0.003):
+        self.triplebar_num_days = triplebar_num_days
+        self.triplebar_pt_sl = triplebar_pt_sl
+        self.triplebar_min_ret = triplebar_min_ret
+        self.pending = []  # heap of (vertical barrier time, event time)
+        self.open_events = {}  # event time -> (entry price, target)
+        self.resolved = []  # labels not yet collected by get_labels
+        self.last_time = None
+
+    def add_event(self, t0, price, target):
+        """Open new event at time t0.
+
+        Args:
+            t0 (pd.Timestamp): event time.
+            price (float): close price at event time.
+            target (float): target return (usually daily volatility).
+        """
+        if np.isnan(target) or target <= self.triplebar_min_ret:
+            return
+        vertical_barrier = t0 + pd.Timedelta(days=self.triplebar_num_days)
+        heapq.heappush(self.pending, (vertical_barrier, t0))
+        self.open_events[t0] = (price, target)
+
+    def _resolve(self, t0, t1, ret, target):
+        del self.open_events[t0]
+        self.resolved.append((t0, t1, ret, target, np.sign(ret)))
+
+    def update(self, time, price):
+        """Process new bar and resolve events that touched a barrier.
+
+        Args:
+            time (pd.Timestamp): bar time.
+            price (float): bar close price.
+
+        Returns:
+            int: number of events resolved on this bar.
+        """
+        n_resolved = len(self.resolved)
+        pt = self.triplebar_pt_sl[0]
+        sl = self.triplebar_pt_sl[0]
+
+        # horizontal barriers, check only open events
+        for t0, (entry_price, target) in list(self.open_events.items()):
+            ret = price / entry_price - 1
+            if (pt > 0 and ret > pt * target) or (sl > 0 and ret < -sl * target):
+                self._resolve(t0, time, ret, target)
+
+        # vertical barriers, first bar at or after the barrier time
+        while self.pending and self.pending[0][0] <= time:
+            _, t0 = heapq.heappop(self.pending)
+            if t0 in self.open_events:
+                entry_price, target = self.open_events[t0]
+                self._resolve(t0, time, price / entry_price - 1, target)
+
+        self.last_time = time
+        return len(self.resolved) - n_resolved
+
+    def partial_fit(self, close, t_events, target):
+        """Process new bars and events. Bars older than the last processed bar
+        are skipped, so overlapping data can be passed safely.
+
+        Args:
+            close (pd.Series): close prices of new bars.
+            t_events (pd.DatetimeIndex): event times (e.g. CUSUM events).
+            target (pd.Series): target returns, indexed by time.
+
+        Returns:
+            OnlineTripleBarrierLabeling: self.
+        """
+        if self.last_time is not None:
+            close = close.loc[close.index > self.last_time]
+        events = set(t_events.intersection(close.index))
+        target = target.reindex(close.index[close.index.isin(events)])
+        for time, price in zip(close.index, close.values):
+            self.update(time, price)
+            if time in events:
+                self.add_event(time, price, target.loc[time])
+        self.pending = [(v, t0) for v, t0 in self.pending if t0 in self.open_events]
+        heapq.heapify(self.pending)
+
+        return self
+
+    def get_labels(self):
+        """Return labels resolved since the last call.
+
+        Returns:
+            pd.DataFrame: labels with columns t1, ret, trgt and bin, indexed by
+                event time.
+        """
+        labels = pd.DataFrame(self.resolved, columns=['t0', 't1', 'ret', 'trgt', 'bin'])
+        labels = labels.set_index('t0').sort_index()
+        labels.index.name = None
+        self.resolved = []
+        return labels
+
+    def save(self, path):
+        """Save labeler state to pickle file."""
+        with open(path, 'wb') as f:
+            pickle.dump(self.__dict__, f)
+
+    @classmethod
+    def load(cls, path):
+        """Load labeler state from pickle file."""
+        labeler = cls()
+        with open(path, 'rb') as f:
+            labeler.__dict__.update(pickle.load(f))
+        return labeler
+
+
 # # test
 # import pandas as pd
 # import yfinance as yf
@@ -0,0 +1,125 @@
+'''
+MEMORY
+
+Dtype policy for feature matrices and peak memory report of pipeline stages.
+'''
+
+import time
+import tracemalloc
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+
+
+# prices and accumulators stay in float64, returns and cumulative sums
+# lose precision in float32
+PRICE_COLUMNS = ['open', 'high', 'low', 'close', 'average', 'close_ath']
+ACCUMULATOR_COLUMNS = ['volume', 'barCount', 'OBV', 'AD', 'ADOSC']
+# prefixes added to feature names after stationarity step
+COLUMN_PREFIXES = ['fracdiff_', 'orig_']
+
+
+class DtypePolicy:
+    """
+    Keep features in float32 and prices and accumulators in float64.
+
+    :param feature_dtype: (np.dtype) dtype of features
+    :param keep_float64: (list) columns kept in float64, prices and
+        accumulators by default; fracdiff_ and orig_ prefixes are ignored
+    :param max_abs: (float) columns with larger absolute values stay in float64
+    """
+
+    def __init__(self, feature_dtype=np.float32, keep_float64=None, max_abs=1e30):
+        self.feature_dtype = feature_dtype
+        self.keep_float64 = keep_float64 if keep_float64 is not None else PRICE_COLUMNS + ACCUMULATOR_COLUMNS
+        self.max_abs = max_abs
+
+    def _is_float64_column(self, col):
+        col = str(col)
+        for prefix in COLUMN_PREFIXES:
+            if col.startswith(prefix):
+                col = col[len(prefix):]
+        return col in self.keep_float64
+
+    def dtypes(self, data):
+        """
+        Target dtype of every float column.
+
+        :param data: (pd.DataFrame) data
+        :return: (dict) dtype by column name
+        """
+        dtypes = {}
+        for col, dtype in data.dtypes.items():
+            if not np.issubdtype(dtype, np.floating):
+                continue
+            if self._is_float64_column(col):
+                dtypes[col] = np.float64
+            elif np.nanmax(np.abs(data[col].values), initial=0.) > self.max_abs:
+                dtypes[col] = np.float64
+            else:
+                dtypes[col] = self.feature_dtype
+        return dtypes
+
+    def apply(self, data):
+        """
+        Cast float columns of data to policy dtypes. Only columns with
+        different dtype are converted.
+
+        :param data: (pd.DataFrame) data
+        :return: (pd.DataFrame) data with policy dtypes
+        """
+        dtypes = {col: dtype for col, dtype in self.dtypes(data).items()
+                  if data[col].dtype != dtype}
+        if not dtypes:
+            return data
+        return data.astype(dtypes, copy=False)
+
+    def array(self, values):
+        """
+        :param values: (np.array) feature matrix
+        :return: (np.array) feature matrix in feature dtype, not copied if already in it
+        """
+        return np.asarray(values, dtype=self.feature_dtype)
+
+
+def frame_memory(data):
+    """
+    :param data: (pd.DataFrame or np.array) data
+    :return: (float) memory of data in MB
+    """
+    if isinstance(data, (pd.DataFrame, pd.Series)):
+        return data.memory_usage(index=True, deep=False).sum() / 2 ** 20
+    return data.nbytes / 2 ** 20
+
+
+@contextmanager
+def memory_stage(name, report=None):
+    """
+    Print peak traced memory and time of pipeline stage. Memory is traced
+    with tracemalloc, NumPy and pandas allocations are included. Stages
+    should not be nested.
+
+    :param name: (str) stage name
+    :param report: (dict) if not None, stage results are saved here by name
+    """
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    start_memory, _ = tracemalloc.get_traced_memory()
+    start_time = time.time()
+    try:
+        yield
+    finally:
+        current, peak = tracemalloc.get_traced_memory()
+        stage = {
+            'peak_mb': (peak - start_memory) / 2 ** 20,
+            'retained_mb': (current - start_memory) / 2 ** 20,
+            'seconds': time.time() - start_time
+        }
+        print("%s: peak %.1f MB, retained %.1f MB, %.2f seconds" % (
+            name, stage['peak_mb'], stage['retained_mb'], stage['seconds']))
+        if report is not None:
+            report[name] = stage
+        if started:
+            tracemalloc.stop()
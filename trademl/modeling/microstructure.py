@@ -0,0 +1,265 @@
+'''
+MICROSTRUCTURE
+
+Compiled rolling microstructural features. Same estimators as
+mlfinlab.microstructural_features, but every estimator calculates all
+window lengths from one set of compensated prefix sums instead of rolling apply.
+'''
+
+import numpy as np
+import pandas as pd
+from numba import njit
+
+
+@njit
+def compensated_cumsum(x):  # pragma: no cover
+    """
+    Compensated (Neumaier) prefix sums of finite values, with prefix counts
+    of NaN and infinite values. Sum of x[a:b] is
+    (total[b] - total[a]) + (compensation[b] - compensation[a]).
+
+    :param x: (np.array) values
+    :return: (np.array, np.array, np.array) prefix sums, compensations and
+        counts of non-finite values, all of length n + 1
+    """
+    n = x.shape[0]
+    total = np.zeros(n + 1)
+    compensation = np.zeros(n + 1)
+    missing = np.zeros(n + 1, dtype=np.int64)
+    s = 0.
+    c = 0.
+    for i in range(n):
+        v = x[i]
+        missing[i + 1] = missing[i]
+        if not np.isfinite(v):
+            missing[i + 1] += 1
+        else:
+            t = s + v
+            if abs(s) >= abs(v):
+                c += (s - t) + v
+            else:
+                c += (v - t) + s
+            s = t
+        total[i + 1] = s
+        compensation[i + 1] = c
+    return total, compensation, missing
+
+
+@njit
+def _rolling_mean(x, windows):  # pragma: no cover
+    """
+    Rolling mean for every window, NaN if window contains NaN or inf, as pandas
+    rolling(window).mean().
+    """
+    n = x.shape[0]
+    total, compensation, missing = compensated_cumsum(x)
+    out = np.full((n, windows.shape[0]), np.nan)
+    for j in range(windows.shape[0]):
+        w = windows[j]
+        for t in range(w - 1, n):
+            a = t + 1 - w
+            b = t + 1
+            if missing[b] - missing[a] == 0:
+                out[t, j] = ((total[b] - total[a]) + (compensation[b] - compensation[a])) / w
+    return out
+
+
+@njit
+def _rolling_cov(x, y, windows):  # pragma: no cover
+    """
+    Rolling sample covariance for every window, NaN if window contains NaN or inf,
+    as pandas rolling(window).cov(other).
+    """
+    n = x.shape[0]
+    sx, cx, missing = compensated_cumsum(x + 0. * y)
+    sy, cy, _ = compensated_cumsum(y + 0. * x)
+    sxy, cxy, _ = compensated_cumsum(x * y)
+    out = np.full((n, windows.shape[0]), np.nan)
+    for j in range(windows.shape[0]):
+        w = windows[j]
+        for t in range(w - 1, n):
+            a = t + 1 - w
+            b = t + 1
+            if missing[b] - missing[a] > 0 or w < 2:
+                continue
+            sum_x = (sx[b] - sx[a]) + (cx[b] - cx[a])
+            sum_y = (sy[b] - sy[a]) + (cy[b] - cy[a])
+            sum_xy = (sxy[b] - sxy[a]) + (cxy[b] - cxy[a])
+            out[t, j] = (sum_xy - sum_x * sum_y / w) / (w - 1)
+    return out
+
+
+@njit
+def _tick_rule(close):  # pragma: no cover
+    """Sign of price change, previous sign if price did not change."""
+    n = close.shape[0]
+    signs = np.full(n, np.nan)
+    for t in range(1, n):
+        diff = close[t] - close[t - 1]
+        if diff > 0:
+            signs[t] = 1.
+        elif diff < 0:
+            signs[t] = -1.
+        elif diff == 0:
+            signs[t] = signs[t - 1]
+    return signs
+
+
+@njit
+def _beta_gamma(high, low):  # pragma: no cover
+    """Corwin-Schultz beta (before rolling mean) and gamma for every bar."""
+    n = high.shape[0]
+    beta = np.full(n, np.nan)
+    gamma = np.full(n, np.nan)
+    for t in range(1, n):
+        beta[t] = np.log(high[t] / low[t]) ** 2 + np.log(high[t - 1] / low[t - 1]) ** 2
+        gamma[t] = np.log(max(high[t], high[t - 1]) / min(low[t], low[t - 1])) ** 2
+    return beta, gamma
+
+
+def _as_array(x):
+    return np.asarray(x, dtype=np.float64)
+
+
+def tick_rule(close):
+    """
+    Causal tick rule: sign of price change, previous sign if price did not change.
+
+    :param close: (np.array) close prices
+    :return: (np.array) trade signs
+    """
+    return _tick_rule(_as_array(close))
+
+
+def roll_measure(close, windows):
+    """
+    Roll measure, 2 * sqrt(|cov(dp_t, dp_t-1)|), for every window.
+
+    :param close: (np.array) close prices
+    :param windows: (list) window lengths
+    :return: (np.array) matrix with one column for every window
+    """
+    close = _as_array(close)
+    diff = np.full(close.shape[0], np.nan)
+    diff[1:] = np.diff(close)
+    diff_lag = np.full(close.shape[0], np.nan)
+    diff_lag[1:] = diff[:-1]
+    cov = _rolling_cov(diff, diff_lag, np.asarray(windows, dtype=np.int64))
+    return 2 * np.sqrt(np.abs(cov))
+
+
+def corwin_schultz_estimator(high, low, windows):
+    """
+    Corwin-Schultz spread estimator for every window.
+
+    :param high: (np.array) high prices
+    :param low: (np.array) low prices
+    :param windows: (list) window lengths
+    :return: (np.array) matrix with one column for every window
+    """
+    beta, gamma = _beta_gamma(_as_array(high), _as_array(low))
+    beta = _rolling_mean(beta, np.asarray(windows, dtype=np.int64))
+    gamma = gamma[:, None]
+    den = 3 - 2 * 2 ** .5
+    alpha = (2 ** .5 - 1) * (beta ** .5) / den
+    alpha -= (gamma / den) ** .5
+    alpha[alpha < 0] = 0
+    return 2 * (np.exp(alpha) - 1) / (1 + np.exp(alpha))
+
+
+def bekker_parkinson_vol(high, low, windows):
+    """
+    Bekker-Parkinson volatility for every window.
+
+    :param high: (np.array) high prices
+    :param low: (np.array) low prices
+    :param windows: (list) window lengths
+    :return: (np.array) matrix with one column for every window
+    """
+    beta, gamma = _beta_gamma(_as_array(high), _as_array(low))
+    beta = _rolling_mean(beta, np.asarray(windows, dtype=np.int64))
+    gamma = gamma[:, None]
+    k2 = (8 / np.pi) ** 0.5
+    den = 3 - 2 * 2 ** .5
+    sigma = (2 ** -0.5 - 1) * beta ** 0.5 / (k2 * den)
+    sigma += (gamma / (k2 ** 2 * den)) ** 0.5
+    sigma[sigma < 0] = 0
+    return sigma
+
+
+def bar_based_kyle_lambda(close, volume, windows):
+    """
+    Kyle lambda from bars, rolling mean of dp_t / (b_t * V_t), for every window.
+
+    :param close: (np.array) close prices
+    :param volume: (np.array) volume
+    :param windows: (list) window lengths
+    :return: (np.array) matrix with one column for every window
+    """
+    close = _as_array(close)
+    diff = np.full(close.shape[0], np.nan)
+    diff[1:] = np.diff(close)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        values = diff / (_as_array(volume) * _tick_rule(close))
+    return _rolling_mean(values, np.asarray(windows, dtype=np.int64))
+
+
+def bar_based_amihud_lambda(close, dollar_volume, windows):
+    """
+    Amihud lambda from bars, rolling mean of |log return| / dollar volume, for every window.
+
+    :param close: (np.array) close prices
+    :param dollar_volume: (np.array) dollar volume
+    :param windows: (list) window lengths
+    :return: (np.array) matrix with one column for every window
+    """
+    close = _as_array(close)
+    returns = np.full(close.shape[0], np.nan)
+    returns[1:] = np.log(close[1:] / close[:-1])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        values = np.abs(returns) / _as_array(dollar_volume)
+    return _rolling_mean(values, np.asarray(windows, dtype=np.int64))
+
+
+def bar_based_hasbrouck_lambda(close, dollar_volume, windows):
+    """
+    Hasbrouck lambda from bars, rolling mean of log return / (b_t * sqrt(dollar volume)),
+    for every window.
+
+    :param close: (np.array) close prices
+    :param dollar_volume: (np.array) dollar volume
+    :param windows: (list) window lengths
+    :return: (np.array) matrix with one column for every window
+    """
+    close = _as_array(close)
+    returns = np.full(close.shape[0], np.nan)
+    returns[1:] = np.log(close[1:] / close[:-1])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        values = returns / (_tick_rule(close) * np.sqrt(_as_array(dollar_volume)))
+    return _rolling_mean(values, np.asarray(windows, dtype=np.int64))
+
+
+def add_microstructural_features(data, windows=[20, 100]):
+    """
+    Add microstructural features for every window to OHLCV data frame.
+    Dollar volume is close * volume.
+
+    :param data: (pd.DataFrame) OHLCV data
+    :param windows: (list) window lengths
+    :return: (pd.DataFrame) data with microstructural features
+    """
+    close = data['close'].values
+    dollar_volume = close * data['volume'].values
+    estimators = [
+        ('roll_measure', roll_measure(close, windows)),
+        ('corwin_schultz_est', corwin_schultz_estimator(data['high'].values, data['low'].values, windows)),
+        ('bekker_parkinson_vol', bekker_parkinson_vol(data['high'].values, data['low'].values, windows)),
+        ('kyle_lambda', bar_based_kyle_lambda(close, data['volume'].values, windows)),
+        ('amihud_lambda', bar_based_amihud_lambda(close, dollar_volume, windows)),
+        ('hasbrouck_lambda', bar_based_hasbrouck_lambda(close, dollar_volume, windows)),
+    ]
+    features = [pd.DataFrame(values, index=data.index, columns=[name + '_' + str(w) for w in windows])
+                for name, values in estimators]
+    features.append(pd.DataFrame({'tick_rule': tick_rule(close)}, index=data.index))
+
+    return pd.concat([data] + features, axis=1)
@@ -1,9 +1,32 @@
 import pandas as pd
 import numpy as np
+from numba import njit
 from sklearn.base import BaseEstimator, TransformerMixin
 from trademl.modeling.utils import time_method
 
 
+@njit
+def _diff_median_mask(prices, day_position, thresholds):
+    """
+    Keep bar if absolute difference of every price to previous bar is smaller
+    than threshold of its day. First bar and bars without threshold are removed.
+    """
+    n, k = prices.shape
+    mask = np.zeros(n, dtype=np.bool_)
+    for i in range(1, n):
+        day = day_position[i]
+        if day < 0:
+            continue
+        keep = True
+        for j in range(k):
+            # NaN comparisons are False, as in pandas
+            if not abs(prices[i, j] - prices[i - 1, j]) < thresholds[day, j]:
+                keep = False
+                break
+        mask[i] = keep
+    return mask
+
+
 def remove_ourlier_diff_median(data, median_scaler=25):
     """
     Remove outliers by removing observations where differene is grater than
@@ -12,17 +35,22 @@ def remove_ourlier_diff_median(data, median_scaler=25):
     :param data: (pd.DataFrame) with ohlc data
     :return: (pd.DataFrame) with removed outliers
     """
-    daily_diff = (data.resample('D').last().dropna().diff().abs() + 0.05) * median_scaler
-    daily_diff['diff_date'] = daily_diff.index.strftime('%Y-%m-%d')
-    data_test = data.diff()
-    data_test['diff_date'] = data_test.index.strftime('%Y-%m-%d')
-    data_test_diff = pd.merge(data_test, daily_diff, on='diff_date')
-    indexer = ((np.abs(data_test_diff['close_x']) < np.abs(data_test_diff['close_y'])) &
-            (np.abs(data_test_diff['open_x']) < np.abs(data_test_diff['open_y'])) &
-            (np.abs(data_test_diff['high_x']) < np.abs(data_test_diff['high_y'])) & 
-            (np.abs(data_test_diff['low_x']) < np.abs(data_test_diff['low_y'])))
-    # indexer = (indexer | data_test_diff['close_y'].isna())
-    data_final = data.loc[indexer.values, :]
+    columns = ['close', 'open', 'high', 'low']
+    index = data.index.tz_localize(None) if data.index.tz is not None else data.index
+    days = index.values.astype('datetime64[D]').astype(np.int64)
+
+    # daily thresholds from last bar of every day with data
+    daily = data[columns].groupby(days).last().dropna()
+    thresholds = (daily.diff().abs() + 0.05) * median_scaler
+
+    # position of every bar's day in thresholds, -1 if day has no threshold
+    day_position = np.searchsorted(thresholds.index.values, days)
+    day_position[day_position == thresholds.shape[0]] = 0
+    day_position[thresholds.index.values[day_position] != days] = -1
+
+    mask = _diff_median_mask(data[columns].values.astype(np.float64),
+                             day_position, thresholds.values)
+    data_final = data.loc[mask, :]
     
     return data_final
 
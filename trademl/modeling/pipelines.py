@@ -1,22 +1,136 @@
 import numpy as np 
 import pandas as pd
-from numba import njit
+from numba import njit, prange
 from sklearn.base import BaseEstimator, TransformerMixin
 from sklearn.pipeline import Pipeline
 import mlfinlab as ml
 from trademl.modeling.utils import time_method
 
 
+@njit
+def _daily_vol_cusum(times, close, span, day, threshold, vol_scaler):  # pragma: no cover
+    """
+    Single pass over close prices that calculates daily volatility (EWM std of
+    daily returns, as mlfinlab get_daily_vol) and symmetric CUSUM events.
+
+    :param times: (np.array) bar times as int64 nanoseconds
+    :param close: (np.array) close prices
+    :param span: (int) span of EWM std
+    :param day: (int) one day in nanoseconds
+    :param threshold: (np.array) CUSUM threshold for every bar
+    :param vol_scaler: (float) if positive, CUSUM threshold is daily volatility times vol_scaler
+    :return: (np.array, int, np.array) daily volatility, index of first daily return and indecies of CUSUM events
+    """
+    n = close.shape[0]
+    vol = np.full(n, np.nan)
+    events = np.empty(n, dtype=np.int64)
+    n_events = 0
+    first = n
+
+    # EWM covariance state (pandas ewmcov with adjust=True, bias=False)
+    alpha = 2. / (span + 1.)
+    old_wt_factor = 1. - alpha
+    mean = 0.
+    cov = 0.
+    sum_wt = 1.
+    sum_wt2 = 1.
+    old_wt = 1.
+
+    # CUSUM state
+    s_pos = 0.
+    s_neg = 0.
+
+    j = 0
+    for i in range(n):
+        # daily return, first bar at or after t - 1 day is j, so use j - 1
+        while j < n and times[j] < times[i] - day:
+            j += 1
+        if j > 0:
+            ret = close[i] / close[j - 1] - 1
+            if first == n:
+                first = i
+                mean = ret
+            else:
+                sum_wt *= old_wt_factor
+                sum_wt2 *= old_wt_factor * old_wt_factor
+                old_wt *= old_wt_factor
+                old_mean = mean
+                if mean != ret:
+                    mean = (old_wt * old_mean + ret) / (old_wt + 1.)
+                cov = (old_wt * (cov + (old_mean - mean) ** 2) + (ret - mean) ** 2) / (old_wt + 1.)
+                sum_wt += 1.
+                sum_wt2 += 1.
+                old_wt += 1.
+                denominator = sum_wt * sum_wt - sum_wt2
+                if denominator > 0:
+                    vol[i] = np.sqrt(max(sum_wt * sum_wt / denominator * cov, 0.))
+
+        # symmetric CUSUM filter on log returns
+        if i > 0:
+            thresh = vol[i] * vol_scaler if vol_scaler > 0 else threshold[i]
+            log_ret = np.log(close[i]) - np.log(close[i - 1])
+            s_pos = max(0., s_pos + log_ret)
+            s_neg = min(0., s_neg + log_ret)
+            if s_neg < -thresh:
+                s_neg = 0.
+                events[n_events] = i
+                n_events += 1
+            elif s_pos > thresh:
+                s_pos = 0.
+                events[n_events] = i
+                n_events += 1
+
+    return vol, first, events[:n_events]
+
+
+def daily_vol_cusum(close, lookback=50, threshold=None, volatility_scaler=1):
+    """
+    Compiled replacement for ml.util.get_daily_vol followed by
+    ml.filters.cusum_filter.
+
+    :param close: (pd.Series) close prices with DatetimeIndex
+    :param lookback: (int) span of EWM std of daily returns
+    :param threshold: (None, str, float or pd.Series) CUSUM threshold. None uses daily_vol.mean() * volatility_scaler
+        (as before), 'volatility' uses time varying daily_vol * volatility_scaler calculated in the same pass,
+        float or pd.Series are used as they are
+    :param volatility_scaler: (float) multiplier of daily volatility
+    :return: (pd.Series, pd.DatetimeIndex) daily volatility and timestamps of CUSUM events
+    """
+    times = close.index.values.astype('datetime64[ns]').view(np.int64)
+    values = close.values.astype(np.float64)
+    day = np.int64(24 * 60 * 60 * 10**9)
+    vol_scaler = 0.
+    if threshold is None:
+        thresholds = np.full(values.shape[0], np.nan)
+    elif isinstance(threshold, str) and threshold == 'volatility':
+        thresholds = np.full(values.shape[0], np.nan)
+        vol_scaler = float(volatility_scaler)
+    elif isinstance(threshold, pd.Series):
+        thresholds = threshold.reindex(close.index).values.astype(np.float64)
+    else:
+        thresholds = np.full(values.shape[0], float(threshold))
+
+    vol, first, events = _daily_vol_cusum(times, values, lookback, day, thresholds, vol_scaler)
+    daily_vol = pd.Series(vol, index=close.index).iloc[first:]
+
+    # threshold depends on the whole volatility series, second pass
+    if threshold is None:
+        thresholds = np.full(values.shape[0], daily_vol.mean() * volatility_scaler)
+        _, _, events = _daily_vol_cusum(times, values, lookback, day, thresholds, 0.)
+
+    return daily_vol, close.index[events]
+
 
 class TripleBarierLabeling(BaseEstimator, TransformerMixin):
 
     def __init__(self, volatility_lookback=50,
                  volatility_scaler=1, triplebar_num_days=5,
                  triplebar_pt_sl=[1, 1], triplebar_min_ret=0.003,
-                 num_threads=1, tb_min_pct=0.05):
+                 num_threads=1, tb_min_pct=0.05, cusum_threshold=None):
         # hyperparameters for all functions
         self.volatility_lookback = volatility_lookback
         self.volatility_scaler = volatility_scaler
+        self.cusum_threshold = cusum_threshold
         self.triplebar_num_days = triplebar_num_days
         self.triplebar_pt_sl = triplebar_pt_sl
         self.triplebar_min_ret = triplebar_min_ret
@@ -28,15 +142,12 @@ class TripleBarierLabeling(BaseEstimator, TransformerMixin):
         # extract close series
         close = X['close']
         
-        # Compute volatility
-        daily_vol = ml.util.get_daily_vol(
-            close,
-            lookback=self.volatility_lookback)
-        
-        # Apply Symmetric CUSUM Filter and get timestamps for events
-        cusum_events = ml.filters.cusum_filter(
+        # Compute volatility and apply Symmetric CUSUM Filter
+        daily_vol, cusum_events = daily_vol_cusum(
             close,
-            threshold=daily_vol.mean()*self.volatility_scaler)
+            lookback=self.volatility_lookback,
+            threshold=self.cusum_threshold,
+            volatility_scaler=self.volatility_scaler)
         
         # Compute vertical barrier
         vertical_barriers = ml.labeling.add_vertical_barrier(
@@ -87,6 +198,188 @@ class OutlierStdRemove(BaseEstimator, TransformerMixin):
         return X
 
 
+@njit(parallel=True)
+def _mad_outliers(values, center, scale, threshold):  # pragma: no cover
+    """
+    Outliers with |x - center| > threshold * scale, columns in parallel.
+    Columns with zero scale have no outliers.
+    """
+    n, k = values.shape
+    outliers = np.zeros((n, k), dtype=np.bool_)
+    for j in prange(k):
+        if not scale[j] > 0:
+            continue
+        for i in range(n):
+            if abs(values[i, j] - center[j]) > threshold * scale[j]:
+                outliers[i, j] = True
+    return outliers
+
+
+@njit(parallel=True)
+def _rolling_zscore_outliers(values, start, window, threshold):  # pragma: no cover
+    """
+    Outliers with |x - mean| > threshold * std, where mean and std are
+    calculated from finite values of previous window rows, columns in parallel.
+    Rows before start are tail of previous data and are not checked. Outliers
+    are set to NaN in values, so they do not enter statistics of later rows.
+    """
+    n, k = values.shape
+    outliers = np.zeros((n - start, k), dtype=np.bool_)
+    for j in prange(k):
+        # shift by first finite value to reduce cancellation in sums of squares
+        ref = 0.
+        for i in range(n):
+            if np.isfinite(values[i, j]):
+                ref = values[i, j]
+                break
+        total = 0.
+        total_sq = 0.
+        count = 0
+        for i in range(n):
+            x = values[i, j] - ref
+            if i >= start and count >= 2 and np.isfinite(x):
+                mean = total / count
+                var = (total_sq - total * total / count) / (count - 1)
+                if var > 0 and abs(x - mean) > threshold * np.sqrt(var):
+                    outliers[i - start, j] = True
+                    values[i, j] = np.nan
+                    x = np.nan
+            if np.isfinite(x):
+                total += x
+                total_sq += x * x
+                count += 1
+            if i >= window:
+                old = values[i - window, j] - ref
+                if np.isfinite(old):
+                    total -= old
+                    total_sq -= old * old
+                    count -= 1
+    return outliers
+
+
+class RobustOutlierRemove(BaseEstimator, TransformerMixin):
+    """
+    Remove rows with outlier in any column, without look-ahead.
+
+    method='mad': |x - median| > threshold * 1.4826 * MAD, median and MAD of
+    every column are fitted on training data and reused on test and live data.
+    method='rolling': |x - mean| > threshold * std, mean and std of previous
+    window rows without outliers. Last window rows of fitted data are kept,
+    with outliers as NaN, so test data continues the rolling window of
+    training data.
+
+    Columns are checked in parallel and frames in chunks of rows, so only one
+    chunk is copied to float array at a time.
+
+    :param threshold: (float) robust z-score threshold
+    :param method: (str) 'mad' or 'rolling'
+    :param window: (int) rolling window for 'rolling' method
+    :param columns: (list) columns checked for outliers, all numeric columns if None
+    :param chunksize: (int) number of rows in one chunk
+    """
+
+    def __init__(self, threshold=10, method='mad', window=1000, columns=None, chunksize=1000000):
+        self.threshold = threshold
+        self.method = method
+        self.window = window
+        self.columns = columns
+        self.chunksize = chunksize
+
+    def _fit_columns(self, X):
+        if self.method not in ['mad', 'rolling']:
+            raise ValueError("method must be 'mad' or 'rolling'")
+        if self.columns is not None:
+            self.columns_ = list(self.columns)
+        else:
+            self.columns_ = list(X.select_dtypes(include=np.number).columns)
+
+    def fit(self, X, y=None):
+        self._fit_columns(X)
+        if self.method == 'mad':
+            # one column at a time, frame is not copied
+            center = []
+            scale = []
+            for col in self.columns_:
+                values = X[col].to_numpy(dtype=np.float64)
+                median = np.nanmedian(values)
+                center.append(median)
+                scale.append(1.4826 * np.nanmedian(np.abs(values - median)))
+            self.center_ = np.array(center)
+            self.scale_ = np.array(scale)
+        else:
+            # outliers of training data are removed from the window
+            _, self.tail_ = self._masks(X, self._empty_tail())
+        return self
+
+    def partial_fit(self, X, y=None):
+        """
+        Continue rolling window with new data, e.g. live bars after they are
+        transformed. MAD statistics stay as fitted.
+        """
+        if not hasattr(self, 'columns_'):
+            return self.fit(X)
+        if self.method == 'rolling':
+            _, self.tail_ = self._masks(X, self.tail_)
+        return self
+
+    def _empty_tail(self):
+        return np.empty((0, len(self.columns_)))
+
+    def _mask(self, values, tail):
+        """
+        :return: (np.array, np.array) mask of rows without outliers and
+            rolling tail after values, outliers in tail are NaN
+        """
+        if self.method == 'mad':
+            outliers = _mad_outliers(values, self.center_, self.scale_, self.threshold)
+            return ~outliers.any(axis=1), tail
+        window = np.vstack([tail, values])
+        outliers = _rolling_zscore_outliers(window, tail.shape[0], self.window, self.threshold)
+        return ~outliers.any(axis=1), window[-self.window:]
+
+    def _masks(self, X, tail):
+        masks = []
+        for start in range(0, X.shape[0], self.chunksize):
+            values = X.iloc[start:start + self.chunksize][self.columns_].to_numpy(dtype=np.float64)
+            mask, tail = self._mask(values, tail)
+            masks.append(mask)
+        mask = np.concatenate(masks) if masks else np.zeros(0, dtype=np.bool_)
+        return mask, tail
+
+    def _filter(self, X, tail):
+        mask, tail = self._masks(X, tail)
+        print(f"Robust outlier removal removed {(~mask).sum()} of {mask.shape[0]} rows")
+        return X.loc[mask], tail
+
+    def fit_transform(self, X, y=None):
+        # rolling window of training data starts without tail
+        if self.method == 'rolling':
+            self._fit_columns(X)
+            X, self.tail_ = self._filter(X, self._empty_tail())
+            return X
+        self.fit(X)
+        return self._filter(X, self._empty_tail())[0]
+
+    @time_method
+    def transform(self, X, y=None):
+        tail = self.tail_ if self.method == 'rolling' else self._empty_tail()
+        return self._filter(X, tail)[0]
+
+    def transform_chunks(self, chunks):
+        """
+        Filter data larger than memory chunk by chunk, e.g. from
+        pd.read_csv(path, chunksize=...) or FeatureStore partitions. Rolling
+        window continues across chunks.
+
+        :param chunks: (iterable) data frames in time order
+        :return: (generator) filtered data frames
+        """
+        tail = self.tail_ if self.method == 'rolling' else self._empty_tail()
+        for chunk in chunks:
+            mask, tail = self._mask(chunk[self.columns_].to_numpy(dtype=np.float64), tail)
+            yield chunk.loc[mask]
+
+
 @njit
 def calculate_t_values(subset, min_sample_length, step):  # pragma: no cover
     """
@@ -197,9 +490,10 @@ class TrendScanning(BaseEstimator, TransformerMixin):
 
     def __init__(self, volatility_lookback=50,
                  volatility_scaler=1, ts_look_forward_window=20, # 4800,  # 60 * 8 * 10 (10 days)
-                 ts_min_sample_length=5, ts_step=1):
+                 ts_min_sample_length=5, ts_step=1, cusum_threshold=None):
         self.volatility_lookback = volatility_lookback
         self.volatility_scaler = volatility_scaler
+        self.cusum_threshold = cusum_threshold
         self.ts_look_forward_window = ts_look_forward_window
         self.ts_min_sample_length = ts_min_sample_length
         self.ts_step = ts_step
@@ -210,14 +504,12 @@ class TrendScanning(BaseEstimator, TransformerMixin):
         # extract close series
         close = X['close']
 
-        # Compute volatility
-        daily_vol = ml.util.get_daily_vol(
+        # Compute volatility and apply Symmetric CUSUM Filter
+        daily_vol, cusum_events = daily_vol_cusum(
             close,
-            lookback=self.volatility_lookback)
-
-        # Apply Symmetric CUSUM Filter and get timestamps for events
-        cusum_events = ml.filters.cusum_filter(close,
-            threshold=daily_vol.mean()*self.volatility_scaler)
+            lookback=self.volatility_lookback,
+            threshold=self.cusum_threshold,
+            volatility_scaler=self.volatility_scaler)
 
         # get trend scanning labels
         trend_scanning = trend_scanning_labels(
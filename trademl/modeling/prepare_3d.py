@@ -1,5 +1,6 @@
 from pathlib import Path
 import os
+import pickle
 import sys
 import numpy as np
 import pandas as pd
@@ -11,15 +12,13 @@ from sklearn import preprocessing
 from sklearn.model_selection import train_test_split
 from sklearn.pipeline import make_pipeline
 import mlfinlab as ml
-from mlfinlab.feature_importance import get_orthogonal_features
 import trademl as tml
 import tensorflow as tf
 from tensorflow import keras
 from tensorflow.keras import layers
 import statsmodels.api as sm
 from pycaret.preprocess import Zroe_NearZero_Variance, Fix_multicollinearity
-from trademl.modeling.structural_breaks import ChowStructuralBreakSubsample
-from trademl.modeling.stationarity import StationarityMethod
+from trademl.modeling.memory import memory_stage
 from tensorboardX import SummaryWriter
 from datetime import datetime
 
@@ -51,6 +50,9 @@ ts_min_sample_length = 30
 ts_step = 5
 tb_min_pct = 0.05
 w = 0.15
+fh_horizons = [1, 2, 5, 10, 20, 30, 60]
+fh_threshold = 0.005
+label = 'day_1'
 # filtering
 tb_volatility_lookback = 10
 tb_volatility_scaler = 1
@@ -60,34 +62,38 @@ train_test_split_ratio = 0.25
 # feature engineering
 choose_features = ['close']
 correlation_threshold = 0.95
+correlation_max_rows = 500000  # correlations on time ordered subsample, all rows if None
 dim_reduction = 'none'
 # scaling
 scaling = 'expanding_mean'
 # performance
 num_threads = 1
+float32_features = True  # keep features in float32, prices and accumulators in float64
 # sequence generation
 train_val_index_split = 0.9
-
-
-# Import data
-file_name = contract + '_clean'
-data = pd.read_hdf(os.path.join(Path(input_data_path), file_name + '.h5'), file_name)
-data.sort_index(inplace=True)
-
-
-# Choose columns
-if 'close' not in choose_features:
-    sys.exit("Data must have close column")
-data = data[choose_features]
-
-
-# Remove constant columns
-data = data.loc[:, data.apply(pd.Series.nunique) != 1]
+prepare_cache_dir = None  # stage cache shared by runs, PREPARE_CACHE or ~/.trademl/prepare_cache if None
+prepare_cache_bytes = None  # LRU byte budget of cache, PREPARE_CACHE_BYTES or 20 GB if None, 0 for no limit
+
+
+# Prepare stages, stages with unchanged parameters are loaded from cache.
+# Outputs are pickled to prepare_cache_dir/<stage>/<key>.pkl; remove the
+# folder or call dag.clear() to free space at once.
+memory_report = {}
+params = {name: globals()[name] for name in tml.modeling.prepare_dag.PREPARE_PARAMS}
+# rolling statistics, test set continues rolling window of train set
+params['scaling'] = {'expanding': 'rolling', 'expanding_mean': 'rolling_mean'}.get(scaling, scaling)
+dag = tml.modeling.prepare_dag.build_prepare_dag(
+    cache_dir=prepare_cache_dir, memory_report=memory_report, sequences=True,
+    max_cache_bytes=prepare_cache_bytes)
+results = dag.run(params, targets=['select', 'stationarity', 'labels', 'screen', 'dim_reduction'])
+data = results['stationarity']
+Y = results['labels'][1]
+X_train, X_test, y_train, y_test = results['dim_reduction']
 
 
 # Choose sequence length
-pacf = sm.tsa.stattools.pacf(data['close'], nlags=200)
-sig_test = lambda tau_h: np.abs(tau_h) > 2.58/np.sqrt(len(data))
+pacf = sm.tsa.stattools.pacf(results['select']['close'], nlags=200)
+sig_test = lambda tau_h: np.abs(tau_h) > 2.58/np.sqrt(len(results['select']))
 for i in range(len(pacf)):
     if sig_test(pacf[i]) == False:
         time_step_length = i - 1
@@ -95,19 +101,6 @@ for i in range(len(pacf)):
         break
 time_step_length = 5 if time_step_length < 5 else time_step_length
 
-# Choose subsamples, stationarity method and make labels
-pipe = make_pipeline(
-    ChowStructuralBreakSubsample(min_length=10) if chow_subsample else None,
-    StationarityMethod(stationarity_method=stationarity),
-    )
-data = pipe.fit_transform(data)
-
-
-# categorical variables
-categorial_features = ['tick_rule', 'HT_TRENDMODE', 'volume_vix']
-categorial_features = [col for col in categorial_features if col in data.columns]
-data = data.drop(columns=categorial_features)  # remove for now
-
 
 # filtering
 if filtering == 'cusum':
@@ -118,186 +111,33 @@ if filtering == 'cusum':
 else:
     cusum_events = data.index
 
-# Labeling_
-if labeling_technique == 'tl':
-    labeling_info = tml.modeling.labeling.trend_labeling(
-        close=data['close'].to_list(),
-        time=data.index.to_list(),
-        w=w)
-    labeling_info = pd.DataFrame(labeling_info, index=data.index, columns=['bin'])
-    labeling_info['t1'] = np.nan
-    labeling_info['ret'] = np.nan
-    labeling_info['trgt'] = np.nan
-if labeling_technique == 'tb':
-    triple_barrier_pipe= tml.modeling.pipelines.TripleBarierLabeling(
-        volatility_lookback=tb_volatility_lookback,
-        volatility_scaler=tb_volatility_scaler,
-        triplebar_num_days=tb_triplebar_num_days,
-        triplebar_pt_sl=tb_triplebar_pt_sl,
-        triplebar_min_ret=tb_triplebar_min_ret,
-        num_threads=num_threads,
-        tb_min_pct=tb_min_pct
-    )   
-    tb_fit = triple_barrier_pipe.fit(data)
-    labeling_info = tb_fit.triple_barrier_info
-    X = tb_fit.transform(data)
-elif labeling_technique == 'ts':
-    trend_scanning_pipe = tml.modeling.pipelines.TrendScanning(
-        volatility_lookback=tb_volatility_lookback,
-        volatility_scaler=tb_volatility_scaler,
-        ts_look_forward_window=ts_look_forward_window,
-        ts_min_sample_length=ts_min_sample_length,
-        ts_step=ts_step
-        )
-    labeling_info = trend_scanning_pipe.fit(data)
-    X = trend_scanning_pipe.transform(data)
-elif labeling_technique == 'fixed_horizon':
-    X = data.copy()
-    labeling_info = ml.labeling.fixed_time_horizon(data['orig_close'], threshold=0.005, resample_by='B').dropna().to_frame()
-    labeling_info = labeling_info.rename(columns={'orig_close': 'bin'})
-    print(labeling_info.iloc[:, 0].value_counts())
-    X = X.iloc[:-1, :]
-
-
-# choose X and Y
-X = data.copy()
-Y = labeling_info.copy()
-
-# Remove NA
-remove_na_rows = Y['bin'].isna()
-X = X.loc[~remove_na_rows, :]
-Y = Y.loc[~remove_na_rows]
-Y.loc[:, 'bin'] = np.where(Y.loc[:, 'bin'] == -1, 0, Y.loc[:, 'bin'])
-
-
-# Removing large values (TA issue - causes model problems / overflow)
-X = X.loc[:, ~X.apply(lambda x: any((x >= 1e12) | (x <= -1e12)), axis=0)]
-
-
-# Remove correlated assets
-msg = f'Shape before removing correlated features with threshold {correlation_threshold}' \
-      f' is {X.shape} and after is'
-print(msg)
-X = tml.modeling.preprocessing.remove_correlated_columns(
-    data=X,
-    columns_ignore=['close'],
-    threshold=correlation_threshold)
-print(X.shape)
-
-
-# Train test split
-X_train, X_test, y_train, y_test = train_test_split(
-    X, Y.loc[:, Y.columns.str.contains('bin')],
-    test_size=train_test_split_ratio, shuffle=False, stratify=None)
-
-
-##### GENETICS INDICATORS
-# x = y_train.squeeze()
-# x.value_counts()
-# add genetics indicators
-# if dim_reduction == 'gplearn':
-#     gen = tml.modeling.features.Genetic()
-#     gen.fit(X_train, y_train)
-    
-#     test = X.predict(X_test)
-##### GENETICS INDICATORS
-
-
-# Scaling
-def scale_expanding(X_train, y_train, X_test, y_test, expand_function):
-    X_train = X_train.apply(expand_function)
-    X_test = X_test.apply(expand_function)
-    y_train = y_train.loc[~X_train.isna().any(axis=1)]
-    X_train = X_train.dropna()
-    y_test = y_test.loc[~X_test.isna().any(axis=1)]
-    X_test = X_test.dropna()
-
-    return X_train, y_train, X_test, y_test
-
-
-if scaling == 'expanding':
-    f = lambda x: (x - x.rolling(tb_volatility_lookback).mean()) / x.rolling(tb_volatility_lookback).std()
-    X_train, y_train, X_test, y_test = scale_expanding(
-        X_train, y_train, X_test, y_test, f)    
-elif scaling == 'expanding_mean':
-    f = lambda x: (x - x.rolling(tb_volatility_lookback).mean())
-    X_train, y_train, X_test, y_test = scale_expanding(
-        X_train, y_train, X_test, y_test, f)    
-
-
-# Dimensionality reduction
-if dim_reduction == 'pca':
-    if scaling == 'none':
-        X_train = pd.DataFrame(preprocessing.scale(X_train), columns=X_train.columns)
-        X_test = pd.DataFrame(preprocessing.scale(X_test), columns=X_test.columns)
-    X_train = pd.DataFrame(
-        get_orthogonal_features(X_train),
-        index=X_train.index).add_prefix("PCA_")
-    pca_n_compenents = X_train.shape[1]
-    X_test = pd.DataFrame(
-        get_orthogonal_features(X_test,
-                                num_features=pca_n_compenents),
-        index=X_test.index).add_prefix("PCA_")
-    X_train.index = y_train.index
-    X_test.index = y_test.index
-# elif dim_reduction == 'gplearn':
-#     gen = Genetic()
-#     X = gen.fit_transform(X, labeling_info.loc[:, labeling_info.columns.str.contains('bin')])
-
-
-# Add close if it does not exists, needed for later
-if 'close' not in X_train.columns:
-    X_train = X_train.join(X['close'], how='left')
-    X_test = X_test.join(X['close'], how='left')
-
 
 # Save column names and Y
+# column screen drops the same columns at inference
+with open('column_screen.pkl', 'wb') as f:
+    pickle.dump(results['screen'][1], f)
 pd.Series(X_train.columns).to_csv('col_names.csv')
 Y.to_pickle('Y.pkl')
 
 
 # Make 3D sequences from matrix
-def sequence_from_array(data, target_vec, cusum_events, time_step_length):
-    cusum_events_ = cusum_events.intersection(data.index)
-    lstm_sequences = []
-    targets = []
-    for date in cusum_events_:
-        observation = data[:date].iloc[-time_step_length:]
-        if observation.shape[0] < time_step_length or data.index[-1] < date:
-            next
-        else:
-            d3 = observation.values.reshape((1, observation.shape[0], observation.shape[1]))
-            lstm_sequences.append(d3)
-            targets.append(target_vec[target_vec.index == date])
-    lstm_sequences_all = np.vstack(lstm_sequences)
-    targets = np.vstack(targets)
-    targets = targets.astype(np.int64)
-    return lstm_sequences_all, targets
-
-
-# example
-X_val, y_val = sequence_from_array(
-    X_train.iloc[int((train_val_index_split*X_train.shape[0] + 1)):],
-    y_train.iloc[int((train_val_index_split*X_train.shape[0] + 1)):],
-    cusum_events, time_step_length)
-X_train, y_train = sequence_from_array(
-    X_train.iloc[:int(train_val_index_split*X_train.shape[0])],
-    y_train.iloc[:int(train_val_index_split*X_train.shape[0])],
-    cusum_events, time_step_length)
-X_test, y_test = sequence_from_array(X_test, y_test, cusum_events, time_step_length)
-
-
-# test for shapes
-print('X and y shape train: ', X_train.shape, y_train.shape)
-print('X and y shape validate: ', X_val.shape, y_val.shape)
-print('X and y shape test: ', X_test.shape, y_test.shape)
-
-
-# Save files
-# Save localy
-file_names = ['X_train', 'y_train', 'X_test', 'y_test', 'X_val', 'y_val']
-saved_files = [X_train, y_train, X_test, y_test, X_val, y_val]
-[np.save(name, obj) for name, obj in zip(file_names, saved_files)]
+train_val_split = int(train_val_index_split*X_train.shape[0])
+splits = {
+    'val': (X_train.iloc[int((train_val_index_split*X_train.shape[0] + 1)):],
+            y_train.iloc[int((train_val_index_split*X_train.shape[0] + 1)):]),
+    'train': (X_train.iloc[:train_val_split], y_train.iloc[:train_val_split]),
+    'test': (X_test, y_test)
+}
+# windows are taken on demand in training scripts
+with memory_stage('sequences', memory_report):
+    datasets = {name: tml.modeling.datasets.WindowedDataset.from_frame(
+                    X_split, y_split, cusum_events, time_step_length)
+                for name, (X_split, y_split) in splits.items()}
+for name, dataset in datasets.items():
+    print(f'X and y shape {name}: ', dataset.shape, dataset.targets.shape)
+print(pd.DataFrame(memory_report).T)
+for name, dataset in datasets.items():
+    dataset.save(name + '_seq')
 # Save to mfiles
 # if env_directory is not None:
 #     file_names = [f + '.npy' for f in file_names]
@@ -0,0 +1,595 @@
+'''
+PREPARE DAG
+
+Prepare step as graph of stages. Output of every stage is cached on disk
+under key calculated from stage code, source of modules the stage calls,
+stage parameters and keys of input stages, so a run that changes only
+downstream parameters (e.g. correlation_threshold or scaling) loads
+upstream stages from cache. Least recently used outputs are removed when
+cache grows over its byte budget.
+'''
+
+import os
+import json
+import glob
+import pickle
+import hashlib
+import inspect
+import importlib
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from sklearn.model_selection import train_test_split
+from sklearn.pipeline import make_pipeline
+from trademl.modeling.structural_breaks import ChowStructuralBreakSubsample
+from trademl.modeling.stationarity import StationarityMethod
+from trademl.modeling.labeling import trend_labeling, fixed_horizon_labels
+from trademl.modeling.pipelines import TripleBarierLabeling, TrendScanning
+from trademl.modeling.preprocessing import (
+    remove_correlated_columns, ExpandingScaler, RollingScaler, ColumnScreen)
+from trademl.modeling.dim_reduction import OrthogonalFeatures
+from trademl.modeling.memory import DtypePolicy, memory_stage
+
+
+# default hyperparameters of prepare scripts
+PREPARE_PARAMS = {
+    'contract': 'SPY_IB',
+    'input_data_path': 'D:/market_data/usa/ohlcv_features',
+    'float32_features': True,
+    'choose_features': ['close'],
+    'chow_subsample': None,
+    'stationarity': 'orig',
+    'labeling_technique': 'tl',
+    'tb_triplebar_num_days': 2,
+    'tb_triplebar_pt_sl': [1, 1],
+    'tb_triplebar_min_ret': 0.004,
+    'ts_look_forward_window': 1200,
+    'ts_min_sample_length': 30,
+    'ts_step': 5,
+    'tb_min_pct': 0.05,
+    'w': 0.15,
+    'fh_horizons': [1, 2, 5, 10, 20, 30, 60],
+    'fh_threshold': 0.005,
+    'label': 'day_1',
+    'tb_volatility_lookback': 50,
+    'tb_volatility_scaler': 1,
+    'num_threads': 1,
+    'correlation_threshold': 0.95,
+    'correlation_max_rows': 500000,
+    'train_test_split_ratio': 0.25,
+    'scaling': 'expanding',
+    'dim_reduction': 'none'
+}
+CATEGORIAL_FEATURES = ['tick_rule', 'HT_TRENDMODE', 'volume_vix']
+# increase to invalidate all cached stages, e.g. after library upgrade
+CACHE_VERSION = 1
+# byte budget of cache if PREPARE_CACHE_BYTES environment variable is not set
+DEFAULT_CACHE_BYTES = 20 * 2**30
+
+
+def default_cache_dir():
+    """
+    Cache folder shared by all runs, PREPARE_CACHE environment variable or
+    ~/.trademl/prepare_cache. Guild runs in separate folders, so relative
+    folder would not be shared.
+    """
+    return os.getenv('PREPARE_CACHE') or os.path.join(
+        os.path.expanduser('~'), '.trademl', 'prepare_cache')
+
+
+def default_cache_bytes():
+    """
+    Byte budget of cache, PREPARE_CACHE_BYTES environment variable or
+    DEFAULT_CACHE_BYTES.
+    """
+    return int(os.getenv('PREPARE_CACHE_BYTES') or DEFAULT_CACHE_BYTES)
+
+
+class Stage:
+    """
+    Stage of prepare DAG.
+
+    :param name: (str) stage name
+    :param function: (callable) called with outputs of input stages and
+        params, returns stage output
+    :param inputs: (list) names of input stages
+    :param params: (list or callable) names of parameters passed to function,
+        or function of all parameters returning the names
+    :param fingerprint: (callable) called with all parameters, returns JSON
+        serializable state of external input (e.g. size and modification
+        time of input file) added to stage key
+    :param modules: (list) names of modules stage function calls, their
+        source is part of stage key
+    """
+
+    def __init__(self, name, function, inputs=None, params=None, fingerprint=None, modules=None):
+        self.name = name
+        self.function = function
+        self.inputs = list(inputs) if inputs is not None else []
+        self.params = params if callable(params) else list(params) if params is not None else []
+        self.fingerprint = fingerprint
+        self.modules = list(modules) if modules is not None else []
+
+    def __repr__(self):
+        return 'Stage({} <- {})'.format(self.name, self.inputs)
+
+    def code(self):
+        """Source of stage function, function name if source is not available."""
+        try:
+            return inspect.getsource(self.function)
+        except (OSError, TypeError):
+            return getattr(self.function, '__module__', '') + '.' + \
+                getattr(self.function, '__qualname__', repr(self.function))
+
+    def modules_hash(self):
+        """sha256 of source files of called modules."""
+        digest = hashlib.sha256()
+        for name in self.modules:
+            with open(importlib.import_module(name).__file__, 'rb') as f:
+                digest.update(f.read())
+        return digest.hexdigest()
+
+    def param_names(self, params):
+        """
+        :param params: (dict) all parameters
+        :return: (list) names of parameters passed to function
+        """
+        return self.params(params) if callable(self.params) else self.params
+
+    def key(self, params, input_keys):
+        """
+        :param params: (dict) all parameters
+        :param input_keys: (list) keys of input stages
+        :return: (str) sha256 of stage code, stage parameters and input keys
+        """
+        content = {
+            'version': CACHE_VERSION,
+            'name': self.name,
+            'code': self.code(),
+            'modules': self.modules_hash(),
+            'params': {name: params[name] for name in self.param_names(params)},
+            'inputs': input_keys,
+            'fingerprint': self.fingerprint(params) if self.fingerprint is not None else None
+        }
+        content = json.dumps(content, sort_keys=True, default=str)
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+class PrepareDAG:
+    """
+    Stages with content addressed disk cache. Stage output is saved to
+    cache_dir/stage_name/key.pkl and loaded if key did not change. Inputs of
+    cached stages are not loaded. After every run, least recently used
+    outputs (by file mtime, refreshed on load) are removed until cache fits
+    max_cache_bytes; outputs of the last run are kept.
+
+    :param stages: (list) stages, inputs have to be added before stage
+    :param cache_dir: (str) cache folder, default_cache_dir() if None
+    :param memory_report: (dict) if not None, memory and time of calculated
+        stages are saved here by name
+    :param max_cache_bytes: (int) cache byte budget, default_cache_bytes() if
+        None, no pruning if 0
+    """
+
+    def __init__(self, stages=None, cache_dir=None, memory_report=None, max_cache_bytes=None):
+        self.stages = {}
+        self.cache_dir = cache_dir if cache_dir is not None else default_cache_dir()
+        self.memory_report = memory_report
+        self.max_cache_bytes = max_cache_bytes if max_cache_bytes is not None else default_cache_bytes()
+        for stage in stages or []:
+            self.add(stage)
+
+    def add(self, stage):
+        """
+        :param stage: (Stage) stage, its inputs have to be in DAG
+        :return: (Stage) added stage
+        """
+        for name in stage.inputs:
+            if name not in self.stages:
+                raise ValueError('Unknown input {} of {}'.format(name, repr(stage)))
+        self.stages[stage.name] = stage
+        return stage
+
+    def keys(self, params):
+        """
+        :param params: (dict) parameters, missing ones are taken from PREPARE_PARAMS
+        :return: (dict) key of every stage
+        """
+        params = {**PREPARE_PARAMS, **params}
+        keys = {}
+        for name, stage in self.stages.items():  # stages are in dependency order
+            keys[name] = stage.key(params, [keys[input_name] for input_name in stage.inputs])
+        return keys
+
+    def _path(self, name, key):
+        return os.path.join(self.cache_dir, name, key + '.pkl')
+
+    def _save(self, path, output):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + '.' + str(os.getpid()) + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(output, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)  # other runs never see partial file
+
+    def run(self, params, targets=None, use_cache=True):
+        """
+        Calculate targets, stages with unchanged keys are loaded from cache.
+
+        :param params: (dict) parameters, missing ones are taken from PREPARE_PARAMS
+        :param targets: (list) stage names, last stage if None
+        :param use_cache: (bool) if False, all stages are calculated and cache is overwritten
+        :return: (dict) outputs of targets by stage name
+        """
+        params = {**PREPARE_PARAMS, **params}
+        keys = self.keys(params)
+        targets = targets if targets is not None else [list(self.stages)[-1]]
+        outputs = {}
+
+        def get(name):
+            if name in outputs:
+                return outputs[name]
+            stage = self.stages[name]
+            path = self._path(name, keys[name])
+            if use_cache and os.path.exists(path):
+                with open(path, 'rb') as f:
+                    outputs[name] = pickle.load(f)
+                os.utime(path)  # mark as recently used for prune
+                print('%s: loaded from cache %s' % (name, keys[name][:12]))
+                return outputs[name]
+            inputs = [get(input_name) for input_name in stage.inputs]
+            with memory_stage(name, self.memory_report):
+                outputs[name] = stage.function(*inputs, **{p: params[p] for p in stage.param_names(params)})
+            self._save(path, outputs[name])
+            return outputs[name]
+
+        outputs = {name: get(name) for name in targets}
+        if self.max_cache_bytes:
+            self.prune(self.max_cache_bytes, keep=[self._path(name, key) for name, key in keys.items()])
+        return outputs
+
+    def cache_files(self):
+        """
+        :return: (list) (path, size in bytes, mtime) of cached outputs, oldest first
+        """
+        files = []
+        for path in glob.glob(os.path.join(self.cache_dir, '*', '*.pkl')):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:  # removed by other run
+                continue
+            files.append((path, stat.st_size, stat.st_mtime))
+        return sorted(files, key=lambda file: file[2])
+
+    def prune(self, max_bytes, keep=None):
+        """
+        Remove least recently used outputs until cache fits max_bytes.
+
+        :param max_bytes: (int) cache byte budget
+        :param keep: (list) paths that are never removed
+        :return: (int) removed bytes
+        """
+        keep = set(keep or [])
+        files = self.cache_files()
+        total = sum(size for _, size, _ in files)
+        removed = 0
+        for path, size, _ in files:
+            if total - removed <= max_bytes:
+                break
+            if path in keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            removed += size
+        if removed:
+            print('prepare cache: removed %.1f MB' % (removed / 2**20))
+        return removed
+
+    def clear(self, name=None):
+        """
+        Remove cached outputs.
+
+        :param name: (str) stage name, all stages if None
+        """
+        names = [name] if name is not None else list(self.stages)
+        for name in names:
+            folder = os.path.join(self.cache_dir, name)
+            if os.path.isdir(folder):
+                for file_name in os.listdir(folder):
+                    os.remove(os.path.join(folder, file_name))
+
+
+def _data_file(contract, input_data_path):
+    file_name = contract + '_clean'
+    return os.path.join(Path(input_data_path), file_name + '.h5'), file_name
+
+
+def _data_file_fingerprint(params):
+    path, _ = _data_file(params['contract'], params['input_data_path'])
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def load_data(contract, input_data_path, float32_features=True):
+    """
+    Import clean data of contract.
+
+    :param contract: (str) contract name, file is contract_clean.h5
+    :param input_data_path: (str) folder of HDF files
+    :param float32_features: (bool) keep features in float32, prices and
+        accumulators in float64
+    :return: (pd.DataFrame) sorted data
+    """
+    path, key = _data_file(contract, input_data_path)
+    data = pd.read_hdf(path, key)
+    data.sort_index(inplace=True)
+    return DtypePolicy(np.float32 if float32_features else np.float64).apply(data)
+
+
+def select_features(data, choose_features):
+    """
+    Choose columns and remove constant columns.
+
+    :param data: (pd.DataFrame) data
+    :param choose_features: (list) columns, must contain close
+    :return: (pd.DataFrame) chosen columns
+    """
+    if 'close' not in choose_features:
+        raise ValueError('Data must have close column')
+    return ColumnScreen(max_abs=None, drop_constant=True).fit_transform(data[choose_features])
+
+
+def make_stationary(data, chow_subsample=None, stationarity='orig'):
+    """
+    Choose subsample and stationarity method, remove categorical features.
+
+    :param data: (pd.DataFrame) data
+    :param chow_subsample: (bool) keep subsample after Chow structural break
+    :param stationarity: (str) stationarity method of StationarityMethod
+    :return: (pd.DataFrame) data
+    """
+    pipe = make_pipeline(
+        ChowStructuralBreakSubsample(min_length=10) if chow_subsample else None,
+        StationarityMethod(stationarity_method=stationarity),
+        )
+    data = pipe.fit_transform(data)
+    categorial_features = [col for col in CATEGORIAL_FEATURES if col in data.columns]
+    return data.drop(columns=categorial_features)  # remove for now
+
+
+def make_labels(data, labeling_technique='tl', tb_volatility_lookback=50, tb_volatility_scaler=1,
+                tb_triplebar_num_days=2, tb_triplebar_pt_sl=[1, 1], tb_triplebar_min_ret=0.004,
+                tb_min_pct=0.05, ts_look_forward_window=1200, ts_min_sample_length=30, ts_step=5,
+                w=0.15, fh_horizons=[1, 2, 5, 10, 20, 30, 60], fh_threshold=0.005, label='day_1',
+                num_threads=1, labeling_features=True):
+    """
+    Make labels and remove rows without label, -1 labels are mapped to 0.
+
+    :param data: (pd.DataFrame) data
+    :param labeling_technique: (str) tl is trend labeling, tb is triple-barrier,
+        ts is trend scanning and fixed_horizon are fixed horizon labels
+    :param labeling_features: (bool) use features returned by labeling
+        pipeline, all rows of data otherwise
+    :return: (pd.DataFrame, pd.DataFrame) features and labeling info
+    """
+    X = data
+    if labeling_technique == 'tl':
+        labeling_info = trend_labeling(
+            close=data['close'].to_list(),
+            time=data.index.to_list(),
+            w=w)
+        labeling_info = pd.DataFrame(labeling_info, index=data.index, columns=['bin'])
+        labeling_info['t1'] = np.nan
+        labeling_info['ret'] = np.nan
+        labeling_info['trgt'] = np.nan
+    elif labeling_technique == 'tb':
+        triple_barrier_pipe = TripleBarierLabeling(
+            volatility_lookback=tb_volatility_lookback,
+            volatility_scaler=tb_volatility_scaler,
+            triplebar_num_days=tb_triplebar_num_days,
+            triplebar_pt_sl=tb_triplebar_pt_sl,
+            triplebar_min_ret=tb_triplebar_min_ret,
+            num_threads=num_threads,
+            tb_min_pct=tb_min_pct
+        )
+        tb_fit = triple_barrier_pipe.fit(data)
+        labeling_info = tb_fit.triple_barrier_info
+        X = tb_fit.transform(data)
+    elif labeling_technique == 'ts':
+        trend_scanning_pipe = TrendScanning(
+            volatility_lookback=tb_volatility_lookback,
+            volatility_scaler=tb_volatility_scaler,
+            ts_look_forward_window=ts_look_forward_window,
+            ts_min_sample_length=ts_min_sample_length,
+            ts_step=ts_step
+            )
+        labeling_info = trend_scanning_pipe.fit(data)
+        X = trend_scanning_pipe.transform(data)
+    elif labeling_technique == 'fixed_horizon':
+        horizons = ['day_' + str(h) for h in fh_horizons]
+        if label not in horizons:
+            raise ValueError('Unknown label {}, available horizons: {}'.format(label, ', '.join(horizons)))
+        labeling_info = fixed_horizon_labels(
+            data['orig_close'], horizons=fh_horizons, threshold=fh_threshold, resample_by='B')
+        labeling_info = labeling_info[[label + '_ret', label + '_bin']].dropna()
+        labeling_info.columns = ['ret', 'bin']
+        print(labeling_info['bin'].value_counts())
+        X = X.loc[labeling_info.index]  # last horizon rows have no label
+    else:
+        raise ValueError('Unknown labeling technique ' + str(labeling_technique))
+    if not labeling_features:
+        X = data
+
+    # remove na
+    remove_na_rows = labeling_info['bin'].isna()
+    X = X.loc[~remove_na_rows]
+    labeling_info = labeling_info.loc[~remove_na_rows].copy()
+    labeling_info.loc[:, 'bin'] = np.where(
+        labeling_info.loc[:, 'bin'] == -1,
+        0,
+        labeling_info.loc[:, 'bin'])
+    return X, labeling_info
+
+
+def make_sequence_labels(data, **params):
+    """
+    make_labels for sequence models, all rows of data are used as features.
+    """
+    return make_labels(data, labeling_features=False, **params)
+
+
+def screen_columns(labels):
+    """
+    Remove columns with large values (TA issue - causes model problems / overflow)
+    and constant columns.
+
+    :param labels: (tuple) features and labeling info
+    :return: (pd.DataFrame, ColumnScreen) features and fitted screen, it drops
+        the same columns at inference
+    """
+    screen = ColumnScreen(max_abs=1e12, drop_constant=True)
+    return screen.fit_transform(labels[0]), screen
+
+
+def remove_correlated(screened, correlation_threshold=0.95, correlation_max_rows=500000):
+    """
+    Remove correlated columns, close is kept.
+
+    :param screened: (tuple) features and column screen
+    :param correlation_threshold: (float) correlation threshold
+    :param correlation_max_rows: (int) correlations on time ordered subsample, all rows if None
+    :return: (pd.DataFrame) features
+    """
+    print(f'Shape before removing correlated features with threshold {correlation_threshold}'
+          f' is {screened[0].shape}')
+    X = remove_correlated_columns(
+        data=screened[0],
+        columns_ignore=['close'],
+        threshold=correlation_threshold,
+        max_rows=correlation_max_rows)
+    print(f'Shape after removing correlated features is {X.shape}')
+    return X
+
+
+def split_train_test(X, labels, train_test_split_ratio=0.25):
+    """
+    Time ordered train test split.
+
+    :param X: (pd.DataFrame) features
+    :param labels: (tuple) features and labeling info
+    :param train_test_split_ratio: (float) share of test set
+    :return: (tuple) X_train, X_test, y_train, y_test
+    """
+    labeling_info = labels[1]
+    return tuple(train_test_split(
+        X, labeling_info.loc[:, labeling_info.columns.str.contains('bin')],
+        test_size=train_test_split_ratio, shuffle=False, stratify=None))
+
+
+def scale(split, scaling='expanding', tb_volatility_lookback=50, float32_features=True):
+    """
+    Scale features, rows with NaN features are removed.
+
+    :param split: (tuple) X_train, X_test, y_train, y_test
+    :param scaling: (str) expanding is ExpandingScaler, rolling and
+        rolling_mean are RollingScaler with and without std; test set
+        continues statistics of train set. Data are not scaled otherwise.
+    :param tb_volatility_lookback: (int) min_periods of expanding and window
+        of rolling scaling
+    :param float32_features: (bool) keep features in float32
+    :return: (tuple) X_train, X_test, y_train, y_test
+    """
+    X_train, X_test, y_train, y_test = split
+    if scaling == 'expanding':
+        scaler = ExpandingScaler(min_periods=tb_volatility_lookback)
+    elif scaling in ['rolling', 'rolling_mean']:
+        scaler = RollingScaler(window=tb_volatility_lookback, with_std=scaling == 'rolling')
+    else:
+        return split
+    dtype_policy = DtypePolicy(np.float32 if float32_features else np.float64)
+    X_train = dtype_policy.apply(scaler.fit_transform(X_train))
+    X_test = dtype_policy.apply(scaler.transform(X_test))
+    y_train = y_train.loc[~X_train.isna().any(axis=1)]
+    X_train = X_train.dropna()
+    y_test = y_test.loc[~X_test.isna().any(axis=1)]
+    X_test = X_test.dropna()
+    return X_train, X_test, y_train, y_test
+
+
+def reduce_dimensions(split, X, dim_reduction='none'):
+    """
+    Reduce dimensions and add close if it does not exist, needed for later.
+
+    :param split: (tuple) X_train, X_test, y_train, y_test
+    :param X: (pd.DataFrame) unscaled features with close column
+    :param dim_reduction: (str) pca is OrthogonalFeatures fitted on train set,
+        test set is projected on it; no reduction otherwise
+    :return: (tuple) X_train, X_test, y_train, y_test
+    """
+    X_train, X_test, y_train, y_test = split
+    if dim_reduction == 'pca':
+        pca = OrthogonalFeatures(variance_threshold=0.95)
+        X_train = pca.fit_transform(X_train)
+        X_test = pca.transform(X_test)
+    if 'close' not in X_train.columns:
+        X_train = X_train.join(X['close'], how='left')
+        X_test = X_test.join(X['close'], how='left')
+    return X_train, X_test, y_train, y_test
+
+
+# parameters used by every labeling technique
+LABELING_PARAMS = {
+    'tl': ['w'],
+    'tb': ['tb_volatility_lookback', 'tb_volatility_scaler', 'tb_triplebar_num_days',
+           'tb_triplebar_pt_sl', 'tb_triplebar_min_ret', 'tb_min_pct', 'num_threads'],
+    'ts': ['tb_volatility_lookback', 'tb_volatility_scaler', 'ts_look_forward_window',
+           'ts_min_sample_length', 'ts_step'],
+    'fixed_horizon': ['fh_horizons', 'fh_threshold', 'label']
+}
+
+
+def labeling_params(params):
+    """
+    :param params: (dict) all parameters
+    :return: (list) parameters of chosen labeling technique
+    """
+    return ['labeling_technique'] + LABELING_PARAMS.get(params['labeling_technique'], [])
+
+
+def build_prepare_dag(cache_dir=None, memory_report=None, sequences=False, max_cache_bytes=None):
+    """
+    DAG of prepare step: import, (select), stationarity, labels, screen,
+    correlation, split, scaling and dim_reduction stages.
+
+    :param cache_dir: (str) cache folder, default_cache_dir() if None
+    :param memory_report: (dict) if not None, memory and time of calculated stages
+    :param sequences: (bool) DAG of prepare_3d: chosen features without
+        constant columns and all rows of data are used
+    :param max_cache_bytes: (int) cache byte budget, default_cache_bytes() if None
+    :return: (PrepareDAG) DAG, run it with dict of hyperparameters
+    """
+    dag = PrepareDAG(cache_dir=cache_dir, memory_report=memory_report, max_cache_bytes=max_cache_bytes)
+    dag.add(Stage('import', load_data, params=['contract', 'input_data_path', 'float32_features'],
+                  fingerprint=_data_file_fingerprint, modules=['trademl.modeling.memory']))
+    data_stage = 'import'
+    if sequences:
+        dag.add(Stage('select', select_features, ['import'], ['choose_features'],
+                      modules=['trademl.modeling.preprocessing']))
+        data_stage = 'select'
+    dag.add(Stage('stationarity', make_stationary, [data_stage], ['chow_subsample', 'stationarity'],
+                  modules=['trademl.modeling.structural_breaks', 'trademl.modeling.stationarity']))
+    dag.add(Stage('labels', make_sequence_labels if sequences else make_labels, ['stationarity'],
+                  labeling_params, modules=['trademl.modeling.labeling', 'trademl.modeling.pipelines']
+                  + (['trademl.modeling.prepare_dag'] if sequences else [])))
+    dag.add(Stage('screen', screen_columns, ['labels'], modules=['trademl.modeling.preprocessing']))
+    dag.add(Stage('correlation', remove_correlated, ['screen'],
+                  ['correlation_threshold', 'correlation_max_rows'],
+                  modules=['trademl.modeling.preprocessing']))
+    dag.add(Stage('split', split_train_test, ['correlation', 'labels'], ['train_test_split_ratio']))
+    dag.add(Stage('scaling', scale, ['split'],
+                  ['scaling', 'tb_volatility_lookback', 'float32_features'],
+                  modules=['trademl.modeling.preprocessing', 'trademl.modeling.memory']))
+    dag.add(Stage('dim_reduction', reduce_dimensions, ['scaling', 'correlation'], ['dim_reduction'],
+                  modules=['trademl.modeling.dim_reduction']))
+    return dag
@@ -0,0 +1,136 @@
+'''
+SAMPLE WEIGHTS
+'''
+
+import numpy as np
+import pandas as pd
+
+
+def get_event_bar_indices(close_index, label_endtime):
+    """
+    Convert label start and end times to integer bar intervals.
+
+    :param close_index: (pd.DatetimeIndex) index of close prices
+    :param label_endtime: (pd.Series) label end times (t1), indexed by label start times
+    :return: (np.array, np.array) first and last (inclusive) bar index of every label
+    """
+    label_endtime = label_endtime.fillna(close_index[-1])
+    start = close_index.searchsorted(label_endtime.index, side='left')
+    end = close_index.searchsorted(label_endtime.values, side='right') - 1
+
+    return start, end
+
+
+def _concurrency(start, end, n_bars):
+    """
+    Number of concurrent labels for every bar, from difference array.
+
+    :param start: (np.array) first bar index of every label
+    :param end: (np.array) last bar index of every label
+    :param n_bars: (int) number of bars
+    :return: (np.array) number of concurrent labels for every bar
+    """
+    valid = end >= start
+    diff = (np.bincount(start[valid], minlength=n_bars + 1) -
+            np.bincount(end[valid] + 1, minlength=n_bars + 1))
+    return np.cumsum(diff[:n_bars])
+
+
+def _interval_sums(values, start, end):
+    """
+    Sum of values over every [start, end] interval, from cumulative sum.
+    """
+    cumsum = np.concatenate(([0.], np.cumsum(values)))
+    sums = cumsum[np.maximum(end + 1, start)] - cumsum[start]
+    return sums
+
+
+def get_num_conc_events(close_index, label_endtime):
+    """
+    Advances in Financial Machine Learning, Snippet 4.1, page 60.
+    Number of concurrent events for every bar, without per event slicing.
+
+    :param close_index: (pd.DatetimeIndex) index of close prices
+    :param label_endtime: (pd.Series) label end times (t1), indexed by label start times
+    :return: (pd.Series) number of concurrent labels for every bar
+    """
+    start, end = get_event_bar_indices(close_index, label_endtime)
+    return pd.Series(_concurrency(start, end, close_index.shape[0]), index=close_index)
+
+
+def get_av_uniqueness_from_triple_barrier(triple_barrier_events, close_series):
+    """
+    Advances in Financial Machine Learning, Snippet 4.2, page 62.
+    Average uniqueness of every label, same output as
+    ml.sample_weights.get_av_uniqueness_from_triple_barrier.
+
+    :param triple_barrier_events: (pd.DataFrame) events with t1 column
+    :param close_series: (pd.Series) close prices
+    :return: (pd.DataFrame) average uniqueness in tW column
+    """
+    start, end = get_event_bar_indices(close_series.index, triple_barrier_events['t1'])
+    num_conc_events = _concurrency(start, end, close_series.shape[0])
+    with np.errstate(divide='ignore'):
+        uniqueness = np.where(num_conc_events > 0, 1. / num_conc_events, 0.)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        av_uniqueness = _interval_sums(uniqueness, start, end) / (end - start + 1)
+    av_uniqueness[end < start] = np.nan
+
+    return pd.DataFrame({'tW': av_uniqueness}, index=triple_barrier_events.index)
+
+
+def get_weights_by_return(triple_barrier_events, close_series):
+    """
+    Advances in Financial Machine Learning, Snippet 4.10, page 69.
+    Sample weights by absolute return attribution, same output as
+    ml.sample_weights.get_weights_by_return.
+
+    :param triple_barrier_events: (pd.DataFrame) events with t1 column
+    :param close_series: (pd.Series) close prices
+    :return: (pd.Series) sample weights
+    """
+    has_null_events = bool(triple_barrier_events.isnull().values.any())
+    has_null_index = bool(triple_barrier_events.index.isnull().any())
+    assert has_null_events is False and has_null_index is False, 'NaN values in triple_barrier_events, delete nans'
+
+    start, end = get_event_bar_indices(close_series.index, triple_barrier_events['t1'])
+    num_conc_events = _concurrency(start, end, close_series.shape[0])
+    returns = np.log(close_series.values.astype(np.float64))
+    returns = np.concatenate(([np.nan], np.diff(returns)))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        attributed = returns / num_conc_events
+    attributed[~np.isfinite(attributed)] = 0.
+
+    weights = pd.Series(np.abs(_interval_sums(attributed, start, end)),
+                        index=triple_barrier_events.index)
+    weights *= weights.shape[0] / weights.sum()
+
+    return weights
+
+
+def get_weights_by_time_decay(triple_barrier_events, close_series, decay=1):
+    """
+    Advances in Financial Machine Learning, Snippet 4.11, page 70.
+    Sample weights by time decay of average uniqueness, same output as
+    ml.sample_weights.get_weights_by_time_decay.
+
+    :param triple_barrier_events: (pd.DataFrame) events with t1 column
+    :param close_series: (pd.Series) close prices
+    :param decay: (float) decay factor, 1 means no decay, 0 means linear decay to zero,
+        negative values erase the oldest observations
+    :return: (pd.Series) sample weights
+    """
+    assert bool(triple_barrier_events.isnull().values.any()) is False and bool(
+        triple_barrier_events.index.isnull().any()) is False, 'NaN values in triple_barrier_events, delete nans'
+
+    av_uniqueness = get_av_uniqueness_from_triple_barrier(triple_barrier_events, close_series)
+    decay_w = av_uniqueness['tW'].sort_index().cumsum()
+    if decay >= 0:
+        slope = (1 - decay) / decay_w.iloc[-1]
+    else:
+        slope = 1 / ((decay + 1) * decay_w.iloc[-1])
+    const = 1 - slope * decay_w.iloc[-1]
+    decay_w = const + slope * decay_w
+    decay_w[decay_w < 0] = 0
+
+    return decay_w
@@ -0,0 +1,247 @@
+'''
+SEQUENTIAL BOOTSTRAP
+'''
+
+import numpy as np
+from numba import njit
+from joblib import Parallel, delayed
+from sklearn.base import BaseEstimator, ClassifierMixin, clone
+from sklearn.tree import DecisionTreeClassifier
+from trademl.modeling.sample_weights import get_event_bar_indices, get_num_conc_events
+
+
+@njit
+def _bars_to_events(start, end, coverage):  # pragma: no cover
+    """
+    Sparse (CSR) indicator matrix: for every bar, indices of events that span it.
+
+    :param start: (np.array) first bar index of every event
+    :param end: (np.array) last bar index of every event
+    :param coverage: (np.array) number of events that span every bar
+    :return: (np.array, np.array) CSR index pointer and event indices
+    """
+    indptr = np.zeros(coverage.shape[0] + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum(coverage)
+    indices = np.empty(indptr[-1], dtype=np.int64)
+    fill = indptr[:-1].copy()
+    for i in range(start.shape[0]):
+        for t in range(start[i], end[i] + 1):
+            indices[fill[t]] = i
+            fill[t] += 1
+    return indptr, indices
+
+
+@njit
+def _fenwick_add(tree, i, value):  # pragma: no cover
+    i += 1
+    while i < tree.shape[0]:
+        tree[i] += value
+        i += i & (-i)
+
+
+@njit
+def _fenwick_find(tree, value):  # pragma: no cover
+    """Smallest index with cumulative sum greater than value."""
+    pos = 0
+    step = 1
+    while step * 2 < tree.shape[0]:
+        step *= 2
+    while step > 0:
+        if pos + step < tree.shape[0] and tree[pos + step] <= value:
+            pos += step
+            value -= tree[pos]
+        step //= 2
+    return pos
+
+
+@njit
+def _seq_bootstrap(start, end, n_bars, indptr, indices, uniforms, warmup):  # pragma: no cover
+    """
+    Sequential bootstrap with running concurrency counts. Average uniqueness
+    is updated only for events that overlap the drawn event, and draws use a
+    Fenwick tree over average uniqueness, so every draw costs
+    O(span * concurrency + touched events * log(events)) instead of
+    O(events * bars), where span is length of drawn event and concurrency
+    number of events per bar.
+
+    :param start: (np.array) first bar index of every event
+    :param end: (np.array) last bar index of every event
+    :param n_bars: (int) number of bars
+    :param indptr: (np.array) CSR index pointer from _bars_to_events
+    :param indices: (np.array) CSR event indices from _bars_to_events
+    :param uniforms: (np.array) uniform random numbers, one per draw
+    :param warmup: (np.array) indices of events drawn first
+    :return: (np.array) indices of drawn events
+    """
+    n_events = start.shape[0]
+    concurrency = np.zeros(n_bars)
+    length = (end - start + 1).astype(np.float64)
+    uniqueness_sum = np.maximum(length, 0.)
+    avg_uniqueness = np.zeros(n_events)
+    tree = np.zeros(n_events + 1)
+    for i in range(n_events):
+        if length[i] > 0:
+            avg_uniqueness[i] = 1.
+            _fenwick_add(tree, i, 1.)
+    total = avg_uniqueness.sum()
+
+    touched_at = np.full(n_events, -1, dtype=np.int64)
+    touched = np.empty(n_events, dtype=np.int64)
+    phi = np.empty(uniforms.shape[0], dtype=np.int64)
+    for draw in range(uniforms.shape[0]):
+        if draw < warmup.shape[0]:
+            choice = warmup[draw]
+        else:
+            choice = min(_fenwick_find(tree, uniforms[draw] * total), n_events - 1)
+        phi[draw] = choice
+
+        # add drawn event to concurrency and update overlapping events
+        n_touched = 0
+        for t in range(start[choice], end[choice] + 1):
+            delta = 1. / (concurrency[t] + 2.) - 1. / (concurrency[t] + 1.)
+            for k in range(indptr[t], indptr[t + 1]):
+                event = indices[k]
+                uniqueness_sum[event] += delta
+                if touched_at[event] != draw:
+                    touched_at[event] = draw
+                    touched[n_touched] = event
+                    n_touched += 1
+            concurrency[t] += 1.
+        for k in range(n_touched):
+            event = touched[k]
+            new_value = uniqueness_sum[event] / length[event]
+            _fenwick_add(tree, event, new_value - avg_uniqueness[event])
+            total += new_value - avg_uniqueness[event]
+            avg_uniqueness[event] = new_value
+
+    return phi
+
+
+class SequentialBootstrap:
+    """
+    Advances in Financial Machine Learning, Snippet 4.5, page 65.
+    Sequential bootstrap built on interval representation of labels.
+
+    :param samples_info_sets: (pd.Series) label end times (t1), indexed by label start times
+    :param price_bars: (pd.Series or pd.DataFrame) bars used to build labels
+    """
+
+    def __init__(self, samples_info_sets, price_bars):
+        self.start, self.end = get_event_bar_indices(price_bars.index, samples_info_sets)
+        self.start = self.start.astype(np.int64)
+        self.end = self.end.astype(np.int64)
+        self.n_bars = price_bars.shape[0]
+        coverage = get_num_conc_events(price_bars.index, samples_info_sets).values
+        self.indptr, self.indices = _bars_to_events(self.start, self.end, coverage)
+
+    def sample(self, sample_length=None, warmup_samples=None, random_state=None):
+        """
+        Draw sample with sequential bootstrap.
+
+        :param sample_length: (int) number of draws, default is number of events
+        :param warmup_samples: (list) indices of events drawn first
+        :param random_state: (int or np.random.RandomState) random state
+        :return: (np.array) indices of drawn events
+        """
+        if sample_length is None:
+            sample_length = self.start.shape[0]
+        if not isinstance(random_state, np.random.RandomState):
+            random_state = np.random.RandomState(random_state)
+        uniforms = random_state.random_sample(sample_length)
+        warmup = np.asarray(warmup_samples if warmup_samples is not None else [], dtype=np.int64)
+        return _seq_bootstrap(self.start, self.end, self.n_bars, self.indptr,
+                              self.indices, uniforms, warmup)
+
+
+def seq_bootstrap(samples_info_sets, price_bars, sample_length=None, warmup_samples=None,
+                  random_state=None):
+    """
+    Draw indices of events with sequential bootstrap.
+
+    :param samples_info_sets: (pd.Series) label end times (t1), indexed by label start times
+    :param price_bars: (pd.Series or pd.DataFrame) bars used to build labels
+    :param sample_length: (int) number of draws, default is number of events
+    :param warmup_samples: (list) indices of events drawn first
+    :param random_state: (int or np.random.RandomState) random state
+    :return: (np.array) indices of drawn events
+    """
+    sampler = SequentialBootstrap(samples_info_sets, price_bars)
+    return sampler.sample(sample_length, warmup_samples, random_state)
+
+
+def _take_rows(X, indices):
+    return X.iloc[indices] if hasattr(X, 'iloc') else X[indices]
+
+
+def _fit_estimator(estimator, X, y, sample_weight, indices):
+    X_ = _take_rows(X, indices)
+    y_ = _take_rows(y, indices)
+    if sample_weight is None:
+        return estimator.fit(X_, y_)
+    return estimator.fit(X_, y_, sample_weight=_take_rows(sample_weight, indices))
+
+
+class SequentialBootstrapBaggingClassifier(BaseEstimator, ClassifierMixin):
+    """
+    Bagging classifier where every estimator is fitted on a sequentially
+    bootstrapped sample of events.
+
+    :param samples_info_sets: (pd.Series) label end times (t1) of rows in X
+    :param price_bars: (pd.Series or pd.DataFrame) bars used to build labels
+    :param base_estimator: (sklearn estimator) estimator to bag, decision tree if None
+    :param n_estimators: (int) number of estimators
+    :param max_samples: (int or float) number (int) or fraction (float) of draws per estimator
+    :param n_jobs: (int) number of parallel fits
+    :param random_state: (int) random state
+    """
+
+    def __init__(self, samples_info_sets, price_bars, base_estimator=None, n_estimators=10,
+                 max_samples=1.0, n_jobs=1, random_state=None):
+        self.samples_info_sets = samples_info_sets
+        self.price_bars = price_bars
+        self.base_estimator = base_estimator
+        self.n_estimators = n_estimators
+        self.max_samples = max_samples
+        self.n_jobs = n_jobs
+        self.random_state = random_state
+
+    def fit(self, X, y, sample_weight=None):
+        base_estimator = self.base_estimator if self.base_estimator is not None else DecisionTreeClassifier()
+        n_samples = X.shape[0]
+        if isinstance(self.max_samples, float):
+            sample_length = int(round(self.max_samples * n_samples))
+        else:
+            sample_length = self.max_samples
+
+        # draw samples sequentially, sampler is built once
+        samples_info_sets = self.samples_info_sets
+        if hasattr(X, 'index'):
+            samples_info_sets = samples_info_sets.loc[X.index]  # e.g. cross validation folds
+        sampler = SequentialBootstrap(samples_info_sets, self.price_bars)
+        random_state = np.random.RandomState(self.random_state)
+        self.estimators_samples_ = [sampler.sample(sample_length, random_state=random_state)
+                                    for _ in range(self.n_estimators)]
+
+        # fit estimators
+        estimators = []
+        for _ in range(self.n_estimators):
+            estimator = clone(base_estimator)
+            if 'random_state' in estimator.get_params():
+                estimator.set_params(random_state=random_state.randint(np.iinfo(np.int32).max))
+            estimators.append(estimator)
+        self.estimators_ = Parallel(n_jobs=self.n_jobs, prefer='threads')(
+            delayed(_fit_estimator)(estimator, X, y, sample_weight, indices)
+            for estimator, indices in zip(estimators, self.estimators_samples_))
+        self.classes_ = np.unique(np.asarray(y))
+
+        return self
+
+    def predict_proba(self, X):
+        proba = np.zeros((X.shape[0], self.classes_.shape[0]))
+        for estimator in self.estimators_:
+            columns = np.searchsorted(self.classes_, estimator.classes_)
+            proba[:, columns] += estimator.predict_proba(X)
+        return proba / len(self.estimators_)
+
+    def predict(self, X):
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
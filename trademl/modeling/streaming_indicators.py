@@ -0,0 +1,815 @@
+'''
+STREAMING INDICATORS
+
+Stateful versions of TA-Lib indicators used in add_technical_indicators.
+Every indicator is updated with one new bar in O(1) and returns the same
+value as the batch TA-Lib function on the whole history (NaN during the
+warm-up). State can be saved with get_state and restored with set_state.
+'''
+
+from collections import deque
+import numpy as np
+from scipy.signal import savgol_coeffs
+
+
+def _is_zero(value):
+    """Same as TA_IS_ZERO macro in TA-Lib."""
+    return -0.00000001 < value < 0.00000001
+
+
+def _true_range(high, low, prev_close):
+    greatest = high - low
+    value = abs(prev_close - high)
+    if value > greatest:
+        greatest = value
+    value = abs(prev_close - low)
+    if value > greatest:
+        greatest = value
+    return greatest
+
+
+class StreamingIndicator:
+    """
+    Base class for streaming indicators.
+
+    Subclasses define `inputs`, names of bar fields used by update, and
+    `outputs`, names of values returned by update.
+    """
+
+    inputs = ('close',)
+    outputs = ('value',)
+
+    def get_state(self):
+        """
+        State of the indicator as dictionary of builtin types.
+
+        :return: (dict) indicator state
+        """
+        state = {}
+        for key, value in self.__dict__.items():
+            if isinstance(value, StreamingIndicator):
+                value = value.get_state()
+            elif isinstance(value, deque):
+                value = list(value)
+            elif isinstance(value, list) and value and isinstance(value[0], StreamingIndicator):
+                value = [v.get_state() for v in value]
+            state[key] = value
+        return state
+
+    def set_state(self, state):
+        """
+        Restore state saved with get_state. Indicator must be constructed
+        with the same parameters.
+
+        :param state: (dict) indicator state
+        :return: (StreamingIndicator) self
+        """
+        for key, value in state.items():
+            current = self.__dict__.get(key)
+            if isinstance(current, StreamingIndicator):
+                current.set_state(value)
+            elif isinstance(current, deque):
+                self.__dict__[key] = deque(value, maxlen=current.maxlen)
+            elif isinstance(current, list) and current and isinstance(current[0], StreamingIndicator):
+                for indicator, indicator_state in zip(current, value):
+                    indicator.set_state(indicator_state)
+            else:
+                self.__dict__[key] = value
+        return self
+
+
+class SMA(StreamingIndicator):
+    """
+    Simple moving average.
+
+    :param timeperiod: (int) number of bars
+    """
+
+    def __init__(self, timeperiod=30):
+        self.timeperiod = timeperiod
+        self.window = deque()
+        self.total = 0.
+        self.value = np.nan
+
+    def update(self, value):
+        self.total += value
+        self.window.append(value)
+        if len(self.window) == self.timeperiod:
+            self.value = self.total / self.timeperiod
+            self.total -= self.window.popleft()
+        return self.value
+
+
+class EMA(StreamingIndicator):
+    """
+    Exponential moving average seeded with simple moving average of the
+    first timeperiod values.
+
+    :param timeperiod: (int) number of bars
+    """
+
+    def __init__(self, timeperiod=30):
+        self.timeperiod = timeperiod
+        self.k = 2. / (timeperiod + 1)
+        self.n = 0
+        self.total = 0.
+        self.value = np.nan
+
+    def update(self, value):
+        if self.n < self.timeperiod:
+            self.total += value
+            self.n += 1
+            if self.n == self.timeperiod:
+                self.value = self.total / self.timeperiod
+        else:
+            self.value = ((value - self.value) * self.k) + self.value
+        return self.value
+
+
+class DEMA(StreamingIndicator):
+    """
+    Double exponential moving average.
+
+    :param timeperiod: (int) number of bars
+    """
+
+    def __init__(self, timeperiod=30):
+        self.ema = [EMA(timeperiod), EMA(timeperiod)]
+        self.value = np.nan
+
+    def update(self, value):
+        first = self.ema[0].update(value)
+        if not np.isnan(first):
+            second = self.ema[1].update(first)
+            if not np.isnan(second):
+                self.value = (2.0 * first) - second
+        return self.value
+
+
+class TEMA(StreamingIndicator):
+    """
+    Triple exponential moving average.
+
+    :param timeperiod: (int) number of bars
+    """
+
+    def __init__(self, timeperiod=30):
+        self.ema = [EMA(timeperiod), EMA(timeperiod), EMA(timeperiod)]
+        self.value = np.nan
+
+    def update(self, value):
+        first = self.ema[0].update(value)
+        if np.isnan(first):
+            return self.value
+        second = self.ema[1].update(first)
+        if np.isnan(second):
+            return self.value
+        third = self.ema[2].update(second)
+        if not np.isnan(third):
+            self.value = third + ((3.0 * first) - (3.0 * second))
+        return self.value
+
+
+class T3(StreamingIndicator):
+    """
+    Triple exponential moving average (T3), six cascaded exponential
+    moving averages.
+
+    :param timeperiod: (int) number of bars
+    :param vfactor: (float) volume factor
+    """
+
+    def __init__(self, timeperiod=5, vfactor=0.7):
+        self.ema = [EMA(timeperiod) for _ in range(6)]
+        temp = vfactor * vfactor
+        self.c1 = -temp * vfactor
+        self.c2 = 3.0 * (temp - self.c1)
+        self.c3 = -6.0 * temp - 3.0 * (vfactor - self.c1)
+        self.c4 = 1.0 + 3.0 * vfactor - self.c1 + 3.0 * temp
+        self.value = np.nan
+
+    def update(self, value):
+        for ema in self.ema:
+            value = ema.update(value)
+            if np.isnan(value):
+                return self.value
+        e3, e4, e5, e6 = [ema.value for ema in self.ema[2:]]
+        self.value = self.c1 * e6 + self.c2 * e5 + self.c3 * e4 + self.c4 * e3
+        return self.value
+
+
+class RSI(StreamingIndicator):
+    """
+    Relative strength index with Wilder smoothing.
+
+    :param timeperiod: (int) number of bars
+    """
+
+    def __init__(self, timeperiod=14):
+        self.timeperiod = timeperiod
+        self.n = 0
+        self.prev = np.nan
+        self.gain = 0.
+        self.loss = 0.
+        self.value = np.nan
+
+    def update(self, value):
+        self.n += 1
+        if self.n == 1:
+            self.prev = value
+            return self.value
+        diff = value - self.prev
+        self.prev = value
+        if self.n <= self.timeperiod + 1:
+            if diff < 0:
+                self.loss -= diff
+            else:
+                self.gain += diff
+            if self.n < self.timeperiod + 1:
+                return self.value
+            self.loss /= self.timeperiod
+            self.gain /= self.timeperiod
+        else:
+            self.loss *= (self.timeperiod - 1)
+            self.gain *= (self.timeperiod - 1)
+            if diff < 0:
+                self.loss -= diff
+            else:
+                self.gain += diff
+            self.loss /= self.timeperiod
+            self.gain /= self.timeperiod
+        total = self.gain + self.loss
+        self.value = 100 * (self.gain / total) if not _is_zero(total) else 0.
+        return self.value
+
+
+class MACD(StreamingIndicator):
+    """
+    Moving average convergence/divergence. Fast exponential moving average
+    is seeded on the last fastperiod values of the slow seed window.
+
+    :param fastperiod: (int) fast exponential moving average period
+    :param slowperiod: (int) slow exponential moving average period
+    :param signalperiod: (int) signal line period
+    """
+
+    outputs = ('macd', 'macdsignal', 'macdhist')
+
+    def __init__(self, fastperiod=12, slowperiod=26, signalperiod=9):
+        if slowperiod < fastperiod:
+            fastperiod, slowperiod = slowperiod, fastperiod
+        self.fast = EMA(fastperiod)
+        self.slow = EMA(slowperiod)
+        self.signal = EMA(signalperiod)
+        self.window = deque(maxlen=fastperiod)
+        self.value = (np.nan, np.nan, np.nan)
+
+    def update(self, value):
+        slow = self.slow.update(value)
+        if np.isnan(slow):
+            self.window.append(value)
+            return self.value
+        if self.window:
+            # seed fast average on values ending at first slow average
+            self.window.append(value)
+            for past_value in self.window:
+                self.fast.update(past_value)
+            self.window.clear()
+            fast = self.fast.value
+        else:
+            fast = self.fast.update(value)
+        macd = fast - slow
+        signal = self.signal.update(macd)
+        if not np.isnan(signal):
+            self.value = (macd, signal, macd - signal)
+        return self.value
+
+
+class ATR(StreamingIndicator):
+    """
+    Average true range with Wilder smoothing.
+
+    :param timeperiod: (int) number of bars
+    """
+
+    inputs = ('high', 'low', 'close')
+
+    def __init__(self, timeperiod=14):
+        self.timeperiod = timeperiod
+        self.n = 0
+        self.prev_close = np.nan
+        self.total = 0.
+        self.atr = np.nan
+        self.value = np.nan
+
+    def update(self, high, low, close):
+        self.n += 1
+        if self.n > 1:
+            true_range = _true_range(high, low, self.prev_close)
+            if self.n <= self.timeperiod + 1:
+                self.total += true_range
+                if self.n == self.timeperiod + 1:
+                    self.atr = self.total / self.timeperiod
+            else:
+                self.atr *= self.timeperiod - 1
+                self.atr += true_range
+                self.atr /= self.timeperiod
+        self.prev_close = close
+        self.value = self._output(close)
+        return self.value
+
+    def _output(self, close):
+        return self.atr
+
+
+class NATR(ATR):
+    """
+    Normalized average true range, in percents of close price.
+
+    :param timeperiod: (int) number of bars
+    """
+
+    def _output(self, close):
+        if np.isnan(self.atr):
+            return np.nan
+        return (self.atr / close) * 100.0 if not _is_zero(close) else 0.
+
+
+class BBANDS(StreamingIndicator):
+    """
+    Bollinger bands around simple moving average.
+
+    :param timeperiod: (int) number of bars
+    :param nbdevup: (float) number of standard deviations for upper band
+    :param nbdevdn: (float) number of standard deviations for lower band
+    """
+
+    outputs = ('upperband', 'middleband', 'lowerband')
+
+    def __init__(self, timeperiod=5, nbdevup=2.0, nbdevdn=2.0):
+        self.timeperiod = timeperiod
+        self.nbdevup = nbdevup
+        self.nbdevdn = nbdevdn
+        self.window = deque()
+        self.total = 0.
+        self.total2 = 0.
+        self.value = (np.nan, np.nan, np.nan)
+
+    def update(self, value):
+        self.total += value
+        self.total2 += value * value
+        self.window.append(value)
+        if len(self.window) == self.timeperiod:
+            oldest = self.window.popleft()
+            middle = self.total / self.timeperiod
+            variance = self.total2 / self.timeperiod - middle * middle
+            self.total -= oldest
+            self.total2 -= oldest * oldest
+            std = np.sqrt(variance) if variance >= 0.00000001 else 0.
+            self.value = (middle + std * self.nbdevup, middle, middle - std * self.nbdevdn)
+        return self.value
+
+
+class _RollingExtreme(StreamingIndicator):
+    """
+    Rolling maximum or minimum from monotonic deque.
+
+    :param timeperiod: (int) number of bars
+    :param maximum: (bool) rolling maximum if True, else rolling minimum
+    """
+
+    def __init__(self, timeperiod, maximum=True):
+        self.timeperiod = timeperiod
+        self.maximum = maximum
+        self.n = 0
+        self.window = deque()
+
+    def update(self, value):
+        if self.maximum:
+            while self.window and self.window[-1][1] <= value:
+                self.window.pop()
+        else:
+            while self.window and self.window[-1][1] >= value:
+                self.window.pop()
+        self.window.append((self.n, value))
+        if self.window[0][0] <= self.n - self.timeperiod:
+            self.window.popleft()
+        self.n += 1
+        return self.window[0][1]
+
+
+class _FastK(StreamingIndicator):
+    """Raw stochastic %K."""
+
+    def __init__(self, fastk_period):
+        self.fastk_period = fastk_period
+        self.highest = _RollingExtreme(fastk_period, maximum=True)
+        self.lowest = _RollingExtreme(fastk_period, maximum=False)
+
+    def update(self, high, low, close):
+        highest = self.highest.update(high)
+        lowest = self.lowest.update(low)
+        if self.highest.n < self.fastk_period:
+            return np.nan
+        diff = (highest - lowest) / 100.0
+        return (close - lowest) / diff if diff != 0. else 0.
+
+
+class STOCHF(StreamingIndicator):
+    """
+    Fast stochastic oscillator.
+
+    :param fastk_period: (int) %K period
+    :param fastd_period: (int) %D period
+    """
+
+    inputs = ('high', 'low', 'close')
+    outputs = ('fastk', 'fastd')
+
+    def __init__(self, fastk_period=5, fastd_period=3):
+        self.fastk = _FastK(fastk_period)
+        self.fastd = SMA(fastd_period)
+        self.value = (np.nan, np.nan)
+
+    def update(self, high, low, close):
+        fastk = self.fastk.update(high, low, close)
+        if not np.isnan(fastk):
+            fastd = self.fastd.update(fastk)
+            if not np.isnan(fastd):
+                self.value = (fastk, fastd)
+        return self.value
+
+
+class STOCH(StreamingIndicator):
+    """
+    Slow stochastic oscillator.
+
+    :param fastk_period: (int) %K period
+    :param slowk_period: (int) slow %K period
+    :param slowd_period: (int) slow %D period
+    """
+
+    inputs = ('high', 'low', 'close')
+    outputs = ('slowk', 'slowd')
+
+    def __init__(self, fastk_period=5, slowk_period=3, slowd_period=3):
+        self.fastk = _FastK(fastk_period)
+        self.slowk = SMA(slowk_period)
+        self.slowd = SMA(slowd_period)
+        self.value = (np.nan, np.nan)
+
+    def update(self, high, low, close):
+        fastk = self.fastk.update(high, low, close)
+        if np.isnan(fastk):
+            return self.value
+        slowk = self.slowk.update(fastk)
+        if not np.isnan(slowk):
+            slowd = self.slowd.update(slowk)
+            if not np.isnan(slowd):
+                self.value = (slowk, slowd)
+        return self.value
+
+
+class DirectionalMovement(StreamingIndicator):
+    """
+    Directional movement family: PLUS_DM, MINUS_DM, PLUS_DI, MINUS_DI,
+    DX, ADX and ADXR with common Wilder smoothing.
+
+    :param timeperiod: (int) number of bars, greater than 1
+    """
+
+    inputs = ('high', 'low', 'close')
+    outputs = ('plus_dm', 'minus_dm', 'plus_di', 'minus_di', 'dx', 'adx', 'adxr')
+
+    def __init__(self, timeperiod=14):
+        self.timeperiod = timeperiod
+        self.n = 0
+        self.prev_high = np.nan
+        self.prev_low = np.nan
+        self.prev_close = np.nan
+        self.plus_dm = 0.
+        self.minus_dm = 0.
+        self.true_range = 0.
+        self.sum_dx = 0.
+        self.dx = np.nan
+        self.adx = np.nan
+        self.adx_window = deque(maxlen=timeperiod)
+        self.value = (np.nan,) * 7
+
+    def update(self, high, low, close):
+        p = self.timeperiod
+        i = self.n
+        self.n += 1
+        if i == 0:
+            self.prev_high, self.prev_low, self.prev_close = high, low, close
+            return self.value
+        diff_p = high - self.prev_high
+        diff_m = self.prev_low - low
+        true_range = _true_range(high, low, self.prev_close)
+        self.prev_high, self.prev_low, self.prev_close = high, low, close
+        if i >= p:
+            self.minus_dm -= self.minus_dm / p
+            self.plus_dm -= self.plus_dm / p
+            self.true_range = self.true_range - (self.true_range / p) + true_range
+        else:
+            self.true_range += true_range
+        if diff_m > 0 and diff_p < diff_m:
+            self.minus_dm += diff_m
+        elif diff_p > 0 and diff_p > diff_m:
+            self.plus_dm += diff_p
+        if i < p - 1:
+            return self.value
+        if i == p - 1:
+            self.value = (self.plus_dm, self.minus_dm) + (np.nan,) * 5
+            return self.value
+
+        # directional indicators and directional index
+        plus_di = minus_di = 0.
+        dx = np.nan
+        if not _is_zero(self.true_range):
+            minus_di = 100.0 * (self.minus_dm / self.true_range)
+            plus_di = 100.0 * (self.plus_dm / self.true_range)
+            total = minus_di + plus_di
+            if not _is_zero(total):
+                dx = 100.0 * (abs(minus_di - plus_di) / total)
+        if not np.isnan(dx):
+            self.dx = dx
+        elif np.isnan(self.dx):
+            self.dx = 0.
+
+        # average directional index
+        if i < 2 * p - 1:
+            self.sum_dx += dx if not np.isnan(dx) else 0.
+        elif i == 2 * p - 1:
+            self.sum_dx += dx if not np.isnan(dx) else 0.
+            self.adx = self.sum_dx / p
+        elif not np.isnan(dx):
+            self.adx = ((self.adx * (p - 1)) + dx) / p
+        adxr = np.nan
+        if not np.isnan(self.adx):
+            self.adx_window.append(self.adx)
+            if len(self.adx_window) == p:
+                adxr = (self.adx + self.adx_window[0]) / 2.0
+
+        self.value = (self.plus_dm, self.minus_dm, plus_di, minus_di, self.dx, self.adx, adxr)
+        return self.value
+
+
+class OBV(StreamingIndicator):
+    """On balance volume, starting from volume of the first bar."""
+
+    inputs = ('close', 'volume')
+
+    def __init__(self):
+        self.prev = np.nan
+        self.value = np.nan
+
+    def update(self, close, volume):
+        if np.isnan(self.value):
+            self.value = volume
+        elif close > self.prev:
+            self.value += volume
+        elif close < self.prev:
+            self.value -= volume
+        self.prev = close
+        return self.value
+
+
+class AD(StreamingIndicator):
+    """Chaikin accumulation/distribution line."""
+
+    inputs = ('high', 'low', 'close', 'volume')
+
+    def __init__(self):
+        self.value = 0.
+
+    def update(self, high, low, close, volume):
+        diff = high - low
+        if diff > 0.0:
+            self.value += (((close - low) - (high - close)) / diff) * volume
+        return self.value
+
+
+class SAR(StreamingIndicator):
+    """
+    Parabolic SAR. Initial direction is long unless the second bar has
+    positive minus directional movement.
+
+    :param acceleration: (float) acceleration factor step
+    :param maximum: (float) maximum acceleration factor
+    """
+
+    inputs = ('high', 'low')
+
+    def __init__(self, acceleration=0.02, maximum=0.2):
+        if acceleration > maximum:
+            acceleration = maximum
+        self.acceleration = acceleration
+        self.maximum = maximum
+        self.n = 0
+        self.is_long = True
+        self.af = acceleration
+        self.ep = np.nan
+        self.sar = np.nan
+        self.new_high = np.nan
+        self.new_low = np.nan
+        self.value = np.nan
+
+    def update(self, high, low):
+        self.n += 1
+        if self.n == 1:
+            self.new_high, self.new_low = high, low
+            return self.value
+        if self.n == 2:
+            diff_p = high - self.new_high
+            diff_m = self.new_low - low
+            self.is_long = not (diff_m > 0 and diff_p < diff_m)
+            if self.is_long:
+                self.ep, self.sar = high, self.new_low
+            else:
+                self.ep, self.sar = low, self.new_high
+            self.new_high, self.new_low = high, low
+        prev_high, prev_low = self.new_high, self.new_low
+        self.new_high, self.new_low = high, low
+        if self.is_long:
+            if low <= self.sar:
+                # switch to short
+                self.is_long = False
+                self.sar = max(self.ep, prev_high, high)
+                self.value = self.sar
+                self.af = self.acceleration
+                self.ep = low
+                self.sar = self.sar + self.af * (self.ep - self.sar)
+                self.sar = max(self.sar, prev_high, high)
+            else:
+                self.value = self.sar
+                if high > self.ep:
+                    self.ep = high
+                    self.af = min(self.af + self.acceleration, self.maximum)
+                self.sar = self.sar + self.af * (self.ep - self.sar)
+                self.sar = min(self.sar, prev_low, low)
+        else:
+            if high >= self.sar:
+                # switch to long
+                self.is_long = True
+                self.sar = min(self.ep, prev_low, low)
+                self.value = self.sar
+                self.af = self.acceleration
+                self.ep = high
+                self.sar = self.sar + self.af * (self.ep - self.sar)
+                self.sar = min(self.sar, prev_low, low)
+            else:
+                self.value = self.sar
+                if low < self.ep:
+                    self.ep = low
+                    self.af = min(self.af + self.acceleration, self.maximum)
+                self.sar = self.sar + self.af * (self.ep - self.sar)
+                self.sar = max(self.sar, prev_high, high)
+        return self.value
+
+
+class SlidingDFT(StreamingIndicator):
+    """
+    Amplitude and phase of selected DFT bins over rolling window, updated
+    with sliding DFT recurrence in O(bins) per bar. Exact DFT is
+    recomputed every refresh bars.
+
+    :param window: (int) window length
+    :param bins: (list) DFT bins (cycles per window)
+    :param refresh: (int) bars between exact DFT recalculations, window if None
+    """
+
+    def __init__(self, window, bins=[1, 2, 3], refresh=None):
+        self.window = window
+        self.bins = list(bins)
+        self.refresh = refresh if refresh is not None else window
+        self.values = deque(maxlen=window + 1)
+        self.n = 0
+        self.real = [0.] * len(self.bins)
+        self.imag = [0.] * len(self.bins)
+        self.outputs = tuple(['amp_' + str(b) for b in self.bins] + ['phase_' + str(b) for b in self.bins])
+        self.value = (np.nan,) * (2 * len(self.bins))
+
+    def update(self, value):
+        self.values.append(value)
+        self.n += 1
+        t = self.n - 1
+        if t < self.window - 1:
+            return self.value
+        bins = np.asarray(self.bins, dtype=np.float64)
+        if (t - self.window + 1) % self.refresh == 0:
+            window = np.asarray(self.values, dtype=np.float64)[-self.window:]
+            m = np.arange(self.window)
+            state = np.exp(-2j * np.pi * np.outer(bins, m) / self.window) @ window
+        else:
+            state = np.asarray(self.real) + 1j * np.asarray(self.imag)
+            state = np.exp(2j * np.pi * bins / self.window) * (state - self.values[0] + value)
+        self.real = state.real.tolist()
+        self.imag = state.imag.tolist()
+        self.value = tuple(np.abs(state) / self.window) + tuple(np.angle(state))
+        return self.value
+
+
+class SavgolFilter(StreamingIndicator):
+    """
+    Causal Savitzky-Golay filter, the same values as causal_savgol_filter.
+
+    :param window: (int) window length
+    :param polyorder: (int) order of polynomial, smaller than window
+    """
+
+    def __init__(self, window=31, polyorder=3):
+        self.window = window
+        self.polyorder = polyorder
+        self.coeffs = savgol_coeffs(window, polyorder, pos=window - 1, use='dot').tolist()
+        self.values = deque(maxlen=window)
+        self.value = np.nan
+
+    def update(self, value):
+        self.values.append(value)
+        if len(self.values) == self.window:
+            self.value = float(np.dot(self.coeffs, self.values))
+        return self.value
+
+
+class StreamingIndicatorSet:
+    """
+    Streaming indicators from add_technical_indicators, with the same
+    column names as the batch features.
+
+    :param periods: (list) periods used as arguments, as in add_technical_indicators
+    """
+
+    def __init__(self, periods=[10, 100]):
+        self.periods = periods
+        self.indicators = []
+        for p in periods:
+            self._add(EMA(p), ['EMA' + str(p)])
+            self._add(DEMA(p), ['DEMA' + str(p)])
+            self._add(TEMA(p), ['TEMA' + str(p)])
+            self._add(T3(p), ['T3' + str(p)])
+            self._add(RSI(p), ['RSI' + str(p)])
+            self._add(ATR(p), ['ATR' + str(p)])
+            self._add(NATR(p), ['NATR' + str(p)])
+            self._add(DirectionalMovement(p),
+                      [None, 'MINUS_DM' + str(p), None, None, 'DX' + str(p),
+                       'ADX' + str(p), 'ADXR' + str(p)])
+        for p in periods:
+            self._add(BBANDS(p), ['BBANDS_' + str(p) + '_' + out for out in BBANDS.outputs])
+        self._add(AD(), ['AD'])
+        self._add(OBV(), ['OBV'])
+        self._add(SAR(), ['SAR'])
+        self._add(SAR(acceleration=0.01, maximum=0.01), ['SAR_1'])
+        self._add(SAR(acceleration=0.02, maximum=0.02), ['SAR_2'])
+        self._add(MACD(), ['MACD', 'MACDSIGNAL', 'MACDHIST'])
+        self._add(MACD(fastperiod=24, slowperiod=52, signalperiod=18),
+                  ['MACD_24', 'MACDSIGNAL_24', 'MACDHIST_24'])
+        self._add(MACD(fastperiod=48, slowperiod=104, signalperiod=36),
+                  ['MACD_48', 'MACDSIGNAL_48', 'MACDHIST_48'])
+        self._add(MACD(fastperiod=200, slowperiod=300, signalperiod=50),
+                  ['MACD_200', 'MACDSIGNAL_200', 'MACDHIST_200'])
+        self._add(STOCHF(), ['fastk', 'fastd'])
+        self._add(STOCHF(fastk_period=20, fastd_period=9), ['fastk_20', 'fastd_20'])
+        self._add(STOCHF(fastk_period=200, fastd_period=80), ['fastk_200', 'fastd_200'])
+        self._add(STOCHF(fastk_period=3600, fastd_period=400), ['fastk_3600', 'fastd_3600'])
+        self._add(STOCH(), ['slowk', 'slowd'])
+        self._add(STOCH(fastk_period=30, slowk_period=15, slowd_period=9), ['slowk_30', 'slowd_30'])
+
+    def _add(self, indicator, columns):
+        self.indicators.append((indicator, columns))
+
+    @property
+    def columns(self):
+        return [col for _, columns in self.indicators for col in columns if col is not None]
+
+    def update(self, bar):
+        """
+        Update all indicators with new bar.
+
+        :param bar: (dict or pd.Series) bar with open, high, low, close and volume
+        :return: (dict) indicator values by column name
+        """
+        values = {}
+        for indicator, columns in self.indicators:
+            output = indicator.update(*[bar[name] for name in indicator.inputs])
+            if len(columns) == 1:
+                output = (output,)
+            for col, value in zip(columns, output):
+                if col is not None:
+                    values[col] = value
+        return values
+
+    def get_state(self):
+        """
+        :return: (list) states of all indicators
+        """
+        return [indicator.get_state() for indicator, _ in self.indicators]
+
+    def set_state(self, state):
+        """
+        :param state: (list) states saved with get_state
+        :return: (StreamingIndicatorSet) self
+        """
+        for (indicator, _), indicator_state in zip(self.indicators, state):
+            indicator.set_state(indicator_state)
+        return self
@@ -48,39 +48,40 @@ epochs = 1000
 
 
 ### IMPORT PREPARED DATA
-X_train = np.load(os.path.join(Path(input_data_path), 'X_train_seq.npy'))
-X_test = np.load(os.path.join(Path(input_data_path), 'X_test_seq.npy'))
-X_val = np.load(os.path.join(Path(input_data_path), 'X_val_seq.npy'))
-y_train = np.load(os.path.join(Path(input_data_path), 'y_train_seq.npy'))
-y_test = np.load(os.path.join(Path(input_data_path), 'y_test_seq.npy'))
-y_val = np.load(os.path.join(Path(input_data_path), 'y_val_seq.npy'))
+# windows are read from memory mapped feature matrices batch by batch
+train = tml.modeling.datasets.WindowedDataset.load(
+    os.path.join(Path(input_data_path), 'train_seq'), batch_size=batch_size, shuffle=True)
+val = tml.modeling.datasets.WindowedDataset.load(
+    os.path.join(Path(input_data_path), 'val_seq'), batch_size=batch_size)
+test = tml.modeling.datasets.WindowedDataset.load(
+    os.path.join(Path(input_data_path), 'test_seq'), batch_size=batch_size)
+y_test = test.targets
 col_names = pd.read_csv(os.path.join(Path(input_data_path), 'col_names.csv'))
     
 
 ### TEST ###
 # CHOOSE COLUMNS
-# X_train = X_train[:, :, [0]]
-# X_test = X_test[:, :, [0]]
-# X_val = X_val[:, :, [0]]
+# train = tml.modeling.datasets.WindowedDataset(
+#     train.features[:, [0]], train.ends, train.targets, train.time_step_length, batch_size)
 
-# X_train = X_train[:1000]
-# y_train = y_train[:1000]
+# train = tml.modeling.datasets.WindowedDataset(
+#     train.features, train.ends[:1000], train.targets[:1000], train.time_step_length, batch_size)
 ### TEST ###
 
 ### MODEL
 model = keras.Sequential()
 if n_lstm_layers == 1:
     model.add(layers.LSTM(n_units,
-                            input_shape=[None, X_train.shape[2]]))
+                            input_shape=[None, train.n_features]))
 elif n_lstm_layers == 2:
     model.add(layers.LSTM(n_units // 2 if decrease_units else n_units,
                           return_sequences=True,
-                            input_shape=[None, X_train.shape[2]]))
+                            input_shape=[None, train.n_features]))
     model.add(layers.LSTM(n_units, dropout=dropout))
 elif n_lstm_layers == 3:
     model.add(layers.LSTM(n_units // 2 // 2 if decrease_units else n_units,
                             return_sequences=True,
-                            input_shape=[None, X_train.shape[2]]))
+                            input_shape=[None, train.n_features]))
     model.add(layers.LSTM(n_units, return_sequences=True, dropout=dropout))
     model.add(layers.LSTM(n_units, dropout=dropout))
 model.add(layers.Dense(1, activation='sigmoid'))
@@ -91,22 +92,20 @@ model.compile(loss='binary_crossentropy',
 callbacks = [
     tf.keras.callbacks.EarlyStopping('val_accuracy',  mode='max', patience=20, restore_best_weights=True)
     ]
-history = model.fit(X_train, y_train,
-                    batch_size=batch_size,
+history = model.fit(train.keras_sequence(),
                     epochs=epochs,
-                    validation_data=(X_val, y_val),
+                    validation_data=val.keras_sequence(),
                     callbacks=callbacks)
 
 # get accuracy and score
-score, acc = model.evaluate(
-    X_test, y_test, batch_size=batch_size)
+score, acc = model.evaluate(test.keras_sequence())
 print('score_validation:', score)
 print('accuracy_validation:', acc)
 writer.add_scalar(tag=f'score_validation', scalar_value=score)
 writer.add_scalar(tag=f'accuracy_validation', scalar_value=acc)
  
 # test metrics
-predictions = model.predict(X_test)
+predictions = model.predict(test.keras_sequence())
 predict_classes = (predictions > 0.5).astype("int32")
 # np.argmax(model.predict(x), axis=-1)  # For multiclass prediction
 # tml.modeling.metrics_summary.lstm_metrics(y_test, predict_classes)
@@ -48,18 +48,20 @@ executions_per_trial = 2  # parameter for random optimizer
 
 
 ### IMPORT PREPARED DATA
-X_train = np.load(os.path.join(Path(input_data_path), 'X_train_seq.npy'))
-X_test = np.load(os.path.join(Path(input_data_path), 'X_test_seq.npy'))
-X_val = np.load(os.path.join(Path(input_data_path), 'X_val_seq.npy'))
-y_train = np.load(os.path.join(Path(input_data_path), 'y_train_seq.npy'))
-y_test = np.load(os.path.join(Path(input_data_path), 'y_test_seq.npy'))
-y_val = np.load(os.path.join(Path(input_data_path), 'y_val_seq.npy'))
+# windows are read from memory mapped feature matrices batch by batch
+train = tml.modeling.datasets.WindowedDataset.load(
+    os.path.join(Path(input_data_path), 'train_seq'), batch_size=batch_size)
+val = tml.modeling.datasets.WindowedDataset.load(
+    os.path.join(Path(input_data_path), 'val_seq'), batch_size=batch_size)
+test = tml.modeling.datasets.WindowedDataset.load(
+    os.path.join(Path(input_data_path), 'test_seq'), batch_size=batch_size)
+y_test = test.targets
 col_names = pd.read_csv(os.path.join(Path(input_data_path), 'col_names.csv'))
 
 
 ### TEST ###
-# X_train = X_train[:1000]
-# y_train = y_train[:1000]
+# train = tml.modeling.datasets.WindowedDataset(
+#     train.features, train.ends[:1000], train.targets[:1000], train.time_step_length, batch_size)
 ### TEST ###
 
 
@@ -73,16 +75,16 @@ def lstm_model(hp):
     hp_num_layers = hp.Int('num_layers', 1, 3) 
     if hp_num_layers == 1:
         model.add(layers.LSTM(hp_units,
-                              input_shape=[None, X_train.shape[2]]))
+                              input_shape=[None, train.n_features]))
     elif hp_num_layers == 2:
         model.add(layers.LSTM(hp_units,
                               return_sequences=True,
-                              input_shape=[None, X_train.shape[2]]))
+                              input_shape=[None, train.n_features]))
         model.add(layers.LSTM(hp_units, dropout=hp_dropout))
     elif hp_num_layers == 3:
         model.add(layers.LSTM(hp_units,
                               return_sequences=True,
-                              input_shape=[None, X_train.shape[2]]))
+                              input_shape=[None, train.n_features]))
         model.add(layers.LSTM(hp_units, return_sequences=True, dropout=hp_dropout))
         model.add(layers.LSTM(hp_units, dropout=hp_dropout))
     model.add(layers.Dense(1, activation='sigmoid'))
@@ -112,12 +114,10 @@ if optimizer == 'random':
                                    executions_per_trial=executions_per_trial,
                                    directory='lstm_tuner',
                                    project_name='stock_prediction_lstm')
-    tuner.search(X_train,
-                 y_train,
+    tuner.search(train.keras_sequence(),
                  epochs=epochs,
-                 batch_size=batch_size,
                  shuffle=False,
-                 validation_data=(X_val, y_val),
+                 validation_data=val.keras_sequence(),
                  callbacks=[tf.keras.callbacks.EarlyStopping('val_accuracy', patience=5, restore_best_weights=True)]
     )
 elif optimizer == 'hyperband':
@@ -127,18 +127,16 @@ elif optimizer == 'hyperband':
                         factor = 4,
                         directory = 'my_dir',
                         project_name = 'intro_to_kt')
-    tuner.search(X_train,
-                 y_train,
-                 batch_size=batch_size,
+    tuner.search(train.keras_sequence(),
                  shuffle=False,
-                 validation_data=(X_val, y_val)
+                 validation_data=val.keras_sequence()
                  )
 
 # Build the model with the optimal hyperparameters and train it on the data
 best_hps = tuner.get_best_hyperparameters(num_trials = 1)[0]
 model = tuner.hypermodel.build(best_hps)
 history = model.fit(
-    X_train, y_train, epochs = epochs, validation_data = (X_val, y_val),
+    train.keras_sequence(), epochs = epochs, validation_data = val.keras_sequence(),
     callbacks=[tf.keras.callbacks.EarlyStopping('val_accuracy', patience=5, restore_best_weights=True)])
 
 # save best model params
@@ -148,8 +146,7 @@ print('num_layers: ', best_hps.get('num_layers'))
 print('learning_rate: ', best_hps.get('learning_rate'))
 
 # get accuracy and score
-score, acc, auc, precision, recall = model.evaluate(
-    X_test, y_test, batch_size=batch_size)
+score, acc, auc, precision, recall = model.evaluate(test.keras_sequence())
 print('score_validation:', score)
 print('accuracy_validation:', acc)
 print('auc_validation:', auc)
@@ -161,8 +158,8 @@ print('recall_validation:', recall)
 # historydf.head(50)
  
 # predictions
-predictions = model.predict(X_test)
-predict_classes = model.predict_classes(X_test)
+predictions = model.predict(test.keras_sequence())
+predict_classes = model.predict_classes(test.keras_sequence())
 
 # test metrics
 tml.modeling.metrics_summary.lstm_metrics(y_test, predict_classes)
@@ -10,6 +10,7 @@ import sys
 import os
 import sklearn
 from sklearn.ensemble import RandomForestClassifier
+from sklearn.tree import DecisionTreeClassifier
 from sklearn.base import clone
 import shap
 import mlfinlab as ml
@@ -40,16 +41,17 @@ max_features = 10
 n_estimators = 350
 min_weight_fraction_leaf = 0.1  
 class_weight = 'balanced_subsample'
+sequential_bootstrap = False  # bagged trees on sequentially bootstrapped events
 keep_important_features = 20  # for feature selection
 
 
 # Import data
-X_train = np.load('X_train.npy')
-X_test = np.load('X_test.npy')
-X_val = np.load('X_val.npy')
-y_train = np.load('y_train.npy')
-y_test = np.load('y_test.npy')
-y_val = np.load('y_val.npy')
+# windowed datasets saved by prepare_3d
+train_seq = tml.modeling.datasets.WindowedDataset.load('train_seq')
+val_seq = tml.modeling.datasets.WindowedDataset.load('val_seq')
+X_train, y_train = train_seq.to_arrays()
+X_test, y_test = tml.modeling.datasets.WindowedDataset.load('test_seq').to_arrays()
+X_val, y_val = val_seq.to_arrays()
 col_names = pd.read_csv('col_names.csv')
 col_names = col_names.iloc[:, 1]
 Y = pd.read_pickle('Y.pkl')
@@ -70,6 +72,13 @@ pd_names = [col + str(i-4) for col in col_names for i in range(5)]
 X_train = pd.DataFrame(X_train, columns=pd_names)
 X_test = pd.DataFrame(X_test, columns=pd_names)
 
+# index train rows by event time, bars are feature matrix rows
+if train_seq.index is not None:
+    X_train.index = pd.DatetimeIndex(np.concatenate((train_seq.event_index, val_seq.event_index)))
+    bars = pd.DataFrame(index=pd.DatetimeIndex(np.concatenate((train_seq.index, val_seq.index))))
+elif sequential_bootstrap:
+    raise ValueError('Sequential bootstrap needs event times, rerun prepare_3d.')
+
 
 # Sample weigths
 if not Y['ret'].isna().all():
@@ -77,15 +86,14 @@ if not Y['ret'].isna().all():
     if 't_value' in Y.columns:
         sample_weights = Y['t_value'].reindex(X_train.index).abs()
     elif sample_weights_type == 'returns':
-        sample_weights = ml.sample_weights.get_weights_by_return(
+        sample_weights = tml.modeling.sample_weights.get_weights_by_return(
             Y.reindex(X_train.index),
-            X_train.loc['close'],
-            num_threads=1)
+            X_train.loc['close'])
     elif sample_weights_type == 'time_decay':
-        sample_weights = ml.sample_weights.get_weights_by_time_decay(
+        sample_weights = tml.modeling.sample_weights.get_weights_by_time_decay(
             Y.reindex(X_train.index),
             X_train.loc['close'],
-            decay=0.5, num_threads=1)
+            decay=0.5)
     elif sample_weights_type == 'none':
         sample_weights = None
 
@@ -118,6 +126,16 @@ clf = RandomForestClassifier(criterion='entropy',
                              class_weight=class_weight,
                              # random_state=rand_state,
                              n_jobs=16)
+if sequential_bootstrap and not Y['ret'].isna().all():
+    clf = tml.modeling.sequential_bootstrap.SequentialBootstrapBaggingClassifier(
+        samples_info_sets=Y['t1'].reindex(X_train.index),
+        price_bars=bars,
+        base_estimator=DecisionTreeClassifier(criterion='entropy',
+                                              min_weight_fraction_leaf=min_weight_fraction_leaf,
+                                              max_depth=max_depth,
+                                              class_weight='balanced'),
+        n_estimators=n_estimators,
+        n_jobs=16)
 
 
 # Fit model
@@ -145,14 +163,7 @@ else:
     print('good_performance: True')
     
     # refit the model and get results
-    clf = RandomForestClassifier(criterion='entropy',
-                                # max_features=max_features,
-                                min_weight_fraction_leaf=min_weight_fraction_leaf,
-                                max_depth=max_depth,
-                                n_estimators=n_estimators,
-                                class_weight=class_weight,
-                                # random_state=rand_state,
-                                n_jobs=16)
+    clf = clone(clf)
     if not Y['ret'].isna().all():
         clf.fit(X_train, y_train, sample_weight=sample_weights)
     else:
@@ -5,6 +5,7 @@ import os
 import tslearn
 from tslearn.neighbors import KNeighborsTimeSeriesClassifier
 from sktime.classification.compose import TimeSeriesForestClassifier
+import trademl as tml
 
 
 
@@ -20,10 +21,10 @@ input_data_path = 'D:/algo_trading_files'
 
 
 ### IMPORT PREPARED DATA
-X_train = np.load(os.path.join(Path(input_data_path), 'X_train_seq.npy'))
-X_test = np.load(os.path.join(Path(input_data_path), 'X_test_seq.npy'))
-X_val = np.load(os.path.join(Path(input_data_path), 'X_val_seq.npy'))
-y_train = np.load(os.path.join(Path(input_data_path), 'y_train_seq.npy'))
-y_test = np.load(os.path.join(Path(input_data_path), 'y_test_seq.npy'))
-y_val = np.load(os.path.join(Path(input_data_path), 'y_val_seq.npy'))
+X_train, y_train = tml.modeling.datasets.WindowedDataset.load(
+    os.path.join(Path(input_data_path), 'train_seq')).to_arrays()
+X_test, y_test = tml.modeling.datasets.WindowedDataset.load(
+    os.path.join(Path(input_data_path), 'test_seq')).to_arrays()
+X_val, y_val = tml.modeling.datasets.WindowedDataset.load(
+    os.path.join(Path(input_data_path), 'val_seq')).to_arrays()
 col_names = pd.read_csv(os.path.join(Path(input_data_path), 'col_names.csv'))
\ No newline at end of file
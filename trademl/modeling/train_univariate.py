@@ -7,6 +7,7 @@ from tslearn.neighbors import KNeighborsTimeSeriesClassifier
 from sktime.classification.compose import TimeSeriesForestClassifier
 import sktime
 import joblib
+from trademl.modeling.datasets import WindowedDataset
 from sklearn.metrics import (accuracy_score, confusion_matrix, recall_score,
                              precision_score, f1_score, classification_report,accuracy_score,
                              roc_curve) ``
@@ -20,12 +21,10 @@ from sklearn.metrics import (accuracy_score, confusion_matrix, recall_score,
 
 
 # Import data
-X_train = np.load('X_train.npy')
-X_test = np.load('X_test.npy')
-X_val = np.load('X_val.npy')
-y_train = np.load('y_train.npy')
-y_test = np.load('y_test.npy')
-y_val = np.load('y_val.npy')
+# windowed datasets saved by prepare_3d
+X_train, y_train = WindowedDataset.load('train_seq').to_arrays()
+X_test, y_test = WindowedDataset.load('test_seq').to_arrays()
+X_val, y_val = WindowedDataset.load('val_seq').to_arrays()
 col_names = pd.read_csv('col_names.csv')
 col_names = col_names.iloc[:, 1]
 
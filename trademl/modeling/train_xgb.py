@@ -55,15 +55,14 @@ labeling_info.columns = labeling_info.columns.str.replace(r'day_\d+_', '', regex
 if 't_value' in labeling_info.columns:
     sample_weights = labeling_info['t_value'].reindex(X_train.index).abs()
 elif sample_weights_type == 'returns':
-    sample_weights = ml.sample_weights.get_weights_by_return(
+    sample_weights = tml.modeling.sample_weights.get_weights_by_return(
         labeling_info.reindex(X_train.index),
-        X_train.loc[X_train.index, 'close_orig' if 'close_orig' in X_train.columns else 'close'],
-        num_threads=1)
+        X_train.loc[X_train.index, 'close_orig' if 'close_orig' in X_train.columns else 'close'])
 elif sample_weights_type == 'time_decay':
-    sample_weights = ml.sample_weights.get_weights_by_time_decay(
+    sample_weights = tml.modeling.sample_weights.get_weights_by_time_decay(
         labeling_info.reindex(X_train.index),
         X_train.loc[X_train.index, 'close_orig' if 'close_orig' in X_train.columns else 'close'],
-        decay=0.5, num_threads=1)
+        decay=0.5)
 elif sample_weights_type == 'none':
     sample_weights = None
 
@@ -0,0 +1,124 @@
+'''
+UNIVERSE
+
+Run per ticker preprocessing of (ticker, time) MultiIndex frames in a
+process pool. Frames are passed to workers as Arrow IPC (feather) files
+that are memory mapped on read, instead of pickling them.
+'''
+
+import os
+import time
+import shutil
+import tempfile
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import pandas as pd
+import pyarrow.feather as feather
+from sklearn.base import clone
+
+
+def _write_frame(frame, path):
+    index_names = [name if name is not None else 'index' for name in frame.index.names]
+    frame = frame.copy(deep=False)
+    frame.index.names = index_names
+    feather.write_feather(frame.reset_index(), path)
+    return index_names
+
+
+def _read_frame(path, index_names):
+    frame = feather.read_table(path, memory_map=True).to_pandas()
+    frame = frame.set_index(index_names)
+    frame.index.names = [None if name == 'index' else name for name in frame.index.names]
+    return frame
+
+
+def _run_ticker(ticker, input_path, index_names, pipeline, store, output_path):
+    """
+    Process one ticker in worker process.
+
+    :return: (tuple) ticker, number of output rows, seconds, error traceback or None
+        and index names of output file
+    """
+    start = time.time()
+    try:
+        data = _read_frame(input_path, index_names)
+        output_index_names = None
+        if store is not None:
+            features = store.append(ticker, data)
+        else:
+            features = clone(pipeline).fit_transform(data)
+            output_index_names = _write_frame(features, output_path)
+        return ticker, features.shape[0], time.time() - start, None, output_index_names
+    except Exception:
+        return ticker, 0, time.time() - start, traceback.format_exc(), None
+
+
+class UniverseRunner:
+    """
+    Fan out per ticker sklearn pipeline to process pool.
+
+    :param pipeline: (sklearn transformer) pipeline applied to every ticker,
+        e.g. make_pipeline(RemoveOutlierDiffMedian(), AddFeatures(), Fracdiff())
+    :param store: (FeatureStore) if not None, every worker appends its ticker
+        to the store with store transform, otherwise results are returned
+    :param n_jobs: (int) number of processes, number of CPUs if None; capped at
+        number of CPUs and tickers
+    :param tmp_folder: (str) folder for Arrow files, temporary folder if None
+    """
+
+    def __init__(self, pipeline=None, store=None, n_jobs=None, tmp_folder=None):
+        self.pipeline = pipeline
+        self.store = store
+        self.n_jobs = n_jobs
+        self.tmp_folder = tmp_folder
+
+    def run(self, market_data, level=0):
+        """
+        Process all tickers. Failed tickers are reported and do not stop the batch.
+
+        :param market_data: (pd.DataFrame) data with (ticker, time) MultiIndex
+        :param level: (int or str) ticker level of index
+        :return: (dict, pd.DataFrame) results by ticker (empty if store is used)
+            and report with rows, seconds and error of every ticker
+        """
+        if self.pipeline is None and self.store is None:
+            raise ValueError('Pipeline or store has to be set.')
+        folder = tempfile.mkdtemp(prefix='universe_', dir=self.tmp_folder)
+        results = {}
+        report = []
+        try:
+            # write every ticker once, workers memory map their file
+            tasks = {}
+            for ticker, frame in market_data.groupby(level=level, sort=False):
+                input_path = os.path.join(folder, str(ticker) + '_input.feather')
+                index_names = _write_frame(frame.droplevel(level), input_path)
+                output_path = os.path.join(folder, str(ticker) + '_output.feather')
+                tasks[ticker] = (input_path, index_names, output_path)
+
+            # no more processes than CPUs and tickers
+            max_workers = min(self.n_jobs or os.cpu_count() or 1, os.cpu_count() or 1, max(len(tasks), 1))
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                futures = {
+                    executor.submit(_run_ticker, ticker, input_path, index_names,
+                                    self.pipeline, self.store, output_path): ticker
+                    for ticker, (input_path, index_names, output_path) in tasks.items()
+                }
+                for future in as_completed(futures):
+                    ticker = futures[future]
+                    try:
+                        ticker, rows, seconds, error, output_index_names = future.result()
+                    except Exception:
+                        rows, seconds, error = 0, float('nan'), traceback.format_exc()
+                    if error is None and self.store is None:
+                        results[ticker] = _read_frame(tasks[ticker][2], output_index_names).copy()
+                    status = 'ok' if error is None else 'failed'
+                    print('%s %s: %d rows, %.2f seconds' % (ticker, status, rows, seconds))
+                    if error is not None:
+                        print(error)
+                    report.append({'ticker': ticker, 'status': status, 'rows': rows,
+                                   'seconds': seconds, 'error': error})
+        finally:
+            shutil.rmtree(folder, ignore_errors=True)
+
+        report = pd.DataFrame(report, columns=['ticker', 'status', 'rows', 'seconds', 'error'])
+        return results, report.set_index('ticker')